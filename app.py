@@ -1,9 +1,10 @@
 # app.py
 print("DEBUG: app.py (Web Service) script started")
 
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash
+from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, make_response
 import os
 import datetime
+import functools
 from dotenv import load_dotenv
 
 # Load environment variables from .env file (especially for local development)
@@ -11,12 +12,28 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # --- Project specific imports ---
-from database import db, Product, PriceHistory, Alert
-from scraper import scrape_amazon_product_details, search_flipkart_and_get_top_product, search_meesho_and_get_top_product
+from database import db, Product, PriceHistory, Alert, ComparisonResult, SCRAPE_PENDING
+from sqlalchemy import true, select
+from sqlalchemy.exc import IntegrityError
+from migrations import prepare_database, compact_price_history
+from query_plans import check_query_plans
+from sqlite_tuning import install_sqlite_tuning, run_sqlite_maintenance
+from db_pool import configure_pool, pool_stats, log_pool_stats
+from listing import product_listing_page, product_listing_json, listing_version, PRODUCT_SORTS, DEFAULT_PRODUCT_SORT, LISTING_PAGE_SIZE
+from replicas import configure_replicas, normalize_database_url, replica_bind_keys, replica_read, mark_recent_write
+from downsample import downsample_series, DOWNSAMPLE_METHODS
+from price_series import new_series, series_length, encode_series, SERIES_FORMATS
+from http_cache import make_etag, not_modified, with_validators, flashes_pending
+from response_cache import response_cache
+from markupsafe import Markup
+from rollups import ROLLUP_RESOLUTIONS, rollup_series
+from retention import enforce_price_retention, retention_cutoff, PRICE_RAW_RETENTION_DAYS, PRICE_HOURLY_RETENTION_DAYS
 from apscheduler.schedulers.background import BackgroundScheduler # For defining jobs
+from apscheduler.executors.pool import ThreadPoolExecutor as SchedulerThreadPoolExecutor
 
-# For AI Bonus (ensure llm_helper.py exists and is correct)
-from llm_helper import extract_metadata_and_generate_queries
+# For AI Bonus: multi-platform comparisons run in the worker (uses llm_helper.py)
+from comparison import is_comparable, request_comparison, backfill_llm_metadata, COMPARISON_WORKERS
+from llm_providers import llm_stats
 
 print("DEBUG: Imports in app.py successful")
 
@@ -25,8 +42,7 @@ app = Flask(__name__)
 # --- Database Configuration ---
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL")
 if SQLALCHEMY_DATABASE_URL:
-    if SQLALCHEMY_DATABASE_URL.startswith("postgres://"): # Render provides postgres://
-        SQLALCHEMY_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace("postgres://", "postgresql://", 1)
+    SQLALCHEMY_DATABASE_URL = normalize_database_url(SQLALCHEMY_DATABASE_URL) # Render provides postgres://
     print(f"DEBUG: Using DATABASE_URL from environment: {SQLALCHEMY_DATABASE_URL[:30]}...") # Print only a part for security
 else:
     print("DEBUG: DATABASE_URL not found in environment, falling back to local SQLite.")
@@ -34,15 +50,19 @@ else:
 
 app.config['SQLALCHEMY_DATABASE_URI'] = SQLALCHEMY_DATABASE_URL
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+configure_pool(app) # Pool size/overflow/pre-ping/recycle for this process role (see db_pool.py)
 app.config['SECRET_KEY'] = os.getenv("SECRET_KEY", os.urandom(24)) # Use env var for SECRET_KEY
 
 print("DEBUG: Flask app configured")
 
+configure_replicas(app) # Optional read replicas for read-only routes (see replicas.py)
 db.init_app(app)
 print("DEBUG: Database initialized with app")
 with app.app_context():
-    db.create_all()
-    print("DEBUG (app.py - WEB): db.create_all() CALLED ON APP INITIALIZATION.")
+    for bind_key in [None] + replica_bind_keys():
+        install_sqlite_tuning(db.engines[bind_key]) # WAL + busy timeout for the SQLite fallback, if enabled (see sqlite_tuning.py)
+    prepare_database() # db.create_all() + pending migrations (see migrations.py)
+    print("DEBUG (app.py - WEB): prepare_database() CALLED ON APP INITIALIZATION.")
 
 # --- Global Scheduler Instance ---
 # This instance is used by the web app to ADD job definitions.
@@ -51,7 +71,22 @@ with app.app_context():
 # with a persistent job store (e.g., SQLAlchemyJobStore using the PostgreSQL DB).
 # For simplicity now, we assume the worker (run_scheduler.py) will also poll the DB
 # on its startup to ensure jobs for all existing products are scheduled in its own instance.
-scheduler = BackgroundScheduler(daemon=True, timezone="UTC")
+# SCHEDULER_MAX_WORKERS bounds how many scrapes (fetches) run concurrently in the worker.
+# Parsing can be moved to a separate process pool with SCRAPER_PARSE_PROCESSES (see scraper.py).
+# First scrapes of newly submitted products run on their own 'priority' executor
+# (INITIAL_SCRAPE_WORKERS threads), so they never wait behind the periodic refreshes;
+# multi-platform comparisons likewise on 'comparisons' (COMPARISON_WORKERS, see comparison.py).
+# The worker's short polling jobs get a thread of their own ('dispatch'), so slow scrapes can't delay them.
+SCHEDULER_MAX_WORKERS = int(os.getenv("SCHEDULER_MAX_WORKERS", "10"))
+INITIAL_SCRAPE_WORKERS = int(os.getenv("INITIAL_SCRAPE_WORKERS", "2"))
+scheduler = BackgroundScheduler(
+    daemon=True,
+    timezone="UTC",
+    executors={'default': SchedulerThreadPoolExecutor(SCHEDULER_MAX_WORKERS),
+               'priority': SchedulerThreadPoolExecutor(INITIAL_SCRAPE_WORKERS),
+               'comparisons': SchedulerThreadPoolExecutor(max(1, COMPARISON_WORKERS)),
+               'dispatch': SchedulerThreadPoolExecutor(1)}
+)
 # DO NOT START THE SCHEDULER HERE in the web service (app.py)
 # scheduler.start() # <-- This line should be in run_scheduler.py
 print("DEBUG: Scheduler instance defined in app.py (but not started by web service).")
@@ -72,93 +107,451 @@ def job_scrape_product_wrapper(product_id):
     print(f"DEBUG (app.py wrapper): job_scrape_product_wrapper finished for product_id: {product_id}")
 
 
+def job_initial_scrape_wrapper(product_id):
+    """
+    Wrapper for the first scrape of a newly submitted (pending) product (see scheduler.py).
+    """
+    from scheduler import job_initial_scrape
+    job_initial_scrape(app, product_id)
+
+
+def job_run_comparison_wrapper(product_id):
+    """
+    Wrapper for a background multi-platform comparison (see comparison.py).
+    """
+    from scheduler import job_run_comparison
+    job_run_comparison(app, product_id)
+
+
+def job_refresh_comparisons_wrapper():
+    """
+    Wrapper for the scheduler's periodic refresh of stale comparisons.
+    """
+    from scheduler import job_refresh_comparisons
+    job_refresh_comparisons(app)
+
+
+def job_flush_price_writes_wrapper():
+    """
+    Wrapper for the scheduler's periodic flush of batched price writes (see persist.py).
+    """
+    from scheduler import job_flush_price_writes
+    job_flush_price_writes(app)
+
+
+def job_enforce_price_retention_wrapper():
+    """
+    Wrapper for the scheduler's periodic retention/compaction job (see retention.py).
+    """
+    from scheduler import job_enforce_price_retention
+    job_enforce_price_retention(app)
+
+
+def job_maintain_price_partitions_wrapper():
+    """
+    Wrapper for the scheduler's job that creates upcoming price_history partitions (see partitions.py).
+    """
+    from scheduler import job_maintain_price_partitions
+    job_maintain_price_partitions(app)
+
+
+def job_sqlite_maintenance_wrapper():
+    """
+    Wrapper for the scheduler's SQLite WAL checkpoint / ANALYZE job (see sqlite_tuning.py).
+    """
+    from scheduler import job_sqlite_maintenance
+    job_sqlite_maintenance(app)
+
+
+def job_log_pool_stats_wrapper():
+    """
+    Wrapper for the scheduler's periodic pool statistics log line (see db_pool.py).
+    """
+    with app.app_context():
+        log_pool_stats()
+
+
 def initialize_web_application_startup(current_app):
     """
     Function to handle application startup tasks specifically for the WEB SERVICE:
-    - Create database tables if they don't exist.
+    - Create database tables if they don't exist and apply pending migrations.
     The scheduler itself and its jobs will be managed by the separate background worker process.
     """
     print("DEBUG (app.py - WEB): initialize_web_application_startup() called")
     with current_app.app_context():
-        db.create_all()
-        print("DEBUG (app.py - WEB): db.create_all() done in initialize_web_application_startup")
+        prepare_database()
+        print("DEBUG (app.py - WEB): prepare_database() done in initialize_web_application_startup")
         # No scheduler start or job loading here for the web service.
 
+@app.cli.command("db-upgrade")
+def db_upgrade_command():
+    """Create missing tables and apply pending schema migrations."""
+    prepare_database()
+
+
+@app.cli.command("check-query-plans")
+def check_query_plans_command():
+    """EXPLAIN the hot queries and fail if any of them can't use an index."""
+    if not check_query_plans():
+        raise SystemExit(1)
+
+
+@app.cli.command("sqlite-maintenance")
+def sqlite_maintenance_command():
+    """Checkpoints the SQLite WAL and runs ANALYZE (SQLITE_CONCURRENT_MODE only)."""
+    if run_sqlite_maintenance() is None:
+        print("SQLITE: Concurrent mode is off or the database isn't SQLite; nothing to do.")
+
+
+@app.cli.command("backfill-llm-metadata")
+def backfill_llm_metadata_command():
+    """Fetch LLM comparison metadata for all products that need it, in batched prompts."""
+    print(f"COMPARISON: Stored LLM metadata for {backfill_llm_metadata()} products.")
+    print(f"COMPARISON: LLM calls: {llm_stats()}")
+
+
+@app.cli.command("compact-price-history")
+def compact_price_history_command():
+    """Fold runs of unchanged prices into single history rows (irreversible: deletes the rows in between)."""
+    compact_price_history()
+
+
+def price_series_from_history(history_rows, range_start=None, range_end=None, after=None):
+    """
+    Expands history rows into a chart series (see price_series.py). With change-only storage a row
+    stands for a run of identical scrapes, so it yields a point at its first and at its last sighting,
+    which keeps the chart identical to the one drawn from every raw scrape. Runs are clipped to
+    [range_start, range_end]: one that crosses a bound yields the price in effect at that bound
+    instead. With 'after', only points later than that timestamp are returned (delta sync).
+    """
+    series = new_series()
+    timestamps, prices = series["t"], series["p"]
+    for timestamp, last_seen, price in history_rows:
+        first = timestamp if range_start is None else max(timestamp, range_start)
+        last = max(filter(None, (timestamp, last_seen)))
+        if range_end is not None:
+            last = min(last, range_end)
+        if last < first:
+            continue # Ends before or starts after the range
+        for point in ((first,) if last == first else (first, last)):
+            if after is None or point > after:
+                timestamps.append(point)
+                prices.append(price)
+    return series
+
+# Price API resolution: ranges up to PRICE_API_RAW_MAX_DAYS are served from raw history,
+# up to PRICE_API_HOURLY_MAX_DAYS from hourly rollups, anything longer from daily rollups.
+PRICE_API_RAW_MAX_DAYS = float(os.getenv("PRICE_API_RAW_MAX_DAYS", "3"))
+PRICE_API_HOURLY_MAX_DAYS = float(os.getenv("PRICE_API_HOURLY_MAX_DAYS", "31"))
+# Series of at least this many points (after downsampling) are streamed instead of built in memory.
+PRICE_API_STREAM_MIN_POINTS = int(os.getenv("PRICE_API_STREAM_MIN_POINTS", "20000"))
+# A click on "Compare" within this many minutes of the last comparison shows the stored results instead.
+COMPARISON_MIN_RERUN_MINUTES = int(os.getenv("COMPARISON_MIN_RERUN_MINUTES", "10"))
+
+
+def choose_price_resolution(range_start, range_end):
+    span_days = (range_end - range_start).total_seconds() / 86400
+    # Ranges reaching past a retention window must be served from a coarser table.
+    raw_cutoff = retention_cutoff(PRICE_RAW_RETENTION_DAYS)
+    hourly_cutoff = retention_cutoff(PRICE_HOURLY_RETENTION_DAYS)
+    if span_days <= PRICE_API_RAW_MAX_DAYS and (raw_cutoff is None or range_start >= raw_cutoff):
+        return 'raw'
+    if span_days <= PRICE_API_HOURLY_MAX_DAYS and (hourly_cutoff is None or range_start >= hourly_cutoff):
+        return 'hour'
+    return 'day'
+
+
+def raw_history_in_range(product_id, range_start=None, range_end=None):
+    """
+    (timestamp, last_seen, price) of the history rows overlapping [range_start, range_end], oldest
+    first. Both bounds filter on 'timestamp' so a partitioned price_history only scans the matching
+    partitions; the one change-only segment that started before range_start and is still in effect
+    is fetched separately.
+    """
+    columns = select(PriceHistory.timestamp, PriceHistory.last_seen, PriceHistory.price).where(
+        PriceHistory.product_id == product_id)
+    query = columns
+    if range_end:
+        query = query.where(PriceHistory.timestamp <= range_end)
+    if not range_start:
+        return db.session.execute(query.order_by(PriceHistory.timestamp.asc())).all()
+
+    rows = db.session.execute(query.where(PriceHistory.timestamp >= range_start)
+                              .order_by(PriceHistory.timestamp.asc())).all()
+    carried_in = db.session.execute(columns.where(PriceHistory.timestamp < range_start)
+                                    .order_by(PriceHistory.timestamp.desc()).limit(1)).first()
+    if carried_in and (carried_in.last_seen or carried_in.timestamp) >= range_start:
+        rows.insert(0, carried_in)
+    return rows
+
+
+def parse_api_timestamp(value):
+    """Parses an ISO 8601 query parameter into a naive UTC datetime (how timestamps are stored)."""
+    if not value:
+        return None
+    parsed = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return parsed
+
+@app.cli.command("enforce-retention")
+def enforce_retention_command():
+    """Apply the price data retention policy now."""
+    enforce_price_retention()
+
 # --- Flask Routes ---
 
 @app.route('/', methods=['GET'])
+@replica_read
 def home():
     print("DEBUG (app.py - WEB): Route '/' called")
-    products = Product.query.order_by(Product.created_at.desc()).all()
-    return render_template('index.html', products=products)
+    # One keyset-paginated query per page: the price shown comes from the summary columns on Product,
+    # and any attribute that would lazy-load per product raises instead of causing N+1 queries.
+    sort = request.args.get('sort', DEFAULT_PRODUCT_SORT)
+    if sort not in PRODUCT_SORTS:
+        sort = DEFAULT_PRODUCT_SORT
+    cursor = request.args.get('cursor')
+    name_contains = request.args.get('q', '').strip() or None
+    try:
+        products, next_cursor = product_listing_page(sort, cursor, name_contains=name_contains)
+    except ValueError: # Stale or hand-edited cursor: start over from the first page
+        cursor = None
+        products, next_cursor = product_listing_page(sort, name_contains=name_contains)
+    # Revalidation is answered from the page's rows alone, before the template is rendered.
+    etag = make_etag('home', sort, name_contains, cursor, next_cursor, listing_version(products))
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    render_page = functools.partial(render_template, 'index.html', products=products, next_cursor=next_cursor, sort=sort,
+                                    sort_options=PRODUCT_SORTS, q=name_contains or '', is_first_page=not cursor)
+    # A page showing flashed messages is rendered fresh (and not stored); its cards still come from the cache.
+    html = render_page() if flashes_pending() else response_cache.get_or_build('home', etag, render_page)
+    return with_validators(make_response(html), etag)
+
+@app.template_global()
+def product_card(product):
+    """Listing card of one product, cached by the listed values so it is reused across pages and sorts."""
+    return Markup(response_cache.get_or_build('card', listing_version([product])[0], functools.partial(
+        render_template, '_product_card.html', product=product)))
+
+@app.route('/api/products', methods=['GET'])
+@replica_read
+def api_products():
+    """
+    JSON product listing with keyset pagination. Query parameters:
+    - sort: newest (default), price_low, price_high, biggest_drop or name.
+    - cursor: 'next_cursor' from the previous page; omit for the first page.
+    - limit: page size (default LISTING_PAGE_SIZE, at most 200).
+    - q: name contains; min_price / max_price: current price range.
+    """
+    try:
+        limit = int(request.args.get('limit', LISTING_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"error": "limit must be a whole number"}), 400
+    try:
+        min_price = request.args.get('min_price', type=float)
+        max_price = request.args.get('max_price', type=float)
+        products, next_cursor = product_listing_page(
+            request.args.get('sort', DEFAULT_PRODUCT_SORT), request.args.get('cursor'), limit,
+            name_contains=request.args.get('q', '').strip() or None, min_price=min_price, max_price=max_price
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    etag = make_etag('api_products', sorted(request.args.items(multi=True)), next_cursor, listing_version(products))
+    cached = not_modified(etag, public=True)
+    if cached:
+        return cached
+    body = response_cache.get_or_build('api_products', etag, lambda: app.json.dumps(
+        {"products": [product_listing_json(p) for p in products], "next_cursor": next_cursor}))
+    return with_validators(app.response_class(body, mimetype=app.json.mimetype), etag, public=True)
 
 @app.route('/track_product', methods=['POST'])
 def track_product():
+    """
+    Starts tracking a product without scraping it in the request: the product is stored as pending and
+    the worker scrapes it within PENDING_SCRAPE_POLL_SECONDS (see run_scheduler.py). Browsers are
+    redirected to the product page, which waits for the first price; JSON clients get 202 Accepted
+    with the URL to poll.
+    """
     print("DEBUG (app.py - WEB): Route '/track_product' called")
-    url = request.form.get('product_url')
+    wants_json = request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json'
+    url = request.form.get('product_url') or (request.get_json(silent=True) or {}).get('product_url')
     if not url or "amazon" not in url.lower():
+        if wants_json:
+            return jsonify({"error": "Please enter a valid Amazon product URL."}), 400
         flash("Please enter a valid Amazon product URL.", "error")
         return redirect(url_for('home'))
 
     product = Product.query.filter_by(url=url).first()
-    if product:
-        flash(f"Product '{product.name or 'this URL'}' is already being tracked.", "info")
-        return redirect(url_for('product_detail', product_id=product.id))
-
-    print(f"DEBUG (app.py - WEB): Attempting initial scrape for new URL: {url}")
-    details = scrape_amazon_product_details(url)
-
-    if not details or details.get("price") is None:
-        flash(f"Could not retrieve initial product details from {url}. Check URL or try again later.", "error")
-        return redirect(url_for('home'))
-
-    new_product = Product(
-        url=url,
-        name=details.get('name', "N/A"),
-        image_url=details.get('image_url', "N/A")
-    )
-    db.session.add(new_product)
-    db.session.commit()
-
-    first_price = PriceHistory(product_id=new_product.id, price=details["price"], timestamp=datetime.datetime.utcnow())
-    db.session.add(first_price)
-    db.session.commit()
-    
-    flash(f"Started tracking: {new_product.name or 'New Product'}", "success")
-
-    # The web service can attempt to add the job definition.
-    # The background worker (run_scheduler.py) will be the one actually running the scheduler
-    # and should also have logic to pick up any products from the DB that don't have active jobs.
-    job_id = f'scrape_product_{new_product.id}'
-    # Note: Accessing scheduler.get_job() or scheduler.add_job() here might interact
-    # with a MemoryJobStore if a persistent one isn't configured for APScheduler.
-    # For a robust multi-process setup, a persistent job store (e.g., SQLAlchemyJobStore)
-    # for APScheduler is recommended.
-    # For now, we assume the worker (run_scheduler.py) will handle ensuring jobs are active.
-    print(f"DEBUG (app.py - WEB): Product {new_product.id} added. Worker process should schedule it.")
-
-    return redirect(url_for('product_detail', product_id=new_product.id))
+    if not product:
+        product = Product(url=url, scrape_status=SCRAPE_PENDING)
+        db.session.add(product)
+        try:
+            db.session.commit()
+        except IntegrityError: # Submitted concurrently by someone else
+            db.session.rollback()
+            product = Product.query.filter_by(url=url).first()
+        else:
+            mark_recent_write() # Read our own write from the primary even if the replica lags
+            print(f"DEBUG (app.py - WEB): Product {product.id} added as pending. Worker will run its first scrape.")
+            if wants_json:
+                response = jsonify(product_status_json(product))
+                response.headers['Location'] = url_for('api_product_status', product_id=product.id)
+                return response, 202
+            flash("Started tracking this product. Its details and first price will appear here in a moment.", "success")
+            return redirect(url_for('product_detail', product_id=product.id))
+
+    if wants_json:
+        return jsonify(product_status_json(product)), 200
+    flash(f"Product '{product.name or 'this URL'}' is already being tracked.", "info")
+    return redirect(url_for('product_detail', product_id=product.id))
+
+def product_status_json(product):
+    return {
+        "id": product.id,
+        "status": product.scrape_status or "active",
+        "name": product.name,
+        "current_price": product.current_price,
+        "last_scraped_at": product.last_scraped_at.isoformat() if product.last_scraped_at else None,
+        "comparison_status": product.comparison_status,
+        "compared_at": product.compared_at.isoformat() if product.compared_at else None,
+        "url": url_for('product_detail', product_id=product.id),
+    }
+
+@app.route('/api/product/<int:product_id>/status')
+def api_product_status(product_id):
+    """Scrape status of a product: 'pending' until the first scrape, then 'active' (or 'failed')."""
+    product = Product.query.get(product_id) # Primary, not a replica: the product may be seconds old
+    if not product:
+        return jsonify({"error": "Product not found"}), 404
+    response = jsonify(product_status_json(product))
+    response.cache_control.no_store = True
+    return response
 
 @app.route('/product/<int:product_id>')
+@replica_read
 def product_detail(product_id):
     print(f"DEBUG (app.py - WEB): Route '/product/{product_id}' called")
     product = Product.query.get_or_404(product_id)
-    prices = PriceHistory.query.filter_by(product_id=product.id).order_by(PriceHistory.timestamp.asc()).all()
-    return render_template('product_detail.html', product=product, prices=prices)
+    # The current price comes from the summary columns on Product; the chart loads history via the API.
+    # Every persisted scrape moves last_scraped_at, so it is also the page's Last-Modified.
+    etag = make_etag('product', product.id, product.url, product.name, product.image_url, product.current_price,
+                     product.min_price, product.max_price, product.price_change_24h, product.created_at,
+                     product.last_scraped_at, product.scrape_status, product.comparison_status, product.compared_at)
+    cached = not_modified(etag, max(filter(None, (product.last_scraped_at, product.compared_at)), default=None))
+    if cached:
+        return cached
+    comparisons = []
+    if product.compared_at: # Stored by the worker (see comparison.py); one small indexed read
+        comparisons = ComparisonResult.query.filter_by(product_id=product.id).order_by(ComparisonResult.platform).all()
+    render_page = functools.partial(render_template, 'product_detail.html', product=product, comparisons=comparisons)
+    html = render_page() if flashes_pending() else response_cache.get_or_build('product', etag, render_page)
+    return with_validators(make_response(html), etag, max(filter(None, (product.last_scraped_at, product.compared_at)), default=None))
 
 @app.route('/api/product/<int:product_id>/prices')
+@replica_read
 def api_product_prices(product_id):
+    """
+    Price series for the chart. Optional query parameters:
+    - from / to: ISO timestamps (UTC) limiting the range; default is the whole tracking period.
+    - resolution: 'raw', 'hour' or 'day'; by default it is picked from the length of the range,
+      so long ranges are served from the hourly/daily rollups instead of every scrape.
+    - limit: maximum number of points; longer series are downsampled on the server.
+    - downsample: 'lttb' (default, keeps the shape) or 'minmax' (keeps every bucket's low and high).
+    - since: delta sync; only raw points after this timestamp (the X-Price-Cursor of the previous
+      response). Answers 410 if raw history that old is no longer kept, so the client refetches.
+    - format: 'points' (default, [{"timestamp", "price"}, ...]), 'columns' ({"t": [epoch seconds],
+      "p": [...]}), 'binary' (packed float64 columns) or 'msgpack'; see price_series.py.
+    """
     print(f"DEBUG (app.py - WEB): Route '/api/product/{product_id}/prices' called")
     product = Product.query.get(product_id)
     if not product:
         return jsonify({"error": "Product not found"}), 404
-        
-    prices_query = PriceHistory.query.filter_by(product_id=product_id).order_by(PriceHistory.timestamp.asc()).all()
-    if not prices_query:
-        return jsonify([])
-        
-    price_data = [{"timestamp": p.timestamp.isoformat(), "price": p.price} for p in prices_query]
-    return jsonify(price_data)
+
+    try:
+        range_start = parse_api_timestamp(request.args.get('from'))
+        range_end = parse_api_timestamp(request.args.get('to'))
+        since = parse_api_timestamp(request.args.get('since'))
+    except ValueError:
+        return jsonify({"error": "'from', 'to' and 'since' must be ISO 8601 timestamps"}), 400
+    if range_start and range_end and range_start > range_end:
+        return jsonify({"error": "'from' must not be later than 'to'"}), 400
+    limit = request.args.get('limit', 0, type=int)
+    downsample_method = request.args.get('downsample', 'lttb')
+    if limit < 0 or downsample_method not in DOWNSAMPLE_METHODS:
+        return jsonify({"error": "limit must be a positive number and downsample one of: lttb, minmax"}), 400
+    series_format = request.args.get('format', 'points')
+    if series_format not in SERIES_FORMATS:
+        return jsonify({"error": f"format must be one of: {', '.join(SERIES_FORMATS)}"}), 400
+
+    if since is not None:
+        # Rollup buckets change in place, so deltas are always served from raw history.
+        raw_cutoff = retention_cutoff(PRICE_RAW_RETENTION_DAYS)
+        if raw_cutoff is not None and since < raw_cutoff:
+            return jsonify({"error": "'since' is older than the raw history retention; fetch the full series"}), 410
+        resolution = 'raw'
+    else:
+        resolution = request.args.get('resolution') or choose_price_resolution(
+            range_start or product.created_at or datetime.datetime.utcnow(),
+            range_end or product.last_scraped_at or datetime.datetime.utcnow()
+        )
+        if resolution != 'raw' and resolution not in ROLLUP_RESOLUTIONS:
+            return jsonify({"error": "resolution must be one of: raw, hour, day"}), 400
+
+    # New prices always move last_scraped_at. The retention cutoffs (by day) cover rows being pruned
+    # and the automatic resolution moving to a coarser table as the series ages.
+    retention_days = [cutoff.date() if cutoff else None
+                      for cutoff in (retention_cutoff(PRICE_RAW_RETENTION_DAYS), retention_cutoff(PRICE_HOURLY_RETENTION_DAYS))]
+    etag = make_etag('prices', product.id, product.created_at, product.last_scraped_at, retention_days,
+                     sorted(request.args.items(multi=True)))
+    cached = not_modified(etag, product.last_scraped_at, public=True)
+    if cached:
+        return cached
+    cached_body = response_cache.get('prices', etag)
+    if cached_body is None:
+        series, headers = load_price_series(product, resolution, range_start, range_end, since, limit, downsample_method)
+        chunks, mimetype, format_headers = encode_series(series, series_format)
+        headers.update(format_headers)
+        if series_length(series) >= PRICE_API_STREAM_MIN_POINTS:
+            # Sent chunk by chunk as it is encoded; too large to be worth keeping in the cache.
+            response = app.response_class(chunks, mimetype=mimetype, headers=headers)
+            return with_validators(response, etag, product.last_scraped_at, public=True)
+        cached_body = (b"".join(chunks), mimetype, headers)
+        response_cache.put('prices', etag, cached_body)
+    body, mimetype, headers = cached_body
+    response = app.response_class(body, mimetype=mimetype, headers=headers)
+    return with_validators(response, etag, product.last_scraped_at, public=True)
+
+
+def load_price_series(product, resolution, range_start, range_end, since, limit, downsample_method):
+    """Column series (see price_series.py) and X-Price-* headers of a price API response."""
+    if since is not None:
+        series = price_series_from_history(raw_history_in_range(product.id, since, range_end), since, range_end, after=since)
+        headers = {'X-Price-Resolution': 'raw',
+                   'X-Price-Cursor': series["t"][-1].isoformat() if series["t"] else since.isoformat()}
+        return downsample_series(series, limit, downsample_method), headers
+
+    if resolution == 'raw':
+        series = price_series_from_history(raw_history_in_range(product.id, range_start, range_end), range_start, range_end)
+    else:
+        series = rollup_series(product.id, resolution, range_start, range_end)
+    headers = {'X-Price-Resolution': resolution,
+               'X-Price-Points-Total': str(series_length(series))} # Before downsampling
+    # Cursor for the next delta request: the newest scrape covered by this series.
+    cursor = min(filter(None, (product.last_scraped_at, range_end)), default=None)
+    if cursor is not None:
+        headers['X-Price-Cursor'] = cursor.isoformat()
+    return downsample_series(series, limit, downsample_method), headers
+
+@app.route('/api/metrics/pool')
+def api_pool_metrics():
+    """Connection pool statistics of this web process (checked-out, overflow, wait times)."""
+    return jsonify(pool_stats())
+
+@app.route('/api/metrics/cache')
+def api_cache_metrics():
+    """Response cache statistics of this web process (entries, size, hits and misses per kind)."""
+    return jsonify(response_cache.stats())
 
 @app.route('/delete_product/<int:product_id>', methods=['POST'])
 def delete_product(product_id):
@@ -179,6 +572,7 @@ def delete_product(product_id):
 
     db.session.delete(product_to_delete)
     db.session.commit()
+    mark_recent_write()
     flash(f"Product '{product_to_delete.name}' and its tracking data have been deleted.", "success")
     return redirect(url_for('home'))
 
@@ -202,11 +596,11 @@ def add_alert(product_id):
         flash("Invalid target price format. Please enter a number.", "error")
         return redirect(url_for('product_detail', product_id=product_id))
 
-    existing_alert = Alert.query.filter_by(
-        product_id=product.id, 
-        email=email_address, 
-        target_price=target_price_float, 
-        is_active=True
+    existing_alert = Alert.query.filter(
+        Alert.product_id == product.id,
+        Alert.email == email_address,
+        Alert.target_price == target_price_float,
+        Alert.is_active == true()
     ).first()
 
     if existing_alert:
@@ -215,49 +609,31 @@ def add_alert(product_id):
         new_alert = Alert(product_id=product.id, email=email_address, target_price=target_price_float, is_active=True)
         db.session.add(new_alert)
         db.session.commit()
+        mark_recent_write()
         flash(f"Success! Alert set for {product.name}. You'll be notified at {email_address} if the price drops below ₹{target_price_float:.2f}.", "success")
     
     return redirect(url_for('product_detail', product_id=product_id))
 
 @app.route('/product/<int:product_id>/trigger_comparison', methods=['POST'])
 def trigger_product_comparison(product_id):
+    """Queues a background comparison (see comparison.py); the product page shows the stored results."""
     product = Product.query.get_or_404(product_id)
-    print(f"APP (WEB - Comparison): Triggering comparison for Product ID {product_id}: {product.name}")
+    print(f"APP (WEB - Comparison): Comparison requested for Product ID {product_id}: {product.name}")
 
-    if not product.name or product.name in ["N/A", "Name not found"]:
+    if not is_comparable(product.name):
         flash("Product name not available, cannot perform AI comparison.", "error")
         return redirect(url_for('product_detail', product_id=product_id))
 
-    llm_data = extract_metadata_and_generate_queries(product.name, product.url)
-    
-    if "Error" in llm_data.get("metadata", {}):
-        flash(f"LLM processing error: {llm_data['metadata']['Error']}", "warning")
-        search_queries = {"Flipkart": product.name, "Meesho": product.name}
+    recent = product.compared_at and datetime.datetime.utcnow() - product.compared_at < datetime.timedelta(minutes=COMPARISON_MIN_RERUN_MINUTES)
+    if product.comparison_status == 'pending':
+        flash("A comparison for this product is already running. Results will appear below shortly.", "info")
+    elif recent:
+        flash(f"The comparison below is less than {COMPARISON_MIN_RERUN_MINUTES} minutes old; it is also refreshed automatically.", "info")
     else:
-        search_queries = llm_data.get("search_queries", {"Flipkart": product.name, "Meesho": product.name})
-    
-    comparison_results_display = []
-
-    flipkart_query = search_queries.get("Flipkart", product.name) 
-    if flipkart_query:
-        print(f"APP (WEB - Comparison): Searching Flipkart with query: '{flipkart_query}'")
-        flipkart_data = search_flipkart_and_get_top_product(flipkart_query)
-        if flipkart_data:
-            comparison_results_display.append(f"Flipkart: {flipkart_data.get('name', 'N/A')} - Price: {flipkart_data.get('price', 'N/A')}")
-
-    meesho_query = search_queries.get("Meesho", product.name)
-    if meesho_query:
-        print(f"APP (WEB - Comparison): Searching Meesho with query: '{meesho_query}'")
-        meesho_data = search_meesho_and_get_top_product(meesho_query)
-        if meesho_data:
-            comparison_results_display.append(f"Meesho: {meesho_data.get('name', 'N/A')} - Price: {meesho_data.get('price', 'N/A')}")
-    
-    if comparison_results_display:
-        flash_message = "Comparison search results (logged to server): " + " | ".join(comparison_results_display)
-        flash(flash_message, "info")
-    else:
-        flash("Could not find comparison data from other platforms with current methods, or LLM/scrapers encountered issues.", "warning")
-
+        request_comparison(product)
+        db.session.commit()
+        mark_recent_write()
+        flash("Comparison started. Results from other platforms will appear below in a few seconds.", "info")
     return redirect(url_for('product_detail', product_id=product_id))
 
 # --- Main execution block (for local development or if run directly by WSGI server) ---
@@ -0,0 +1,184 @@
+# comparison.py
+# Multi-platform price comparison, run by the worker instead of inside a web request.
+# The web service only marks a product's comparison as pending; the worker picks it up
+# (run_scheduler.py), asks the LLM for per-platform search queries and then searches every
+# platform in parallel. The whole run shares one deadline (COMPARISON_DEADLINE_SECONDS): a platform
+# that hasn't answered by then is stored with a timeout error instead of holding up the others.
+# Results replace the product's ComparisonResult rows, which the product page renders directly.
+# Products that have been compared before are refreshed every COMPARISON_REFRESH_HOURS. The LLM step is
+# skipped when the local title parser (title_metadata.py) is confident enough, or when metadata_cache.py
+# has a valid entry for the product.
+import datetime
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from sqlalchemy import select, update, delete
+
+from database import db, Product, ComparisonResult, COMPARISON_PENDING
+from llm_helper import extract_metadata_and_generate_queries, extract_metadata_batch
+from metadata_cache import canonical_product_key, load_cached_metadata, store_metadata
+from title_metadata import extract_title_metadata
+from scraper import search_flipkart_and_get_top_product, search_meesho_and_get_top_product
+
+COMPARISON_WORKERS = int(os.getenv("COMPARISON_WORKERS", "2")) # Comparison runs at once in the worker
+COMPARISON_DEADLINE_SECONDS = float(os.getenv("COMPARISON_DEADLINE_SECONDS", "20"))
+COMPARISON_REFRESH_HOURS = float(os.getenv("COMPARISON_REFRESH_HOURS", "24")) # 0 disables the refresh
+COMPARISON_REFRESH_BATCH = 50 # Products queued per refresh run
+# Titles the local parser reads with at least this confidence skip the LLM (above 1 always asks the LLM).
+METADATA_HEURISTIC_MIN_CONFIDENCE = float(os.getenv("METADATA_HEURISTIC_MIN_CONFIDENCE", "0.7"))
+
+COMPARISON_PLATFORMS = {
+    "Flipkart": search_flipkart_and_get_top_product,
+    "Meesho": search_meesho_and_get_top_product,
+}
+
+# Shared by all comparison runs of this process: the LLM call plus one search per platform each.
+_comparison_pool = ThreadPoolExecutor(max_workers=max(1, COMPARISON_WORKERS) * (len(COMPARISON_PLATFORMS) + 1),
+                                      thread_name_prefix="comparison")
+
+
+def is_comparable(product_name):
+    return bool(product_name) and product_name not in ("N/A", "Name not found")
+
+
+def request_comparison(product):
+    """Queues a comparison run for the worker. The caller commits."""
+    product.comparison_status = 'pending'
+
+
+def pending_comparison_ids(limit=20):
+    return db.session.execute(
+        select(Product.id).where(COMPARISON_PENDING).order_by(Product.id.asc()).limit(limit)
+    ).scalars().all()
+
+
+def _remaining(deadline):
+    return max(0.0, deadline - time.monotonic())
+
+
+def _llm_data(name, url, deadline):
+    # The queries depend on the LLM answer, so it is the one step that runs before the fan-out.
+    budget = _remaining(deadline) / 2 # Leave half the budget for the searches
+    future = _comparison_pool.submit(extract_metadata_and_generate_queries, name, url, budget)
+    done, _ = wait([future], timeout=budget)
+    if not done:
+        print(f"COMPARISON: LLM didn't answer in time for '{name}'; searching with the product name.")
+        return {}
+    return future.result()
+
+
+def _search_queries(name, llm_data):
+    queries = llm_data.get("search_queries") or {}
+    return {platform: queries.get(platform) or name for platform in COMPARISON_PLATFORMS}
+
+
+def search_platforms(queries, deadline):
+    """Searches every platform in parallel; returns {platform: result dict}, with an error for timeouts."""
+    futures = {platform: _comparison_pool.submit(COMPARISON_PLATFORMS[platform], query)
+               for platform, query in queries.items()}
+    wait(futures.values(), timeout=_remaining(deadline))
+    results = {}
+    for platform, future in futures.items():
+        if not future.done():
+            future.cancel() # Still running ones finish in the background (requests has its own timeout)
+            results[platform] = {"error": f"No answer within {COMPARISON_DEADLINE_SECONDS:g} s"}
+        elif future.exception() is not None:
+            results[platform] = {"error": f"Search failed: {future.exception()}"}
+        else:
+            results[platform] = future.result() or {"error": "No result"}
+    return results
+
+
+def _stored_price(value):
+    # The scrapers return "N/A" when they find no price.
+    return value if isinstance(value, (int, float)) else None
+
+
+def run_comparison(product_id):
+    """Runs one comparison for the product and stores its results. Must be called inside an app context."""
+    product = db.session.get(Product, product_id)
+    if not product:
+        return
+    name, url = product.name, product.url
+    llm_data, confidence, cached = None, 0.0, False
+    if is_comparable(name):
+        llm_data, confidence = extract_title_metadata(name)
+        if confidence < METADATA_HEURISTIC_MIN_CONFIDENCE:
+            llm_data = load_cached_metadata(name, url)
+            cached = llm_data is not None
+    db.session.commit() # Don't hold a pooled connection during the LLM call and the searches
+
+    started = time.monotonic()
+    deadline = started + COMPARISON_DEADLINE_SECONDS
+    queries = {}
+    if is_comparable(name):
+        if confidence >= METADATA_HEURISTIC_MIN_CONFIDENCE:
+            print(f"COMPARISON: Title of product {product_id} parsed locally (confidence {confidence:.2f}); skipping the LLM.")
+        elif cached:
+            print(f"COMPARISON: Using cached LLM metadata for product {product_id}.")
+        else:
+            llm_data = _llm_data(name, url, deadline)
+            store_metadata(name, url, llm_data)
+        queries = _search_queries(name, llm_data)
+    results = search_platforms(queries, deadline) if queries else {}
+
+    fetched_at = datetime.datetime.utcnow()
+    db.session.execute(delete(ComparisonResult).where(ComparisonResult.product_id == product_id))
+    db.session.add_all([
+        ComparisonResult(product_id=product_id, platform=platform, search_query=queries[platform],
+                         name=result.get("name"), price=_stored_price(result.get("price")),
+                         url=result.get("url"), error=result.get("error"), fetched_at=fetched_at)
+        for platform, result in results.items()
+    ])
+    db.session.execute(
+        update(Product).where(Product.id == product_id).values(comparison_status=None, compared_at=fetched_at)
+    )
+    db.session.commit()
+    print(f"COMPARISON: Product {product_id}: {len(results)} platform(s) compared in {time.monotonic() - started:.1f} s.")
+
+
+def backfill_llm_metadata(chunk_size=500):
+    """
+    Fills the metadata cache ahead of time for products whose title the local parser can't read confidently
+    and that have no valid entry yet, with batched LLM prompts (llm_helper.extract_metadata_batch).
+    Products sharing a canonical key are asked for once. Returns the number of entries stored.
+    """
+    stored, last_id = 0, 0
+    while True:
+        rows = db.session.execute(
+            select(Product.id, Product.name, Product.url).where(Product.id > last_id)
+            .order_by(Product.id.asc()).limit(chunk_size)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        todo = {}
+        for row in rows:
+            if not is_comparable(row.name) or extract_title_metadata(row.name)[1] >= METADATA_HEURISTIC_MIN_CONFIDENCE:
+                continue
+            if load_cached_metadata(row.name, row.url) is None:
+                todo.setdefault(canonical_product_key(row.url), row)
+        db.session.commit() # Don't hold a pooled connection during the LLM calls
+        results = extract_metadata_batch([{"id": key, "name": row.name, "url": row.url} for key, row in todo.items()])
+        for key, llm_data in results.items():
+            stored += store_metadata(todo[key].name, todo[key].url, llm_data)
+        print(f"COMPARISON: Metadata backfill up to product {last_id}: {len(results)}/{len(todo)} products enriched.")
+    return stored
+
+
+def queue_stale_comparisons():
+    """Marks products whose comparison is older than COMPARISON_REFRESH_HOURS as pending again."""
+    if COMPARISON_REFRESH_HOURS <= 0:
+        return 0
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(hours=COMPARISON_REFRESH_HOURS)
+    stale_ids = db.session.execute(
+        select(Product.id).where(Product.compared_at < cutoff, Product.comparison_status.is_(None))
+        .order_by(Product.compared_at.asc()).limit(COMPARISON_REFRESH_BATCH)
+    ).scalars().all()
+    if stale_ids:
+        db.session.execute(update(Product).where(Product.id.in_(stale_ids)).values(comparison_status='pending'))
+    db.session.commit()
+    if stale_ids:
+        print(f"COMPARISON: Queued {len(stale_ids)} stale comparison(s) for refresh.")
+    return len(stale_ids)
@@ -1,32 +1,195 @@
 
+from flask import g, has_app_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy.orm import declared_attr
+import calendar
 import datetime
+import os
 
-db = SQLAlchemy()
+class RoutingSession(Session):
+    """
+    Session that sends queries to a read replica while replica reads are switched on for the
+    current request (g.db_replica_bind, set by replicas.py). Flushes always go to the primary.
+    """
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_app_context():
+            replica_bind = g.get("db_replica_bind")
+            if replica_bind is not None:
+                return self._db.engines[replica_bind]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+
+# Compact price history encoding: prices as integer paise and timestamps as integer epoch seconds
+# (UTC) instead of floats and DateTime values. Smaller rows and denser indexes, exact equality and
+# aggregation. Python code keeps seeing floats and naive UTC datetimes either way.
+PRICE_STORAGE_COMPACT = os.getenv("PRICE_STORAGE_COMPACT", "false").lower() in ("true", "1", "t")
+
+class Paise(db.TypeDecorator):
+    """Rupee amount stored as an integer number of paise."""
+    impl = db.Integer
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else int(round(value * 100))
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else value / 100
+
+class EpochSeconds(db.TypeDecorator):
+    """Naive UTC datetime stored as integer seconds since the Unix epoch (sub-second part is dropped)."""
+    impl = db.BigInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, int):
+            return value
+        return calendar.timegm(value.utctimetuple())
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else datetime.datetime.utcfromtimestamp(value)
+
+PriceType = Paise if PRICE_STORAGE_COMPACT else db.Float
+TimestampType = EpochSeconds if PRICE_STORAGE_COMPACT else db.DateTime
 
 class Product(db.Model):
+    # (sort column, id) indexes back the keyset-paginated listing orders (see listing.py).
+    __table_args__ = (
+        db.Index('ix_product_created_at_id', 'created_at', 'id'),
+        db.Index('ix_product_current_price_id', 'current_price', 'id'),
+        db.Index('ix_product_price_change_24h_id', 'price_change_24h', 'id'),
+        db.Index('ix_product_name_id', 'name', 'id'),
+        # The worker polls for newly submitted products; only those few rows are in this index.
+        # Queries must compare with the literal (PRODUCT_PENDING) for SQLite to use it.
+        db.Index('ix_product_scrape_pending', 'id', sqlite_where=db.text("scrape_status = 'pending'"),
+                 postgresql_where=db.text("scrape_status = 'pending'")),
+        # Same for products with a multi-platform comparison waiting to run (COMPARISON_PENDING).
+        db.Index('ix_product_comparison_pending', 'id', sqlite_where=db.text("comparison_status = 'pending'"),
+                 postgresql_where=db.text("comparison_status = 'pending'")),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     url = db.Column(db.String, unique=True, nullable=False)
     name = db.Column(db.String, nullable=True)
     image_url = db.Column(db.String, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    # Latest-price summary, maintained in the same transaction as each price write
+    # so listing pages and alert checks never need to read PriceHistory.
+    current_price = db.Column(db.Float, nullable=True)
+    last_scraped_at = db.Column(db.DateTime, nullable=True)
+    min_price = db.Column(db.Float, nullable=True)
+    max_price = db.Column(db.Float, nullable=True)
+    price_change_24h = db.Column(db.Float, nullable=True)
+    # 'pending' from submission until the worker's first scrape, 'failed' if that scrape found no
+    # price (the regular scrapes keep retrying); NULL once a price has been recorded.
+    scrape_status = db.Column(db.String(16), nullable=True)
+    # Multi-platform comparison (see comparison.py): 'pending' while a run is queued for the worker;
+    # compared_at is when the stored ComparisonResult rows were last refreshed.
+    comparison_status = db.Column(db.String(16), nullable=True)
+    compared_at = db.Column(db.DateTime, nullable=True)
     prices = db.relationship('PriceHistory', backref='product', lazy=True, cascade="all, delete-orphan")
     alerts = db.relationship('Alert', backref='product', lazy=True, cascade="all, delete-orphan") # For bonus
+    hourly_rollups = db.relationship('PriceRollupHourly', lazy=True, cascade="all, delete-orphan")
+    daily_rollups = db.relationship('PriceRollupDaily', lazy=True, cascade="all, delete-orphan")
+    comparison_results = db.relationship('ComparisonResult', lazy=True, cascade="all, delete-orphan")
 
     def __repr__(self):
         return f'<Product {self.name or self.url}>'
 
 class PriceHistory(db.Model):
+    # Every history read is "one product, ordered/filtered by time".
+    __table_args__ = (db.Index('ix_price_history_product_id_timestamp', 'product_id', 'timestamp'),)
+
     id = db.Column(db.Integer, primary_key=True)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
-    price = db.Column(db.Float, nullable=False)
-    timestamp = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    price = db.Column(PriceType, nullable=False)
+    timestamp = db.Column(TimestampType, default=datetime.datetime.utcnow)
+    # With change-only storage one row covers a run of identical scrapes:
+    # 'timestamp' is when the price was first seen, 'last_seen' the latest scrape that confirmed it.
+    last_seen = db.Column(TimestampType, nullable=True)
 
     def __repr__(self):
         return f'<Price {self.price} at {self.timestamp}>'
 
+class PriceRollupMixin:
+    """
+    Open/high/low/close of all scrapes for one product within one time bucket.
+    Maintained incrementally as prices arrive (see rollups.py); used for long-range charts.
+    """
+    # Key order (product_id, bucket_start) makes the primary key index serve per-product range reads.
+    __table_args__ = (db.PrimaryKeyConstraint('product_id', 'bucket_start'),)
+
+    @declared_attr
+    def product_id(cls):
+        return db.Column(db.Integer, db.ForeignKey('product.id', ondelete='CASCADE'), nullable=False)
+
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    open = db.Column(db.Float, nullable=False)
+    high = db.Column(db.Float, nullable=False)
+    low = db.Column(db.Float, nullable=False)
+    close = db.Column(db.Float, nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    first_at = db.Column(db.DateTime, nullable=False) # Timestamps of the scrapes behind open/close
+    last_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<{type(self).__name__} product {self.product_id} {self.bucket_start} close {self.close}>'
+
+class PriceRollupHourly(PriceRollupMixin, db.Model):
+    __tablename__ = 'price_rollup_hourly'
+
+class PriceRollupDaily(PriceRollupMixin, db.Model):
+    __tablename__ = 'price_rollup_daily'
+
+SCRAPE_PENDING = 'pending'
+SCRAPE_FAILED = 'failed'
+PRODUCT_PENDING = Product.scrape_status == db.literal_column("'pending'")
+COMPARISON_PENDING = Product.comparison_status == db.literal_column("'pending'")
+
+class ComparisonResult(db.Model):
+    """Latest search result for one product on one other platform, replaced on every comparison run."""
+    __tablename__ = 'comparison_result'
+    __table_args__ = (db.UniqueConstraint('product_id', 'platform', name='uq_comparison_result_product_platform'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    platform = db.Column(db.String(32), nullable=False)
+    search_query = db.Column(db.String, nullable=True)
+    name = db.Column(db.String, nullable=True)
+    price = db.Column(db.Float, nullable=True)
+    url = db.Column(db.String, nullable=True)
+    error = db.Column(db.String, nullable=True)
+    fetched_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ComparisonResult {self.platform} for product {self.product_id}>'
+
+class ProductMetadata(db.Model):
+    """
+    LLM-extracted metadata and per-platform search queries of one canonical product (see metadata_cache.py).
+    Keyed by the product's identity (the Amazon ASIN when the URL has one), not by product row.
+    """
+    __tablename__ = 'product_metadata'
+
+    key = db.Column(db.String(255), primary_key=True)
+    product_name = db.Column(db.String, nullable=False) # Name the data was extracted from
+    version = db.Column(db.Integer, nullable=False) # llm_helper.LLM_METADATA_VERSION at extraction time
+    data = db.Column(db.Text, nullable=False) # JSON: {"metadata": {...}, "search_queries": {...}}
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ProductMetadata {self.key} v{self.version}>'
+
 # For Bonus Email Alert
 class Alert(db.Model):
+    # Alert checks only ever look at active alerts of one product; fired alerts stay out of the index.
+    # Queries must compare with a literal (Alert.is_active == true()) for SQLite to use this partial index.
+    __table_args__ = (
+        db.Index('ix_alert_product_id_active', 'product_id',
+                 sqlite_where=db.text('is_active = 1'), postgresql_where=db.text('is_active')),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
     email = db.Column(db.String, nullable=False)
@@ -0,0 +1,120 @@
+# db_pool.py
+# Connection pool settings and pool statistics for the SQLAlchemy engine(s).
+# The web service (gunicorn) and the scheduler worker have different connection needs, so every
+# setting can be given per process role: DB_POOL_SIZE_WEB / DB_POOL_SIZE_WORKER override DB_POOL_SIZE,
+# and so on. The role is PRICEPULSE_PROCESS_ROLE ('web' by default; run_scheduler.py sets 'worker').
+# pre_ping + recycle replace connections the (free-tier) database closed while the pool sat idle,
+# instead of failing the first request after a quiet period.
+import os
+import threading
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+from database import db
+
+PRICEPULSE_PROCESS_ROLE = os.getenv("PRICEPULSE_PROCESS_ROLE", "web").lower()
+
+# The worker runs up to SCHEDULER_MAX_WORKERS scrape jobs, INITIAL_SCRAPE_WORKERS first scrapes and
+# COMPARISON_WORKERS comparisons at once, plus the flush/maintenance jobs.
+_DEFAULT_POOL_SIZE = {
+    "web": 5,
+    "worker": int(os.getenv("SCHEDULER_MAX_WORKERS", "10")) + int(os.getenv("INITIAL_SCRAPE_WORKERS", "2"))
+              + int(os.getenv("COMPARISON_WORKERS", "2")) + 2,
+}
+
+
+def _pool_setting(name, default):
+    """Role-specific value (e.g. DB_POOL_SIZE_WORKER) if set, else the shared one (DB_POOL_SIZE), else default."""
+    return os.getenv(f"{name}_{PRICEPULSE_PROCESS_ROLE.upper()}", os.getenv(name, default))
+
+
+DB_POOL_SIZE = int(_pool_setting("DB_POOL_SIZE", str(_DEFAULT_POOL_SIZE.get(PRICEPULSE_PROCESS_ROLE, 5))))
+DB_MAX_OVERFLOW = int(_pool_setting("DB_MAX_OVERFLOW", "5"))
+DB_POOL_TIMEOUT = int(_pool_setting("DB_POOL_TIMEOUT", "30"))
+# Below the ~5 minute idle timeout of typical managed/free-tier Postgres and proxies.
+DB_POOL_RECYCLE = int(_pool_setting("DB_POOL_RECYCLE", "280"))
+DB_POOL_PRE_PING = _pool_setting("DB_POOL_PRE_PING", "true").lower() in ("true", "1", "t")
+# How often the worker prints pool statistics (0 = never).
+DB_POOL_STATS_LOG_SECONDS = int(os.getenv("DB_POOL_STATS_LOG_SECONDS", "300"))
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that counts checkouts and measures how long callers waited for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            with self._stats_lock:
+                self.checkouts += 1
+                self.wait_seconds_total += waited
+                self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+
+def engine_options(database_url):
+    """SQLALCHEMY_ENGINE_OPTIONS for this process role. In-memory SQLite keeps SQLAlchemy's own pool."""
+    options = {"pool_pre_ping": DB_POOL_PRE_PING, "pool_recycle": DB_POOL_RECYCLE}
+    if database_url.startswith("sqlite") and (":memory:" in database_url or database_url.rstrip("/") == "sqlite:"):
+        return options
+    options.update({
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+    })
+    return options
+
+
+def configure_pool(app):
+    """Applies the pool settings for this process role. Call before db.init_app(app)."""
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config["SQLALCHEMY_DATABASE_URI"])
+    print(f"POOL: role={PRICEPULSE_PROCESS_ROLE} pool_size={DB_POOL_SIZE} max_overflow={DB_MAX_OVERFLOW} "
+          f"timeout={DB_POOL_TIMEOUT}s recycle={DB_POOL_RECYCLE}s pre_ping={DB_POOL_PRE_PING}")
+
+
+def pool_stats():
+    """Current statistics of every engine's pool, keyed by bind ('primary' for the default one)."""
+    stats = {}
+    for bind_key, engine in db.engines.items():
+        pool = engine.pool
+        entry = {"role": PRICEPULSE_PROCESS_ROLE, "pool_class": type(pool).__name__}
+        if isinstance(pool, QueuePool):
+            entry.update({
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": max(pool.overflow(), 0),
+                "max_overflow": pool._max_overflow,
+            })
+        if isinstance(pool, InstrumentedQueuePool):
+            with pool._stats_lock:
+                entry.update({
+                    "checkouts": pool.checkouts,
+                    "timeouts": pool.timeouts,
+                    "wait_ms_total": round(pool.wait_seconds_total * 1000, 1),
+                    "wait_ms_avg": round(pool.wait_seconds_total * 1000 / pool.checkouts, 3) if pool.checkouts else 0.0,
+                    "wait_ms_max": round(pool.wait_seconds_max * 1000, 1),
+                })
+        stats[bind_key or "primary"] = entry
+    return stats
+
+
+def log_pool_stats():
+    for bind, entry in pool_stats().items():
+        print(f"POOL: {bind} {entry}")
@@ -0,0 +1,122 @@
+# downsample.py
+# Server-side downsampling of chart series to a requested number of points.
+#   - 'lttb': Largest-Triangle-Three-Buckets, keeps the points that preserve the visual shape.
+#   - 'minmax': per bucket keeps the lowest and highest price, so no price spike is ever dropped.
+# Both always keep the first and last point (only the last one for a limit of 1). NumPy is used when installed (vectorized per bucket /
+# over the whole series); otherwise an equivalent pure-Python implementation runs.
+import datetime
+
+try:
+    import numpy as np
+except ImportError: # Optional dependency
+    np = None
+
+DOWNSAMPLE_METHODS = ("lttb", "minmax")
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def _lttb_bucket_bounds(n, threshold):
+    # Bucket i (1..threshold-2) covers points [start, end); the first and last point are buckets of their own.
+    # Integer arithmetic, so consecutive buckets meet exactly and every middle point is in one of them.
+    return [(i * (n - 2) // (threshold - 2) + 1, (i + 1) * (n - 2) // (threshold - 2) + 1)
+            for i in range(threshold - 2)]
+
+
+def _lttb_indices_numpy(xs, ys, threshold):
+    xs, ys = np.asarray(xs, dtype=float), np.asarray(ys, dtype=float)
+    n = len(xs)
+    bounds = _lttb_bucket_bounds(n, threshold) + [(n - 1, n)]
+    # Averages of every bucket in one pass (sums over [start, end) from cumulative sums); only the
+    # choice of each bucket's point (which depends on the point chosen in the previous bucket) remains a loop.
+    starts = np.array([start for start, _ in bounds])
+    ends = np.array([end for _, end in bounds])
+    counts = (ends - starts).astype(float)
+    cum_xs = np.concatenate(([0.0], np.cumsum(xs)))
+    cum_ys = np.concatenate(([0.0], np.cumsum(ys)))
+    avg_xs = (cum_xs[ends] - cum_xs[starts]) / counts
+    avg_ys = (cum_ys[ends] - cum_ys[starts]) / counts
+    selected = [0]
+    a = 0
+    for i, (start, end) in enumerate(bounds[:-1]):
+        areas = np.abs((xs[a] - avg_xs[i + 1]) * (ys[start:end] - ys[a])
+                       - (xs[a] - xs[start:end]) * (avg_ys[i + 1] - ys[a]))
+        a = start + int(areas.argmax())
+        selected.append(a)
+    selected.append(n - 1)
+    return selected
+
+
+def _lttb_indices_python(xs, ys, threshold):
+    n = len(xs)
+    bounds = _lttb_bucket_bounds(n, threshold)
+    selected = [0]
+    a = 0
+    for i, (start, end) in enumerate(bounds):
+        next_start, next_end = bounds[i + 1] if i + 1 < len(bounds) else (n - 1, n)
+        count = next_end - next_start
+        avg_x = sum(xs[next_start:next_end]) / count
+        avg_y = sum(ys[next_start:next_end]) / count
+        best_area, best = -1.0, start
+        for j in range(start, end):
+            area = abs((xs[a] - avg_x) * (ys[j] - ys[a]) - (xs[a] - xs[j]) * (avg_y - ys[a]))
+            if area > best_area:
+                best_area, best = area, j
+        a = best
+        selected.append(a)
+    selected.append(n - 1)
+    return selected
+
+
+def _minmax_indices_numpy(ys, bucket_count):
+    ys = np.asarray(ys, dtype=float)
+    n = len(ys)
+    bucket_ids = (np.arange(n) * bucket_count) // n # Equal-sized, contiguous buckets
+    order = np.lexsort((ys, bucket_ids)) # By bucket, then by price
+    ends = np.cumsum(np.bincount(bucket_ids, minlength=bucket_count))
+    starts = ends - np.bincount(bucket_ids, minlength=bucket_count)
+    picked = np.concatenate((order[starts], order[ends - 1], [0, n - 1]))
+    return np.unique(picked).tolist()
+
+
+def _minmax_indices_python(ys, bucket_count):
+    n = len(ys)
+    picked = {0, n - 1}
+    for bucket in range(bucket_count):
+        start, end = (bucket * n + bucket_count - 1) // bucket_count, ((bucket + 1) * n + bucket_count - 1) // bucket_count
+        if start >= end:
+            continue
+        window = range(start, end)
+        picked.add(min(window, key=ys.__getitem__))
+        picked.add(max(window, key=ys.__getitem__))
+    return sorted(picked)
+
+
+def downsample_indices(xs, ys, limit, method="lttb"):
+    """
+    Indices (ascending) of at most 'limit' points of the series (xs ascending) to keep.
+    A limit of 1 or 2 leaves only the endpoints: the last point, or the first and the last.
+    """
+    n = len(xs)
+    if limit <= 0 or n <= limit:
+        return list(range(n))
+    if limit <= 2:
+        return [0, n - 1][-limit:]
+    if method == "minmax":
+        buckets = (limit - 2) // 2 # Two points per bucket, plus the endpoints
+        if buckets == 0:
+            return [0, n - 1]
+        return _minmax_indices_numpy(ys, buckets) if np is not None else _minmax_indices_python(ys, buckets)
+    if method != "lttb":
+        raise ValueError(f"downsample must be one of: {', '.join(DOWNSAMPLE_METHODS)}")
+    return _lttb_indices_numpy(xs, ys, limit) if np is not None else _lttb_indices_python(xs, ys, limit)
+
+
+def downsample_series(series, limit, method="lttb"):
+    """Downsamples a column series (see price_series.py) to at most 'limit' points, on its 't' and 'p' columns."""
+    timestamps = series["t"]
+    if limit <= 0 or len(timestamps) <= limit:
+        return series
+    xs = [(t - _EPOCH).total_seconds() for t in timestamps]
+    indices = downsample_indices(xs, series["p"], limit, method)
+    return {column: [values[i] for i in indices] for column, values in series.items()}
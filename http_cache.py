@@ -0,0 +1,87 @@
+# http_cache.py
+# Conditional GET (ETag / Last-Modified) for the home page, product pages and the JSON APIs.
+# Validators are computed from the summary columns on Product, which every persisted scrape updates
+# (last_scraped_at moves forward), so a revalidation costs the one cheap query the route runs anyway
+# and is answered with 304 before any history is loaded or any template is rendered.
+#   - JSON APIs: 'public, max-age=HTTP_CACHE_MAX_AGE_SECONDS', so browsers and a CDN reuse responses
+#     between scrape cycles and revalidate afterwards.
+#   - HTML pages: 'no-cache' (stored, but revalidated on every view) because they show flashed
+#     messages; a page with a pending flash message gets neither validators nor a cacheable header.
+import datetime
+import hashlib
+import os
+
+from flask import g, request, session, current_app
+
+HTTP_CACHE_ENABLED = os.getenv("HTTP_CACHE_ENABLED", "true").lower() in ("true", "1", "t")
+HTTP_CACHE_MAX_AGE_SECONDS = int(os.getenv("HTTP_CACHE_MAX_AGE_SECONDS", "60"))
+HTTP_CACHE_STALE_SECONDS = int(os.getenv("HTTP_CACHE_STALE_SECONDS", "300"))
+
+# Render sets this per deploy, so changed templates/serializers never match an ETag from the old release.
+_ETAG_SALT = os.getenv("RENDER_GIT_COMMIT", "")
+
+
+def make_etag(*parts):
+    """Weak ETag value for the data a response is built from (not its bytes)."""
+    return hashlib.sha1(repr((_ETAG_SALT,) + parts).encode()).hexdigest()[:32]
+
+
+def _http_date(value):
+    # Stored timestamps are naive UTC; HTTP dates have whole-second precision.
+    return value.replace(tzinfo=datetime.timezone.utc, microsecond=0)
+
+
+def flashes_pending():
+    """True if a page rendered now would show flashed messages. Check before rendering: the template pops them."""
+    return bool(session.get("_flashes"))
+
+
+def _cacheable(public):
+    if not HTTP_CACHE_ENABLED:
+        return False
+    if "http_cache_skip" not in g:
+        # A page showing flashed messages must not be stored, or revalidating it later would bring
+        # the old message back.
+        g.http_cache_skip = not public and flashes_pending()
+    return not g.http_cache_skip
+
+
+def _set_cache_headers(response, etag, last_modified, public):
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = _http_date(last_modified)
+    if public:
+        response.cache_control.public = True
+        response.cache_control.max_age = HTTP_CACHE_MAX_AGE_SECONDS
+        if HTTP_CACHE_STALE_SECONDS:
+            response.cache_control.stale_while_revalidate = HTTP_CACHE_STALE_SECONDS
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+
+def not_modified(etag, last_modified=None, public=False):
+    """
+    A 304 response if the request's If-None-Match / If-Modified-Since still match, otherwise None.
+    If-None-Match takes precedence, as in RFC 9110.
+    """
+    if not _cacheable(public):
+        return None
+    if request.if_none_match:
+        matched = request.if_none_match.contains_weak(etag)
+    elif last_modified is not None and request.if_modified_since is not None:
+        matched = _http_date(last_modified) <= request.if_modified_since
+    else:
+        matched = False
+    if not matched:
+        return None
+    return _set_cache_headers(current_app.response_class(status=304), etag, last_modified, public)
+
+
+def with_validators(response, etag, last_modified=None, public=False):
+    """Adds the ETag, Last-Modified and Cache-Control headers to a freshly built 200 response."""
+    if not _cacheable(public):
+        if HTTP_CACHE_ENABLED:
+            response.cache_control.no_store = True
+        return response
+    return _set_cache_headers(response, etag, last_modified, public)
@@ -0,0 +1,124 @@
+# listing.py
+# Keyset (cursor) pagination of the tracked-product listing, shared by the home page and /api/products.
+# Each sort order reads a composite (sort column, id) index on product, so fetching any page is an
+# index range scan of LISTING_PAGE_SIZE rows: no OFFSET, and the cost doesn't grow with the number
+# of tracked products or with how deep the user pages.
+import base64
+import datetime
+import json
+import os
+
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import load_only, raiseload
+
+from database import db, Product
+
+LISTING_PAGE_SIZE = int(os.getenv("LISTING_PAGE_SIZE", "50"))
+LISTING_MAX_PAGE_SIZE = 200
+
+# sort name -> (column, descending). The 'id' tiebreak makes every position unique.
+PRODUCT_SORTS = {
+    "newest": (Product.created_at, True),
+    "price_low": (Product.current_price, False),
+    "price_high": (Product.current_price, True),
+    "biggest_drop": (Product.price_change_24h, False), # Most negative 24h change first
+    "name": (Product.name, False),
+}
+DEFAULT_PRODUCT_SORT = "newest"
+
+# Columns the listing renders or returns; everything else stays unloaded.
+PRODUCT_LISTING_COLUMNS = (Product.id, Product.url, Product.name, Product.image_url, Product.current_price,
+                           Product.price_change_24h, Product.created_at, Product.scrape_status)
+
+
+def encode_cursor(value, product_id):
+    if isinstance(value, datetime.datetime):
+        value = value.isoformat()
+    raw = json.dumps([value, product_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(sort, cursor):
+    """(sort value, product id) from a cursor of the given sort. Raises ValueError if it is malformed."""
+    try:
+        value, product_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise ValueError("invalid cursor")
+    if not isinstance(product_id, int) or value is None:
+        raise ValueError("invalid cursor")
+    column = PRODUCT_SORTS[sort][0]
+    try:
+        if column is Product.created_at:
+            value = datetime.datetime.fromisoformat(value)
+        elif column is Product.name:
+            value = str(value)
+        else:
+            value = float(value)
+    except (TypeError, ValueError): # e.g. a number where a timestamp belongs, or a list as price
+        raise ValueError("invalid cursor")
+    return value, product_id
+
+
+def product_listing_query(sort, after=None, name_contains=None, min_price=None, max_price=None):
+    """Select of products in the given sort order, starting after the (sort value, id) position 'after'."""
+    if sort not in PRODUCT_SORTS:
+        raise ValueError(f"sort must be one of: {', '.join(PRODUCT_SORTS)}")
+    column, descending = PRODUCT_SORTS[sort]
+    query = (select(Product)
+             .options(load_only(*PRODUCT_LISTING_COLUMNS, raiseload=True), raiseload("*"))
+             .where(column.isnot(None)))
+    if name_contains:
+        # Escaped so '%' and '_' in the search match themselves instead of acting as wildcards
+        pattern = name_contains.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        query = query.where(Product.name.ilike(f"%{pattern}%", escape="\\"))
+    if min_price is not None:
+        query = query.where(Product.current_price >= min_price)
+    if max_price is not None:
+        query = query.where(Product.current_price <= max_price)
+    if after is not None:
+        position = tuple_(column, Product.id)
+        query = query.where(position < after if descending else position > after)
+    if descending:
+        return query.order_by(column.desc(), Product.id.desc())
+    return query.order_by(column.asc(), Product.id.asc())
+
+
+def product_listing_page(sort=DEFAULT_PRODUCT_SORT, cursor=None, limit=LISTING_PAGE_SIZE,
+                         name_contains=None, min_price=None, max_price=None):
+    """
+    One page of products in the given sort order, after the position encoded in 'cursor'.
+    Returns (products, next_cursor); next_cursor is None on the last page.
+    Products without a value for the sort column (e.g. no price yet) are left out of that order.
+    Raises ValueError for an unknown sort or a malformed cursor.
+    """
+    if sort not in PRODUCT_SORTS:
+        raise ValueError(f"sort must be one of: {', '.join(PRODUCT_SORTS)}")
+    limit = max(1, min(limit, LISTING_MAX_PAGE_SIZE))
+    after = decode_cursor(sort, cursor) if cursor else None
+    query = product_listing_query(sort, after, name_contains, min_price, max_price)
+
+    products = db.session.execute(query.limit(limit + 1)).scalars().all()
+    next_cursor = None
+    if len(products) > limit:
+        products = products[:limit]
+        last = products[-1]
+        next_cursor = encode_cursor(getattr(last, PRODUCT_SORTS[sort][0].key), last.id)
+    return products, next_cursor
+
+
+def listing_version(products):
+    """The listed values of a page of products; a page's ETag is derived from it (see http_cache.py)."""
+    return [tuple(getattr(product, column.key) for column in PRODUCT_LISTING_COLUMNS) for product in products]
+
+
+def product_listing_json(product):
+    return {
+        "id": product.id,
+        "url": product.url,
+        "name": product.name,
+        "image_url": product.image_url,
+        "current_price": product.current_price,
+        "price_change_24h": product.price_change_24h,
+        "created_at": product.created_at.isoformat() if product.created_at else None,
+        "status": product.scrape_status or "active",
+    }
@@ -1,46 +1,41 @@
 # llm_helper.py
-import google.generativeai as genai
+# Prompts and response handling for the comparison metadata; the LLM client itself (provider, deadlines,
+# concurrency limit, metrics) is in llm_providers.py.
 import os
 import json
-
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-
-# Use the model name prefixed with "models/" as shown in working examples
-# Let's try "models/gemini-1.5-flash-latest" first as "latest" is often a good alias.
-# If that specific alias doesn't work, "models/gemini-pro" is a common alternative.
-MODEL_NAME_FOR_API = "models/gemini-1.5-flash-latest"
-# MODEL_NAME_FOR_API = "models/gemini-pro" # Alternative to try if flash doesn't work
-
-IS_GEMINI_CONFIGURED = False
-
-if GEMINI_API_KEY:
-    try:
-        genai.configure(api_key=GEMINI_API_KEY)
-        print(f"LLM_HELPER.PY: Gemini API Key configured successfully. Will attempt to use model: {MODEL_NAME_FOR_API}")
-        IS_GEMINI_CONFIGURED = True
-    except Exception as e:
-        print(f"LLM_HELPER.PY: Error configuring Gemini API Key: {e}")
-        GEMINI_API_KEY = None
-        IS_GEMINI_CONFIGURED = False
-else:
-    print("LLM_HELPER.PY WARNING: GEMINI_API_KEY not found in environment variables. LLM features will be disabled.")
-
-def extract_metadata_and_generate_queries(amazon_product_name, amazon_product_url):
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from llm_providers import generate, llm_available, MODEL_NAME_FOR_API, LLM_PROVIDER
+
+# Bump when the prompt or the expected response structure changes; cached results of older versions
+# are then re-extracted (see metadata_cache.py).
+LLM_METADATA_VERSION = 1
+
+# Batch enrichment (extract_metadata_batch): products per prompt, prompts in flight at once, the request
+# rate they share, and how often an item whose answer was missing or invalid is tried again.
+LLM_BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", "20"))
+LLM_BATCH_CONCURRENCY = int(os.getenv("LLM_BATCH_CONCURRENCY", "3"))
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "15"))
+LLM_BATCH_MAX_ATTEMPTS = 3
+
+def _clean_json_text(text):
+    # Gemini sometimes wraps JSON answers in a ```json fence.
+    cleaned_response_text = text.strip()
+    if cleaned_response_text.startswith("```json"):
+        cleaned_response_text = cleaned_response_text[7:]
+    if cleaned_response_text.endswith("```"):
+        cleaned_response_text = cleaned_response_text[:-3]
+    return cleaned_response_text.strip()
+
+def extract_metadata_and_generate_queries(amazon_product_name, amazon_product_url, timeout=None):
     print(f"LLM_HELPER.PY: extract_metadata_and_generate_queries called with Name: '{amazon_product_name}' URL: '{amazon_product_url}'")
 
-    if not IS_GEMINI_CONFIGURED: # Check the flag
-        print("LLM_HELPER.PY: Gemini API Key is not configured or configuration failed. Skipping LLM processing.")
+    if not llm_available(): # Provider missing or not configured (logged once by llm_providers)
+        print("LLM_HELPER.PY: LLM provider is not configured or configuration failed. Skipping LLM processing.")
         return {"metadata": {"Error": "LLM API Key not configured or configuration failed"}, "search_queries": {}}
 
-    try:
-        # Initialize the generative model WITH the "models/" prefix
-        model = genai.GenerativeModel(MODEL_NAME_FOR_API)
-        print(f"LLM_HELPER.PY: Gemini Model '{MODEL_NAME_FOR_API}' initialized successfully.")
-    except Exception as e:
-        print(f"LLM_HELPER.PY: Error initializing Gemini Model '{MODEL_NAME_FOR_API}': {e}")
-        print(f"LLM_HELPER.PY: This might be due to an invalid API key, incorrect model name (ensure it's prefixed with 'models/'), or network/quota issue.")
-        return {"metadata": {"Error": f"Failed to initialize LLM Model ('{MODEL_NAME_FOR_API}')"}, "search_queries": {}}
-
     prompt = f"""
     You are an expert e-commerce product analyst.
     Analyze the following Amazon product:
@@ -68,18 +63,13 @@ def extract_metadata_and_generate_queries(amazon_product_name, amazon_product_ur
     Focus on accuracy for finding the *identical* product. Ensure the entire output is a single, valid JSON object.
     """
 
-    print(f"LLM_HELPER.PY: Sending prompt to Gemini model '{MODEL_NAME_FOR_API}' for product: '{amazon_product_name}'")
+    print(f"LLM_HELPER.PY: Sending prompt to LLM provider '{LLM_PROVIDER}' for product: '{amazon_product_name}'")
     try:
-        response = model.generate_content(prompt)
+        response_text = generate(prompt, timeout=timeout)
         
-        cleaned_response_text = response.text.strip()
-        if cleaned_response_text.startswith("```json"):
-            cleaned_response_text = cleaned_response_text[7:]
-        if cleaned_response_text.endswith("```"):
-            cleaned_response_text = cleaned_response_text[:-3]
-        cleaned_response_text = cleaned_response_text.strip()
-
-        print(f"LLM_HELPER.PY: Raw Gemini response text (cleaned for JSON parsing):\n{cleaned_response_text}")
+        cleaned_response_text = _clean_json_text(response_text)
+
+        print(f"LLM_HELPER.PY: Raw LLM response text (cleaned for JSON parsing):\n{cleaned_response_text}")
         
         llm_data = json.loads(cleaned_response_text)
         print(f"LLM_HELPER.PY: Successfully parsed LLM data: {llm_data}")
@@ -90,40 +80,112 @@ def extract_metadata_and_generate_queries(amazon_product_name, amazon_product_ur
         return llm_data
         
     except json.JSONDecodeError as e:
-        problem_text = response.text if 'response' in locals() and hasattr(response, 'text') else 'Response object not available or no text attribute'
+        problem_text = response_text if 'response_text' in locals() else 'Response text not available'
         print(f"LLM_HELPER.PY: Error decoding JSON from LLM response: {e}. Problematic text: {problem_text}")
         return {"metadata": {"Error": "Failed to parse LLM response as JSON"}, "search_queries": {"Flipkart": amazon_product_name, "Meesho": amazon_product_name}}
     except Exception as e:
         print(f"LLM_HELPER.PY: An error occurred with the LLM API call or response processing: {e}")
         return {"metadata": {"Error": f"LLM API call/processing failed: {str(e)}"}, "search_queries": {"Flipkart": amazon_product_name, "Meesho": amazon_product_name}}
 
+class _RateLimiter:
+    """Spaces calls at least 60/requests_per_minute seconds apart, across threads."""
+    def __init__(self, requests_per_minute):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self.lock = threading.Lock()
+        self.next_slot = 0.0
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+_batch_rate_limiter = _RateLimiter(LLM_REQUESTS_PER_MINUTE)
+
+BATCH_PROMPT = """
+    You are an expert e-commerce product analyst.
+    For EACH Amazon product in the JSON array below:
+    1. Extract key structured metadata. Identify Brand, Model/Series, and 2-3 critical distinguishing specifications (e.g., storage size, color, screen size, type, material, quantity). Be concise.
+    2. Generate targeted search queries to find the *exact same product* on these Indian e-commerce platforms: Flipkart, Meesho.
+
+    Respond ONLY with a JSON array containing exactly one object per input product, in any order, each with this structure:
+    {{
+      "id": <the product's "id" from the input, unchanged>,
+      "metadata": {{"brand": "ExampleBrand", "model": "ExampleModel X100", "specifications": ["Spec1: Value1", "Spec2: Value2"]}},
+      "search_queries": {{"Flipkart": "ExampleBrand ExampleModel X100 Value1 Value2", "Meesho": "ExampleBrand ExampleModel X100 Value1"}}
+    }}
+    If a platform is unsuitable for a product, give an empty string for its query. Do not add any text outside the JSON array.
+
+    PRODUCTS_JSON:
+    {products_json}
+    """
+
+def _valid_batch_item(item):
+    if not isinstance(item, dict) or not isinstance(item.get("metadata"), dict):
+        return False
+    queries = item.get("search_queries")
+    return isinstance(queries, dict) and all(isinstance(query, str) for query in queries.values())
+
+def _run_batch(batch):
+    """{id: llm_data} for the items of one batch that came back valid; the rest is left out."""
+    products_json = json.dumps([{"id": item["id"], "name": item["name"], "url": item.get("url")} for item in batch],
+                               ensure_ascii=False)
+    _batch_rate_limiter.wait()
+    try:
+        answer = json.loads(_clean_json_text(generate(BATCH_PROMPT.format(products_json=products_json), json_output=True)))
+    except Exception as e:
+        print(f"LLM_HELPER.PY: Batch of {len(batch)} products failed: {e}")
+        return {}
+    if not isinstance(answer, list):
+        print(f"LLM_HELPER.PY: Batch answer is not a JSON array; retrying its {len(batch)} products.")
+        return {}
+    requested_ids = {item["id"] for item in batch}
+    results = {}
+    for item in answer:
+        if _valid_batch_item(item) and item.get("id") in requested_ids:
+            results[item["id"]] = {"metadata": item["metadata"], "search_queries": item["search_queries"]}
+    return results
+
+def extract_metadata_batch(products):
+    """
+    Metadata and search queries for many products, LLM_BATCH_SIZE per prompt and up to LLM_BATCH_CONCURRENCY
+    prompts at once (LLM_REQUESTS_PER_MINUTE overall). 'products' is a list of {"id", "name", "url"} dicts
+    with unique ids. Items whose answer is missing or invalid are re-batched and tried again, up to
+    LLM_BATCH_MAX_ATTEMPTS times. Returns {id: {"metadata", "search_queries"}} of the ones that succeeded.
+    """
+    if not products or not llm_available():
+        return {}
+    results = {}
+    remaining = list(products)
+    with ThreadPoolExecutor(max_workers=max(1, LLM_BATCH_CONCURRENCY), thread_name_prefix="llm-batch") as pool:
+        for attempt in range(1, LLM_BATCH_MAX_ATTEMPTS + 1):
+            batches = [remaining[start:start + LLM_BATCH_SIZE] for start in range(0, len(remaining), LLM_BATCH_SIZE)]
+            for batch_results in pool.map(_run_batch, batches):
+                results.update(batch_results)
+            remaining = [item for item in remaining if item["id"] not in results]
+            print(f"LLM_HELPER.PY: Batch attempt {attempt}: {len(results)}/{len(products)} products done.")
+            if not remaining:
+                break
+    return results
+
 print("LLM_HELPER.PY: 'extract_metadata_and_generate_queries' function has been defined by Python interpreter.")
 
 if __name__ == '__main__':
-    # ... (keep your existing __main__ block for direct testing, 
-    # but ensure it also uses MODEL_NAME_FOR_API when calling genai.GenerativeModel) ...
+    # Direct test; with LLM_PROVIDER=fake it runs without network access or an API key.
     print("LLM_HELPER.PY: Running __main__ block for direct test...")
     from dotenv import load_dotenv
+    from llm_providers import llm_stats
     project_root = os.path.dirname(os.path.abspath(__file__))
     load_dotenv(os.path.join(project_root, '.env'))
-                                             
-    TEST_GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-    if not TEST_GEMINI_API_KEY:
-        print("LLM_HELPER_TEST: Cannot test - GEMINI_API_KEY not found.")
-    else:
-        print(f"LLM_HELPER_TEST: GEMINI_API_KEY found. Configuring genai for test...")
-        try:
-            genai.configure(api_key=TEST_GEMINI_API_KEY)
-            print("LLM_HELPER_TEST: Genai configured for test.")
-            
-            test_name = "Apple iPhone 15 (128 GB) - Pink"
-            test_url = "https://www.amazon.in/Apple-iPhone-15-128-GB/dp/B0CHX3TW6X/"
-            
-            print(f"\nLLM_HELPER_TEST: Requesting metadata and queries for: '{test_name}' using model '{MODEL_NAME_FOR_API}'") # Use MODEL_NAME_FOR_API
-            result = extract_metadata_and_generate_queries(test_name, test_url) # Call the function
-            
-            print("\n--- LLM Test Result (from __main__) ---")
-            print(json.dumps(result, indent=2))
-
-        except Exception as e:
-            print(f"LLM_HELPER_TEST: Error during direct test execution: {e}")
\ No newline at end of file
+
+    test_name = "Apple iPhone 15 (128 GB) - Pink"
+    test_url = "https://www.amazon.in/Apple-iPhone-15-128-GB/dp/B0CHX3TW6X/"
+
+    print(f"\nLLM_HELPER_TEST: Requesting metadata and queries for: '{test_name}' using provider '{LLM_PROVIDER}' (model '{MODEL_NAME_FOR_API}')")
+    result = extract_metadata_and_generate_queries(test_name, test_url) # Call the function
+
+    print("\n--- LLM Test Result (from __main__) ---")
+    print(json.dumps(result, indent=2))
+    print(f"LLM_HELPER_TEST: Call metrics: {llm_stats()}")
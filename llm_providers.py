@@ -0,0 +1,225 @@
+# llm_providers.py
+# The LLM client used by llm_helper.py, behind a small provider interface:
+#   - 'gemini' (default): Google Gemini through google.generativeai, which is imported only when this
+#     provider is used. One configured model object per process; GEMINI_API_ENDPOINT points it at a
+#     Gemini-compatible REST endpoint instead (e.g. llm_stub_server.py).
+#   - 'fake': deterministic local answers built by the title parser (title_metadata.py), with an optional
+#     simulated latency (LLM_FAKE_LATENCY_MS). No network, no API key; for tests and benchmarks.
+# Chosen with LLM_PROVIDER. Every call goes through generate() (or generate_async() from asyncio code),
+# which applies a per-call deadline, caps the calls in flight at LLM_MAX_CONCURRENCY and records
+# latency/token metrics (llm_stats()).
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+import weakref
+
+from title_metadata import extract_title_metadata
+
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini").lower()
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4")) # Provider calls in flight per process
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30")) # Default per-call deadline
+LLM_FAKE_LATENCY_MS = float(os.getenv("LLM_FAKE_LATENCY_MS", "0"))
+LLM_STATS_LOG_SECONDS = int(os.getenv("LLM_STATS_LOG_SECONDS", "300")) # Worker log interval; 0 disables
+
+# Base URL of a Gemini-compatible endpoint to use instead of Google's, e.g. the local stand-in
+# (python llm_stub_server.py, then GEMINI_API_ENDPOINT=http://127.0.0.1:8089 and any GEMINI_API_KEY).
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
+
+# Use the model name prefixed with "models/" as shown in working examples
+# If "models/gemini-1.5-flash-latest" doesn't work, "models/gemini-pro" is a common alternative.
+MODEL_NAME_FOR_API = os.getenv("GEMINI_MODEL", "models/gemini-1.5-flash-latest")
+
+
+class LLMUnavailable(Exception):
+    """The configured provider can't be used (missing package or API key)."""
+
+
+class LLMProvider:
+    name = "base"
+
+    def complete(self, prompt, timeout, json_output=False):
+        """(answer text, prompt tokens, output tokens) for the prompt; must give up after 'timeout' seconds."""
+        raise NotImplementedError
+
+
+class GeminiProvider(LLMProvider):
+    name = "gemini"
+
+    def __init__(self):
+        api_key = os.getenv("GEMINI_API_KEY") # Read on first use, so a .env loaded after import still counts
+        if not api_key:
+            raise LLMUnavailable("GEMINI_API_KEY not found in environment variables")
+        try:
+            import google.generativeai as genai
+        except ImportError as e:
+            raise LLMUnavailable(f"google-generativeai is not installed ({e})")
+        if GEMINI_API_ENDPOINT:
+            genai.configure(api_key=api_key, transport="rest", client_options={"api_endpoint": GEMINI_API_ENDPOINT})
+        else:
+            genai.configure(api_key=api_key)
+        # One model object per process, shared by all calls (it is only a thin wrapper around the API client).
+        self.model = genai.GenerativeModel(MODEL_NAME_FOR_API)
+        print(f"LLM_PROVIDERS: Gemini model '{MODEL_NAME_FOR_API}' initialized"
+              f"{f' (endpoint {GEMINI_API_ENDPOINT})' if GEMINI_API_ENDPOINT else ''}.")
+
+    def complete(self, prompt, timeout, json_output=False):
+        response = self.model.generate_content(
+            prompt,
+            generation_config={"response_mime_type": "application/json"} if json_output else None,
+            request_options={"timeout": timeout},
+        )
+        usage = getattr(response, "usage_metadata", None)
+        return (response.text, getattr(usage, "prompt_token_count", 0) or 0,
+                getattr(usage, "candidates_token_count", 0) or 0)
+
+
+_FAKE_SINGLE_NAME = re.compile(r'Product Name: "(.*)"')
+
+
+def fake_answer(prompt):
+    """The fake provider's answer as a Python object: a list for batch prompts, else one dict."""
+    if "PRODUCTS_JSON:" in prompt:
+        products = json.loads(prompt.split("PRODUCTS_JSON:", 1)[1])
+        return [{"id": product["id"], **extract_title_metadata(product["name"])[0]} for product in products]
+    match = _FAKE_SINGLE_NAME.search(prompt)
+    return extract_title_metadata(match.group(1) if match else "")[0]
+
+
+class FakeProvider(LLMProvider):
+    name = "fake"
+
+    def complete(self, prompt, timeout, json_output=False):
+        latency = LLM_FAKE_LATENCY_MS / 1000
+        if latency > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"fake LLM latency {LLM_FAKE_LATENCY_MS:g} ms exceeds the {timeout:.2f} s deadline")
+        time.sleep(latency)
+        text = json.dumps(fake_answer(prompt))
+        return text, len(prompt) // 4, len(text) // 4 # Roughly 4 characters per token
+
+
+PROVIDERS = {"gemini": GeminiProvider, "fake": FakeProvider}
+
+
+class LLMMetrics:
+    """Call counts, latency and token usage of this process's LLM calls."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.calls = self.errors = self.timeouts = 0
+        self.latency_seconds_total = self.latency_seconds_max = 0.0
+        self.prompt_tokens = self.output_tokens = 0
+
+    def record(self, latency, prompt_tokens=0, output_tokens=0, error=None):
+        with self.lock:
+            self.calls += 1
+            self.latency_seconds_total += latency
+            self.latency_seconds_max = max(self.latency_seconds_max, latency)
+            self.prompt_tokens += prompt_tokens
+            self.output_tokens += output_tokens
+            if isinstance(error, TimeoutError) or "deadline" in str(error or "").lower():
+                self.timeouts += 1
+            elif error is not None:
+                self.errors += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                "provider": LLM_PROVIDER,
+                "calls": self.calls,
+                "errors": self.errors,
+                "timeouts": self.timeouts,
+                "latency_ms_avg": round(1000 * self.latency_seconds_total / self.calls, 1) if self.calls else None,
+                "latency_ms_max": round(1000 * self.latency_seconds_max, 1),
+                "prompt_tokens": self.prompt_tokens,
+                "output_tokens": self.output_tokens,
+            }
+
+
+llm_metrics = LLMMetrics()
+
+_provider = None
+_provider_error = None
+_provider_lock = threading.Lock()
+_call_slots = threading.BoundedSemaphore(max(1, LLM_MAX_CONCURRENCY))
+_async_slots = weakref.WeakKeyDictionary() # Event loop -> asyncio.Semaphore (one per loop)
+
+
+def get_provider():
+    """The process-wide provider instance, created on first use; raises LLMUnavailable if it can't be."""
+    global _provider, _provider_error
+    with _provider_lock:
+        if _provider is None and _provider_error is None:
+            try:
+                if LLM_PROVIDER not in PROVIDERS:
+                    raise LLMUnavailable(f"unknown LLM_PROVIDER '{LLM_PROVIDER}' (one of: {', '.join(PROVIDERS)})")
+                _provider = PROVIDERS[LLM_PROVIDER]()
+            except Exception as e:
+                _provider_error = e if isinstance(e, LLMUnavailable) else LLMUnavailable(str(e))
+                print(f"LLM_PROVIDERS WARNING: {_provider_error}. LLM features will be disabled.")
+        if _provider is None:
+            raise _provider_error
+        return _provider
+
+
+def llm_available():
+    try:
+        get_provider()
+    except LLMUnavailable:
+        return False
+    return True
+
+
+def generate(prompt, timeout=None, json_output=False):
+    """
+    Answer text of the provider for the prompt. Waits at most 'timeout' seconds (LLM_TIMEOUT_SECONDS by
+    default) in total, including the wait for a free slot; raises TimeoutError when that runs out.
+    """
+    provider = get_provider()
+    deadline = time.monotonic() + (LLM_TIMEOUT_SECONDS if timeout is None else timeout)
+    if not _call_slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+        llm_metrics.record(0.0, error=TimeoutError())
+        raise TimeoutError("no free LLM call slot before the deadline")
+    started = time.monotonic()
+    try:
+        text, prompt_tokens, output_tokens = provider.complete(prompt, max(0.001, deadline - started), json_output)
+    except Exception as e:
+        llm_metrics.record(time.monotonic() - started, error=e)
+        raise
+    finally:
+        _call_slots.release()
+    llm_metrics.record(time.monotonic() - started, prompt_tokens, output_tokens)
+    return text
+
+
+async def generate_async(prompt, timeout=None, json_output=False):
+    """generate() for asyncio code: at most LLM_MAX_CONCURRENCY calls per event loop wait in worker threads."""
+    loop = asyncio.get_running_loop()
+    slots = _async_slots.get(loop)
+    if slots is None:
+        slots = _async_slots[loop] = asyncio.Semaphore(max(1, LLM_MAX_CONCURRENCY))
+    timeout = LLM_TIMEOUT_SECONDS if timeout is None else timeout
+
+    async def generate_in_slot():
+        async with slots:
+            return await loop.run_in_executor(None, generate, prompt, timeout, json_output)
+
+    try:
+        return await asyncio.wait_for(generate_in_slot(), timeout)
+    except asyncio.TimeoutError: # Not the builtin TimeoutError before Python 3.11
+        raise TimeoutError("LLM call didn't finish before the deadline")
+
+
+def llm_stats():
+    return llm_metrics.stats()
+
+
+def log_llm_stats():
+    stats = llm_stats()
+    if stats["calls"]:
+        print(f"LLM_PROVIDERS: {stats}")
@@ -0,0 +1,73 @@
+# llm_stub_server.py
+# Local stand-in for the Gemini generateContent REST endpoint, for exercising llm_helper (single and batch
+# prompts, retries, concurrency, rate limiting) without network access or API quota:
+#   python llm_stub_server.py [port]          (default 8089)
+#   GEMINI_API_ENDPOINT=http://127.0.0.1:8089 GEMINI_API_KEY=stub python run_scheduler.py
+# Answers are the fake LLM provider's (llm_providers.fake_answer: built by the title parser), so they are
+# deterministic.
+# LLM_STUB_LATENCY_MS adds a delay to every answer; LLM_STUB_DROP_EVERY=N leaves every Nth product out of
+# batch answers the first time it is asked for, like a model that skipped an item.
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from llm_providers import fake_answer
+
+LLM_STUB_LATENCY_MS = float(os.getenv("LLM_STUB_LATENCY_MS", "0"))
+LLM_STUB_DROP_EVERY = int(os.getenv("LLM_STUB_DROP_EVERY", "0"))
+
+_dropped_lock = threading.Lock()
+_dropped_ids = set()
+_items_seen = 0
+
+
+def _drop_items(answer):
+    # Batch answers only: leaves out every LLM_STUB_DROP_EVERY-th item, once per product.
+    global _items_seen
+    kept = []
+    for item in answer:
+        with _dropped_lock:
+            _items_seen += 1
+            if LLM_STUB_DROP_EVERY and _items_seen % LLM_STUB_DROP_EVERY == 0 and item["id"] not in _dropped_ids:
+                _dropped_ids.add(item["id"])
+                continue
+        kept.append(item)
+    return kept
+
+
+class StubGeminiHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        if not self.path.split("?", 1)[0].endswith(":generateContent"):
+            self.send_error(404)
+            return
+        request_body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        prompt = "".join(part.get("text", "") for content in request_body.get("contents", [])
+                         for part in content.get("parts", []))
+        if LLM_STUB_LATENCY_MS:
+            time.sleep(LLM_STUB_LATENCY_MS / 1000)
+        answer = fake_answer(prompt)
+        if isinstance(answer, list):
+            answer = _drop_items(answer)
+        text = json.dumps(answer)
+        body = json.dumps({
+            "candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "finishReason": "STOP", "index": 0}],
+            "usageMetadata": {"promptTokenCount": len(prompt) // 4, "candidatesTokenCount": len(text) // 4,
+                              "totalTokenCount": (len(prompt) + len(text)) // 4},
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        print(f"LLM_STUB: {self.address_string()} {format % args}")
+
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8089
+    print(f"LLM_STUB: Serving a stand-in Gemini endpoint on http://127.0.0.1:{port}")
+    ThreadingHTTPServer(("127.0.0.1", port), StubGeminiHandler).serve_forever()
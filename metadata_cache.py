@@ -0,0 +1,66 @@
+# metadata_cache.py
+# Persistent cache of the LLM's product metadata and per-platform search queries, so a product is sent
+# to Gemini once rather than on every comparison (including the scheduled refreshes, see comparison.py).
+# Entries are keyed by canonical product identity: the ASIN for Amazon URLs (the same product tracked
+# through different URLs shares one entry), else the URL without query string or fragment.
+# An entry is used only while it is younger than LLM_METADATA_TTL_DAYS, was produced by the current
+# prompt version (llm_helper.LLM_METADATA_VERSION) and was extracted from the product's current name,
+# so a renamed product is analysed again. Failed LLM answers are never stored.
+import datetime
+import json
+import os
+import re
+from urllib.parse import urlsplit
+
+from sqlalchemy.exc import IntegrityError
+
+from database import db, ProductMetadata
+from llm_helper import LLM_METADATA_VERSION
+
+LLM_METADATA_TTL_DAYS = float(os.getenv("LLM_METADATA_TTL_DAYS", "30")) # 0 disables the cache
+
+_ASIN_PATTERN = re.compile(r"/(?:dp|gp/product|gp/aw/d|product)/([A-Z0-9]{10})(?:[/?#]|$)", re.IGNORECASE)
+
+
+def canonical_product_key(url):
+    """'amazon:<ASIN>' for Amazon product URLs, else the URL without scheme, query string and fragment."""
+    parts = urlsplit(url or "")
+    host = parts.netloc.lower()
+    match = _ASIN_PATTERN.search(parts.path)
+    if match and "amazon." in host:
+        return f"amazon:{match.group(1).upper()}"
+    return f"{host.removeprefix('www.')}{parts.path.rstrip('/')}"[:255]
+
+
+def _is_usable(llm_data):
+    metadata = llm_data.get("metadata") or {}
+    return "Error" not in metadata and bool(llm_data.get("search_queries"))
+
+
+def load_cached_metadata(product_name, product_url):
+    """The cached LLM result for this product, or None if there is no valid entry."""
+    if LLM_METADATA_TTL_DAYS <= 0:
+        return None
+    entry = db.session.get(ProductMetadata, canonical_product_key(product_url))
+    if entry is None or entry.version != LLM_METADATA_VERSION or entry.product_name != product_name:
+        return None
+    if datetime.datetime.utcnow() - entry.updated_at > datetime.timedelta(days=LLM_METADATA_TTL_DAYS):
+        return None
+    return json.loads(entry.data)
+
+
+def store_metadata(product_name, product_url, llm_data):
+    """Adds/replaces the cache entry for this product and commits. Returns whether it was stored."""
+    if LLM_METADATA_TTL_DAYS <= 0 or not _is_usable(llm_data):
+        return False
+    db.session.merge(ProductMetadata(
+        key=canonical_product_key(product_url), product_name=product_name, version=LLM_METADATA_VERSION,
+        data=json.dumps(llm_data), updated_at=datetime.datetime.utcnow(),
+    ))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another worker stored the same product in the meantime; its entry is as good as ours
+        db.session.rollback()
+        return False
+    return True
@@ -0,0 +1,470 @@
+# migrations.py
+# Small versioned schema/data migrations on top of db.create_all().
+# create_all() only creates missing tables, so changes to existing tables (new columns,
+# data rewrites) are listed here in order and recorded in the 'schema_migrations' table.
+import contextlib
+import datetime
+import os
+import time
+
+from sqlalchemy import inspect, text, select, update, delete, func, Integer
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from database import db, Product, PriceHistory, Alert, PRICE_STORAGE_COMPACT
+from persist import PRICE_HISTORY_CHANGE_ONLY, price_at
+from partitions import ensure_price_history_partitioning, is_partitioned
+from rollups import ROLLUP_RESOLUTIONS, update_price_rollups, segment_rollup_points
+
+# Rows per UPDATE/DELETE statement when rewriting history.
+MIGRATION_BATCH_SIZE = 1000
+# How long a starting process waits for another process's storage conversion or migrations to finish.
+# A SQLite migration lock not refreshed for this long is taken to be left by a crashed process.
+MIGRATION_LOCK_TIMEOUT_SECONDS = int(os.getenv("MIGRATION_LOCK_TIMEOUT_SECONDS", "600"))
+
+
+def _column_exists(table_name, column_name):
+    # Inspect through the session's connection: another connection would block on the
+    # uncommitted ALTER TABLEs of the running migration (PostgreSQL).
+    columns = inspect(db.session.connection()).get_columns(table_name)
+    return any(c["name"] == column_name for c in columns)
+
+
+def _add_column_if_missing(table_name, column_name, column_type):
+    if not _column_exists(table_name, column_name):
+        db.session.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}"))
+
+
+def _m001_add_price_history_last_seen():
+    column_type = PriceHistory.__table__.c.last_seen.type.compile(dialect=db.session.get_bind().dialect)
+    _add_column_if_missing(PriceHistory.__tablename__, "last_seen", column_type)
+    db.session.execute(
+        update(PriceHistory).where(PriceHistory.last_seen.is_(None)).values(last_seen=PriceHistory.timestamp)
+    )
+
+
+def _m002_compact_price_history():
+    # Destructive (drops the scrapes inside each run), so only with change-only storage opted in.
+    # With it off the migration is recorded as applied; compacting later is 'flask compact-price-history'.
+    if PRICE_HISTORY_CHANGE_ONLY:
+        compact_price_history()
+    else:
+        print("MIGRATIONS: PRICE_HISTORY_CHANGE_ONLY is off, leaving price history uncompacted.")
+
+
+def _m003_add_product_price_summary():
+    for column_name in ("current_price", "min_price", "max_price", "price_change_24h"):
+        _add_column_if_missing(Product.__tablename__, column_name, "FLOAT")
+    _add_column_if_missing(Product.__tablename__, "last_scraped_at", "TIMESTAMP")
+    rebuild_product_summaries()
+
+
+def _m004_backfill_price_rollups():
+    rebuild_price_rollups()
+
+
+# Indexes on columns that a later migration adds; the earlier index migrations must skip them.
+_INDEXES_ADDED_LATER = {"ix_product_scrape_pending", "ix_product_comparison_pending"}
+
+
+def _create_model_indexes(indexes):
+    connection = db.session.connection()
+    for index in indexes:
+        if index.name not in _INDEXES_ADDED_LATER:
+            index.create(connection, checkfirst=True)
+
+
+def _create_product_index(name):
+    index = next(index for index in Product.__table__.indexes if index.name == name)
+    index.create(db.session.connection(), checkfirst=True)
+
+
+def _m005_add_hot_query_indexes():
+    # Declared on the models (so create_all() builds them for new databases); created here for
+    # existing ones. On a partitioned price_history the index cascades to every partition.
+    _create_model_indexes((*PriceHistory.__table__.indexes, *Alert.__table__.indexes, *Product.__table__.indexes))
+
+
+def _m006_add_listing_sort_indexes():
+    # The (created_at, id) index replaces the single-column one from migration 5.
+    _create_model_indexes(Product.__table__.indexes)
+    db.session.execute(text("DROP INDEX IF EXISTS ix_product_created_at"))
+
+
+def _m007_add_product_scrape_status():
+    _add_column_if_missing(Product.__tablename__, "scrape_status", "VARCHAR(16)")
+    _create_product_index("ix_product_scrape_pending")
+
+
+def _m008_add_product_comparison_state():
+    # The comparison_result table itself is new and created by db.create_all().
+    _add_column_if_missing(Product.__tablename__, "comparison_status", "VARCHAR(16)")
+    _add_column_if_missing(Product.__tablename__, "compared_at", "TIMESTAMP")
+    _create_product_index("ix_product_comparison_pending")
+
+
+# (version, description, function) - append new migrations at the end, never reorder.
+MIGRATIONS = [
+    (1, "add price_history.last_seen", _m001_add_price_history_last_seen),
+    (2, "compact unchanged price history into segments", _m002_compact_price_history),
+    (3, "add latest-price summary columns to product", _m003_add_product_price_summary),
+    (4, "backfill hourly and daily price rollups", _m004_backfill_price_rollups),
+    (5, "add indexes for history, alert and listing queries", _m005_add_hot_query_indexes),
+    (6, "add (sort column, id) indexes for the paginated product listing", _m006_add_listing_sort_indexes),
+    (7, "add product.scrape_status for background initial scrapes", _m007_add_product_scrape_status),
+    (8, "add product comparison status columns", _m008_add_product_comparison_state),
+]
+
+
+def rebuild_price_rollups():
+    """
+    Rebuilds the hourly/daily rollups from price history, one product at a time.
+    A change-only row fills every hourly bucket its run spans (see segment_rollup_points), so
+    rollups rebuilt after compaction (migration 2 runs before this backfill) still cover the run.
+    """
+    for model, _, _ in ROLLUP_RESOLUTIONS.values():
+        db.session.execute(delete(model))
+    product_ids = db.session.execute(select(PriceHistory.product_id).distinct()).scalars().all()
+    for product_id in product_ids:
+        history = db.session.execute(
+            select(PriceHistory.price, PriceHistory.timestamp, PriceHistory.last_seen)
+            .where(PriceHistory.product_id == product_id)
+        ).all()
+        points = []
+        for price, first_seen, last_seen in history:
+            points.extend(segment_rollup_points(product_id, price, first_seen, last_seen))
+        update_price_rollups(points)
+        db.session.commit()
+    print(f"MIGRATIONS: Rebuilt price rollups for {len(product_ids)} product(s).")
+
+
+def rebuild_product_summaries():
+    """
+    Recomputes Product.current_price, last_scraped_at, min/max and 24h change from history.
+    Used to backfill the summary; the batched writer keeps it current afterwards.
+    """
+    seen_until = func.coalesce(PriceHistory.last_seen, PriceHistory.timestamp)
+    stats = db.session.execute(
+        select(PriceHistory.product_id, func.min(PriceHistory.price), func.max(PriceHistory.price),
+               func.max(seen_until), func.max(PriceHistory.timestamp))
+        .group_by(PriceHistory.product_id)
+    ).all()
+    updates = []
+    for product_id, low, high, last_scraped_at, latest_start in stats:
+        current = price_at([product_id], latest_start)[product_id]
+        day_ago = price_at([product_id], last_scraped_at - datetime.timedelta(hours=24)).get(product_id, current)
+        updates.append({
+            "id": product_id, "current_price": current, "last_scraped_at": last_scraped_at,
+            "min_price": low, "max_price": high, "price_change_24h": round(current - day_ago, 2),
+        })
+    for i in range(0, len(updates), MIGRATION_BATCH_SIZE):
+        db.session.execute(update(Product), updates[i:i + MIGRATION_BATCH_SIZE])
+    print(f"MIGRATIONS: Rebuilt price summary for {len(updates)} product(s).")
+
+
+def compact_price_history():
+    """
+    Folds runs of identical consecutive prices into one row per run (change-only storage).
+    The first row of each run is kept and its last_seen extended to the end of the run; the rows
+    in between are deleted for good. Safe to run repeatedly. Returns the number of rows removed.
+    """
+    product_ids = db.session.execute(select(PriceHistory.product_id).distinct()).scalars().all()
+    removed_total = 0
+    for product_id in product_ids:
+        rows = db.session.execute(
+            select(PriceHistory.id, PriceHistory.price, PriceHistory.timestamp, PriceHistory.last_seen)
+            .where(PriceHistory.product_id == product_id)
+            .order_by(PriceHistory.timestamp.asc(), PriceHistory.id.asc())
+        ).all()
+
+        head_updates, redundant_ids = [], []
+        head = None
+        for row in rows:
+            row_until = row.last_seen or row.timestamp
+            if head is not None and round(row.price, 2) == round(head["price"], 2):
+                head["last_seen"] = max(head["last_seen"], row_until)
+                redundant_ids.append(row.id)
+                continue
+            head = {"id": row.id, "price": row.price, "last_seen": row_until, "old_last_seen": row.last_seen}
+            head_updates.append(head)
+
+        changed_heads = [{"id": h["id"], "last_seen": h["last_seen"]} for h in head_updates
+                         if h["last_seen"] != h["old_last_seen"]]
+        for i in range(0, len(changed_heads), MIGRATION_BATCH_SIZE):
+            db.session.execute(update(PriceHistory), changed_heads[i:i + MIGRATION_BATCH_SIZE])
+        for i in range(0, len(redundant_ids), MIGRATION_BATCH_SIZE):
+            db.session.execute(delete(PriceHistory).where(PriceHistory.id.in_(redundant_ids[i:i + MIGRATION_BATCH_SIZE])))
+        db.session.commit()
+        removed_total += len(redundant_ids)
+
+    print(f"MIGRATIONS: Compacted price history, removed {removed_total} redundant row(s).")
+    return removed_total
+
+
+# Columns whose storage type depends on PRICE_STORAGE_COMPACT.
+_ENCODED_PRICE_COLUMNS = {"price": "price", "timestamp": "time", "last_seen": "time"}
+
+
+def _price_history_stored_compact(connection=None):
+    columns = inspect(connection or db.session.connection()).get_columns(PriceHistory.__tablename__)
+    price_type = next(c["type"] for c in columns if c["name"] == "price")
+    return isinstance(price_type, Integer)
+
+
+def _encoding_conversion_sql(dialect_name, column_name, to_compact):
+    """SQL expression converting one stored column to the other encoding."""
+    kind = _ENCODED_PRICE_COLUMNS[column_name]
+    if kind == "price":
+        return f"CAST(ROUND({column_name} * 100) AS INTEGER)" if to_compact else f"{column_name} / 100.0"
+    if dialect_name == "postgresql":
+        if to_compact:
+            return f"FLOOR(EXTRACT(EPOCH FROM {column_name}))::bigint"
+        return f"to_timestamp({column_name}) AT TIME ZONE 'UTC'"
+    if to_compact:
+        return f"CAST(strftime('%s', {column_name}) AS INTEGER)"
+    return f"datetime({column_name}, 'unixepoch')"
+
+
+# Holds the history while the SQLite conversion copies it; only left behind by an interrupted
+# conversion from before the conversion ran in a single transaction.
+_OLD_ENCODING_TABLE = f"{PriceHistory.__tablename__}_old_encoding"
+
+
+def _rebuild_price_history_sqlite(connection, to_compact):
+    # SQLite can't change a column type in place: copy the rows into a fresh table.
+    table = PriceHistory.__tablename__
+    old = _OLD_ENCODING_TABLE
+    inspector = inspect(connection)
+    old_columns = [c["name"] for c in inspector.get_columns(table)]
+    index_names = [ix["name"] for ix in inspector.get_indexes(table)]
+
+    connection.exec_driver_sql(f"ALTER TABLE {table} RENAME TO {old}")
+    for index_name in index_names:
+        connection.exec_driver_sql(f"DROP INDEX {index_name}")
+    PriceHistory.__table__.create(connection)
+    columns = [c.name for c in PriceHistory.__table__.columns if c.name in old_columns]
+    select_list = ", ".join(
+        _encoding_conversion_sql("sqlite", name, to_compact) if name in _ENCODED_PRICE_COLUMNS else name
+        for name in columns
+    )
+    moved = connection.exec_driver_sql(
+        f"INSERT INTO {table} ({', '.join(columns)}) SELECT {select_list} FROM {old}"
+    ).rowcount
+    connection.exec_driver_sql(f"DROP TABLE {old}")
+    return moved
+
+
+def _begin_immediate(connection):
+    # Takes SQLite's write lock up front. Waits for another process's conversion (which holds
+    # the lock for as long as the copy takes) instead of failing after the busy timeout.
+    deadline = time.monotonic() + MIGRATION_LOCK_TIMEOUT_SECONDS
+    while True:
+        try:
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+            return
+        except OperationalError as e:
+            if "locked" not in str(e) or time.monotonic() > deadline:
+                raise
+            time.sleep(1)
+
+
+def _convert_price_history_sqlite(to_compact):
+    """
+    Rebuilds price_history in the other encoding in one transaction, on a connection of its own:
+    pysqlite would otherwise commit the RENAME/DROP/CREATE statements one by one, so a failure
+    halfway left the rows in the old-encoding table. The write lock is taken first and the
+    encoding checked again under it, so a second process doesn't convert the rows twice.
+    Returns False if another process converted the table meanwhile.
+    """
+    # With pysqlite's own transaction handling off, BEGIN/COMMIT below are the only ones.
+    with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        _begin_immediate(connection)
+        try:
+            if _price_history_stored_compact(connection) == to_compact:
+                connection.exec_driver_sql("ROLLBACK")
+                return False
+            _rebuild_price_history_sqlite(connection, to_compact)
+            connection.exec_driver_sql("COMMIT")
+        except BaseException:
+            if connection.connection.dbapi_connection.in_transaction:
+                connection.exec_driver_sql("ROLLBACK")
+            raise
+    return True
+
+
+def _refuse_interrupted_conversion():
+    if inspect(db.engine).has_table(_OLD_ENCODING_TABLE):
+        raise RuntimeError(
+            f"Table '{_OLD_ENCODING_TABLE}' exists: an earlier price history storage conversion was "
+            f"interrupted and the history is still in that table. Move it back (drop the new "
+            f"'{PriceHistory.__tablename__}' if it is empty, then rename '{_OLD_ENCODING_TABLE}' to "
+            f"'{PriceHistory.__tablename__}') before starting."
+        )
+
+
+def _alter_price_history_postgres(to_compact):
+    table = PriceHistory.__tablename__
+    dialect = db.session.get_bind().dialect
+    existing = {c["name"] for c in inspect(db.session.connection()).get_columns(table)}
+    alterations = [
+        f"ALTER COLUMN {name} TYPE {PriceHistory.__table__.c[name].type.compile(dialect=dialect)} "
+        f"USING {_encoding_conversion_sql('postgresql', name, to_compact)}"
+        for name in _ENCODED_PRICE_COLUMNS if name in existing
+    ]
+    db.session.execute(text(f"ALTER TABLE {table} {', '.join(alterations)}"))
+
+
+def ensure_price_history_encoding():
+    """
+    Converts stored price history to the encoding selected by PRICE_STORAGE_COMPACT
+    (integer paise / epoch seconds, or float / DateTime) if the table uses the other one.
+    Runs before the migrations, which read history through the model types.
+    """
+    if _price_history_stored_compact() == PRICE_STORAGE_COMPACT:
+        return
+    dialect_name = db.session.get_bind().dialect.name
+    if dialect_name == "postgresql":
+        db.session.execute(text(f"LOCK TABLE {PriceHistory.__tablename__} IN ACCESS EXCLUSIVE MODE"))
+        if _price_history_stored_compact() == PRICE_STORAGE_COMPACT:
+            db.session.rollback() # Converted by another process while we waited for the lock
+            return
+        if is_partitioned():
+            db.session.rollback()
+            raise RuntimeError("PRICE_STORAGE_COMPACT can't be changed on a partitioned price_history "
+                               "(timestamp is the partition key). Convert before enabling partitioning.")
+        _alter_price_history_postgres(PRICE_STORAGE_COMPACT)
+        db.session.commit()
+    else:
+        db.session.rollback() # End the session's read transaction; the conversion runs on its own connection
+        if not _convert_price_history_sqlite(PRICE_STORAGE_COMPACT):
+            return
+    encoding = "paise / epoch seconds" if PRICE_STORAGE_COMPACT else "float / DateTime"
+    print(f"MIGRATIONS: Converted price history storage to {encoding}.")
+
+
+# Key of the PostgreSQL advisory lock held while migrations run ("PPMG").
+_MIGRATION_ADVISORY_LOCK_KEY = 0x50504D47
+
+
+def _wait_for_lock_row():
+    # SQLite (and any other database): the lock is a row in schema_migrations_lock, whose primary key
+    # lets only one process insert it.
+    db.session.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations_lock (id INTEGER PRIMARY KEY, locked_at TIMESTAMP NOT NULL)"
+    ))
+    db.session.commit()
+    deadline = time.monotonic() + MIGRATION_LOCK_TIMEOUT_SECONDS
+    while True:
+        now = datetime.datetime.utcnow()
+        stale_before = now - datetime.timedelta(seconds=MIGRATION_LOCK_TIMEOUT_SECONDS)
+        try:
+            db.session.execute(text("INSERT INTO schema_migrations_lock (id, locked_at) VALUES (1, :t)"), {"t": now})
+            db.session.commit()
+            return
+        except IntegrityError:
+            db.session.rollback()
+            if db.session.execute(text("DELETE FROM schema_migrations_lock WHERE locked_at < :t"),
+                                  {"t": stale_before}).rowcount:
+                print("MIGRATIONS: Took over a migration lock left by a stopped process.")
+            db.session.commit()
+        except OperationalError as e: # SQLite without WAL: the holder's migration is writing right now
+            db.session.rollback()
+            if "locked" not in str(e):
+                raise
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Another process kept the migration lock for over {MIGRATION_LOCK_TIMEOUT_SECONDS} s.")
+        time.sleep(1)
+
+
+@contextlib.contextmanager
+def migration_lock():
+    """
+    Held while migrations run, so the web service and the worker starting together don't apply
+    the same migration twice. Yields a function to call between migrations (keeps a lock row fresh).
+    """
+    if db.session.get_bind().dialect.name == "postgresql":
+        # Session-level advisory lock on a connection of its own: survives the migrations' commits
+        # and is released by PostgreSQL if this process dies.
+        with db.engine.connect() as lock_connection:
+            lock_connection.execute(text("SELECT pg_advisory_lock(:k)"), {"k": _MIGRATION_ADVISORY_LOCK_KEY})
+            lock_connection.commit()
+            try:
+                yield lambda: None
+            finally:
+                lock_connection.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": _MIGRATION_ADVISORY_LOCK_KEY})
+                lock_connection.commit()
+        return
+
+    def heartbeat():
+        db.session.execute(text("UPDATE schema_migrations_lock SET locked_at = :t WHERE id = 1"),
+                           {"t": datetime.datetime.utcnow()})
+        db.session.commit()
+
+    _wait_for_lock_row()
+    try:
+        yield heartbeat
+    finally:
+        db.session.rollback()
+        db.session.execute(text("DELETE FROM schema_migrations_lock WHERE id = 1"))
+        db.session.commit()
+
+
+def _applied_versions():
+    return set(db.session.execute(text("SELECT version FROM schema_migrations")).scalars().all())
+
+
+def run_migrations():
+    """
+    Applies pending migrations in order. Must be called inside an app context, after db.create_all().
+    Pending migrations run under migration_lock(); the applied versions are read again once it is held.
+    """
+    db.session.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, description VARCHAR NOT NULL, applied_at TIMESTAMP NOT NULL)"
+    ))
+    db.session.commit()
+    if not {version for version, _, _ in MIGRATIONS} - _applied_versions():
+        return
+
+    with migration_lock() as heartbeat:
+        applied = _applied_versions() # Another process may have applied them while we waited
+        for version, description, migration in MIGRATIONS:
+            if version in applied:
+                continue
+            _apply_migration(version, description, migration)
+            heartbeat()
+
+
+def _apply_migration(version, description, migration):
+    print(f"MIGRATIONS: Applying {version}: {description}")
+    try:
+        migration()
+        db.session.execute(
+            text("INSERT INTO schema_migrations (version, description, applied_at) VALUES (:v, :d, :t)"),
+            {"v": version, "d": description, "t": datetime.datetime.utcnow()}
+        )
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        # The web service and the worker both run migrations on startup; if the other
+        # process recorded this version first, carry on instead of failing.
+        recorded = db.session.execute(
+            text("SELECT 1 FROM schema_migrations WHERE version = :v"), {"v": version}
+        ).first()
+        if recorded:
+            print(f"MIGRATIONS: Migration {version} was applied by another process.")
+            return
+        print(f"MIGRATIONS: Migration {version} failed: {e}")
+        raise
+
+
+def prepare_database():
+    """
+    Brings the schema up to date: creates missing tables, converts price history to the configured
+    storage encoding, applies pending migrations and, when enabled, partitions price_history. Called by both entry points (app.py and run_scheduler.py)
+    and by 'flask db-upgrade'; safe to run repeatedly and from both processes.
+    """
+    _refuse_interrupted_conversion()
+    db.create_all()
+    ensure_price_history_encoding()
+    run_migrations()
+    ensure_price_history_partitioning()
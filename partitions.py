@@ -0,0 +1,160 @@
+# partitions.py
+# Optional monthly range partitioning of price_history on PostgreSQL.
+# With PRICE_HISTORY_PARTITIONED=true and a PostgreSQL DATABASE_URL, price_history is converted
+# into a declaratively partitioned table (PARTITION BY RANGE (timestamp)), one partition per month.
+# Partitions are created PRICE_PARTITION_MONTHS_AHEAD months in advance, range queries on
+# 'timestamp' only touch the matching partitions, and retention can drop whole partitions.
+# SQLite deployments (and PostgreSQL without the flag) keep the plain single table.
+import datetime
+import os
+import re
+
+from sqlalchemy import text, bindparam
+
+from database import db, PriceHistory, PRICE_STORAGE_COMPACT
+
+PRICE_HISTORY_PARTITIONED = os.getenv("PRICE_HISTORY_PARTITIONED", "false").lower() in ("true", "1", "t")
+PRICE_PARTITION_MONTHS_AHEAD = int(os.getenv("PRICE_PARTITION_MONTHS_AHEAD", "3"))
+
+TABLE = PriceHistory.__tablename__
+DEFAULT_PARTITION = f"{TABLE}_default"
+_PARTITION_NAME_RE = re.compile(rf"^{TABLE}_p(\d{{4}})(\d{{2}})$")
+
+
+def partitioning_enabled():
+    return PRICE_HISTORY_PARTITIONED and db.engine.dialect.name == "postgresql"
+
+
+def _month_start(ts):
+    return datetime.datetime(ts.year, ts.month, 1)
+
+
+def _add_months(month_start, months):
+    month_index = month_start.month - 1 + months
+    return datetime.datetime(month_start.year + month_index // 12, month_index % 12 + 1, 1)
+
+
+def _bound(ts):
+    # Partition bound literal in the storage encoding of 'timestamp' (DateTime or epoch seconds).
+    if PRICE_STORAGE_COMPACT:
+        return str(PriceHistory.timestamp.type.process_bind_param(ts, None))
+    return f"'{ts.isoformat()}'"
+
+
+def partition_name(month_start):
+    return f"{TABLE}_p{month_start:%Y%m}"
+
+
+def is_partitioned():
+    return db.session.execute(text(
+        "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+        "WHERE c.relname = :table AND pg_table_is_visible(c.oid)"
+    ), {"table": TABLE}).first() is not None
+
+
+def list_price_partitions():
+    """Monthly partitions as (name, month_start, month_end), oldest first. The default partition is not included."""
+    names = db.session.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = :table AND pg_table_is_visible(p.oid)"
+    ), {"table": TABLE}).scalars().all()
+    partitions = []
+    for name in names:
+        match = _PARTITION_NAME_RE.match(name)
+        if match:
+            start = datetime.datetime(int(match.group(1)), int(match.group(2)), 1)
+            partitions.append((name, start, _add_months(start, 1)))
+    return sorted(partitions, key=lambda p: p[1])
+
+
+def _create_month_partition(month_start):
+    db.session.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {partition_name(month_start)} PARTITION OF {TABLE} "
+        f"FOR VALUES FROM ({_bound(month_start)}) TO ({_bound(_add_months(month_start, 1))})"
+    ))
+
+
+def ensure_partitions_ahead(now=None):
+    """Creates monthly partitions from the current month up to PRICE_PARTITION_MONTHS_AHEAD ahead."""
+    if not partitioning_enabled():
+        return 0
+    this_month = _month_start(now or datetime.datetime.utcnow())
+    for offset in range(PRICE_PARTITION_MONTHS_AHEAD + 1):
+        _create_month_partition(_add_months(this_month, offset))
+    db.session.commit()
+    return PRICE_PARTITION_MONTHS_AHEAD + 1
+
+
+def _convert_to_partitioned():
+    """
+    Rebuilds the existing plain price_history as a partitioned table in one transaction:
+    column definitions, the id sequence and secondary indexes carry over; the primary key
+    becomes (id, timestamp) because PostgreSQL requires the partition key in it.
+    """
+    old = f"{TABLE}_unpartitioned"
+    db.session.execute(text(f"LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE"))
+    if is_partitioned():
+        db.session.rollback() # Converted by another process while we waited for the lock
+        return
+
+    sequence = db.session.execute(text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": TABLE}).scalar()
+    index_defs = db.session.execute(text(
+        "SELECT indexname, indexdef FROM pg_indexes "
+        "WHERE tablename = :table AND schemaname = current_schema() AND indexname <> :pkey"
+    ), {"table": TABLE, "pkey": f"{TABLE}_pkey"}).all()
+
+    db.session.execute(text(f"ALTER TABLE {TABLE} RENAME TO {old}"))
+    db.session.execute(text(f"ALTER TABLE {old} RENAME CONSTRAINT {TABLE}_pkey TO {old}_pkey"))
+    for index_name, _ in index_defs:
+        db.session.execute(text(f"DROP INDEX {index_name}"))
+    if sequence:
+        db.session.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY NONE"))
+
+    db.session.execute(text(
+        f"CREATE TABLE {TABLE} (LIKE {old} INCLUDING DEFAULTS) PARTITION BY RANGE (timestamp)"
+    ))
+    db.session.execute(
+        text(f"UPDATE {old} SET timestamp = COALESCE(last_seen, :now) WHERE timestamp IS NULL")
+        .bindparams(bindparam("now", type_=PriceHistory.timestamp.type)),
+        {"now": datetime.datetime.utcnow()}
+    )
+    db.session.execute(text(f"ALTER TABLE {TABLE} ALTER COLUMN timestamp SET NOT NULL"))
+    db.session.execute(text(f"ALTER TABLE {TABLE} ADD PRIMARY KEY (id, timestamp)"))
+    db.session.execute(text(f"ALTER TABLE {TABLE} ADD FOREIGN KEY (product_id) REFERENCES product (id)"))
+    if sequence:
+        db.session.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {TABLE}.id"))
+    db.session.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT"))
+
+    oldest = db.session.execute(
+        text(f"SELECT min(timestamp) AS oldest FROM {old}").columns(oldest=PriceHistory.timestamp.type)
+    ).scalar()
+    month = _month_start(oldest or datetime.datetime.utcnow())
+    last_month = _add_months(_month_start(datetime.datetime.utcnow()), PRICE_PARTITION_MONTHS_AHEAD)
+    while month <= last_month:
+        _create_month_partition(month)
+        month = _add_months(month, 1)
+
+    moved = db.session.execute(text(f"INSERT INTO {TABLE} SELECT * FROM {old}")).rowcount
+    db.session.execute(text(f"DROP TABLE {old}"))
+    for _, index_def in index_defs:
+        db.session.execute(text(index_def)) # Captured before the rename, so it targets the new table
+    db.session.commit()
+    print(f"PARTITIONS: Converted {TABLE} to monthly partitions ({moved} row(s) moved).")
+
+
+def ensure_price_history_partitioning():
+    """Startup hook: converts price_history if partitioning is enabled, then creates upcoming partitions."""
+    if not partitioning_enabled():
+        return
+    if not is_partitioned():
+        _convert_to_partitioned()
+    ensure_partitions_ahead()
+
+
+def drop_price_partition(name):
+    """Detaches and drops one monthly partition (a catalog operation instead of a bulk DELETE)."""
+    db.session.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {name}"))
+    db.session.execute(text(f"DROP TABLE {name}"))
+    db.session.commit()
+    print(f"PARTITIONS: Dropped partition {name}.")
@@ -0,0 +1,333 @@
+# persist.py
+# Write-behind persist stage for the scheduler worker.
+# Scrape jobs hand their results to a shared PriceWriteBuffer instead of committing one row per
+# transaction. The buffer is flushed in a single transaction either when it reaches
+# PRICE_WRITE_BATCH_SIZE entries or on the periodic flush job (PRICE_FLUSH_INTERVAL_SECONDS),
+# so a refresh cycle costs a handful of round trips instead of several per product.
+import csv
+import datetime
+import io
+import os
+import threading
+
+from sqlalchemy import insert, update, select, func, and_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
+
+from database import db, Product, PriceHistory, Alert, PRICE_STORAGE_COMPACT
+from rollups import update_price_rollups
+
+PRICE_WRITE_BATCH_SIZE = int(os.getenv("PRICE_WRITE_BATCH_SIZE", "50"))
+PRICE_FLUSH_INTERVAL_SECONDS = int(os.getenv("PRICE_FLUSH_INTERVAL_SECONDS", "30"))
+# Change-only storage: a new history row is written only when the price differs from the
+# product's latest row; otherwise that row's last_seen is moved forward. Opt-in: turning it on also
+# compacts the existing history (migration 2), which discards the timestamps inside each run.
+PRICE_HISTORY_CHANGE_ONLY = os.getenv("PRICE_HISTORY_CHANGE_ONLY", "false").lower() in ("true", "1", "t")
+# A batch whose flush keeps failing with a transient error (e.g. a lost connection) is retried with
+# the next flushes at most this many times, then dropped so it can't hold up everything after it.
+PRICE_FLUSH_MAX_ATTEMPTS = int(os.getenv("PRICE_FLUSH_MAX_ATTEMPTS", "5"))
+# On PostgreSQL, batches at least this large are written with COPY instead of a multi-row INSERT.
+POSTGRES_COPY_MIN_ROWS = int(os.getenv("POSTGRES_COPY_MIN_ROWS", "200"))
+
+
+class PriceWriteBuffer:
+    """
+    Thread-safe buffer of pending writes: new price rows, product metadata fix-ups
+    and alert deactivations. flush() must be called inside a Flask app context.
+    """
+
+    def __init__(self, batch_size=PRICE_WRITE_BATCH_SIZE):
+        self.batch_size = max(1, batch_size)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._prices = []
+        self._product_updates = {}
+        self._alert_deactivations = set()
+        self._failed_attempts = 0 # Consecutive failed flushes of the requeued entries
+
+    def add_price(self, product_id, price, timestamp=None):
+        with self._lock:
+            self._prices.append({
+                "product_id": product_id,
+                "price": price,
+                "timestamp": timestamp or datetime.datetime.utcnow(),
+            })
+            return len(self._prices) >= self.batch_size
+
+    def update_product(self, product_id, **fields):
+        if not fields:
+            return
+        with self._lock:
+            self._product_updates.setdefault(product_id, {}).update(fields)
+
+    def deactivate_alert(self, alert_id):
+        with self._lock:
+            self._alert_deactivations.add(alert_id)
+
+    def is_alert_pending_deactivation(self, alert_id):
+        # Lets alert checks skip alerts that already fired but are not flushed yet.
+        with self._lock:
+            return alert_id in self._alert_deactivations
+
+    def _take(self):
+        with self._lock:
+            batch = (self._prices, self._product_updates, self._alert_deactivations)
+            self._prices, self._product_updates, self._alert_deactivations = [], {}, set()
+            return batch
+
+    def _requeue(self, prices, product_updates, alert_deactivations):
+        with self._lock:
+            self._prices = prices + self._prices
+            for product_id, fields in product_updates.items():
+                merged = dict(fields)
+                merged.update(self._product_updates.get(product_id, {}))
+                self._product_updates[product_id] = merged
+            self._alert_deactivations |= alert_deactivations
+
+    def flush(self):
+        """
+        Writes everything buffered so far in one transaction and returns the number of price rows written.
+        Entries of products deleted in the meantime are dropped. If the write fails with an integrity
+        error, the batch is written again product by product so only the offending product's entries are
+        dropped (retrying them can't succeed). After any other error it is put back for the next flush,
+        up to PRICE_FLUSH_MAX_ATTEMPTS times. Alert deactivations are never dropped: their alerts have
+        already sent their email and would fire again.
+        """
+        with self._flush_lock:
+            prices, product_updates, alert_deactivations = self._take()
+            if not prices and not product_updates and not alert_deactivations:
+                return 0
+            try:
+                prices, product_updates = _without_deleted_products(prices, product_updates)
+                _write_batch(prices, product_updates, alert_deactivations)
+            except (IntegrityError, StaleDataError) as e:
+                db.session.rollback()
+                self._failed_attempts = 0
+                print(f"PERSIST: Flush failed ({e}). Writing the batch product by product.")
+                return self._write_per_product(prices, product_updates, alert_deactivations)
+            except Exception as e:
+                db.session.rollback()
+                self._failed_attempts += 1
+                if self._failed_attempts >= PRICE_FLUSH_MAX_ATTEMPTS:
+                    self._failed_attempts = 0
+                    self._requeue([], {}, alert_deactivations)
+                    print(f"PERSIST: Flush failed ({e}) {PRICE_FLUSH_MAX_ATTEMPTS} times in a row. "
+                          f"Dropped {len(prices)} price row(s) and {len(product_updates)} product update(s); "
+                          f"kept the deactivation of alert(s) {sorted(alert_deactivations)} for the next flush.")
+                    return 0
+                self._requeue(prices, product_updates, alert_deactivations)
+                print(f"PERSIST: Flush failed ({e}). {len(prices)} price row(s) kept for the next flush "
+                      f"(attempt {self._failed_attempts}/{PRICE_FLUSH_MAX_ATTEMPTS}).")
+                return 0
+
+            self._failed_attempts = 0
+            print(f"PERSIST: Flushed {len(prices)} price row(s), {len(product_updates)} product update(s), "
+                  f"{len(alert_deactivations)} alert deactivation(s) in one transaction.")
+            return len(prices)
+
+    def _write_per_product(self, prices, product_updates, alert_deactivations):
+        # After an integrity error: alert deactivations first, then one transaction per product.
+        # Entries that fail again for a transient reason go back into the buffer.
+        if alert_deactivations:
+            try:
+                _write_batch([], {}, alert_deactivations)
+            except Exception as e:
+                db.session.rollback()
+                self._requeue([], {}, alert_deactivations)
+                print(f"PERSIST: Deactivating alert(s) {sorted(alert_deactivations)} failed ({e}); kept for the next flush.")
+        written, dropped = 0, []
+        for product_id in dict.fromkeys([row["product_id"] for row in prices] + list(product_updates)):
+            rows = [row for row in prices if row["product_id"] == product_id]
+            updates = {product_id: product_updates[product_id]} if product_id in product_updates else {}
+            try:
+                _write_batch(rows, updates, set())
+                written += len(rows)
+            except (IntegrityError, StaleDataError) as e:
+                db.session.rollback()
+                dropped.append(product_id)
+                print(f"PERSIST: Dropped the buffered writes of Product ID {product_id} ({len(rows)} price row(s)): {e}")
+            except Exception as e:
+                db.session.rollback()
+                self._requeue(rows, updates, set())
+                print(f"PERSIST: Writing Product ID {product_id} failed ({e}); kept for the next flush.")
+        print(f"PERSIST: Flushed {written} price row(s) product by product; dropped the entries of product(s) {dropped}.")
+        return written
+
+
+def _write_batch(prices, product_updates, alert_deactivations):
+    """Writes prices (with summaries and rollups), product updates and alert deactivations, and commits."""
+    if prices:
+        _write_price_rows(prices)
+        _update_product_summaries(prices)
+        update_price_rollups(prices)
+    if product_updates:
+        db.session.execute(
+            update(Product),
+            [dict(fields, id=product_id) for product_id, fields in product_updates.items()]
+        )
+    if alert_deactivations:
+        db.session.execute(
+            update(Alert).where(Alert.id.in_(alert_deactivations)).values(is_active=False)
+        )
+    db.session.commit()
+
+
+def _without_deleted_products(prices, product_updates):
+    """The buffered prices and product updates minus those of products that no longer exist."""
+    product_ids = {row["product_id"] for row in prices} | product_updates.keys()
+    if not product_ids:
+        return prices, product_updates
+    existing = set(db.session.execute(select(Product.id).where(Product.id.in_(product_ids))).scalars())
+    if len(existing) == len(product_ids):
+        return prices, product_updates
+    print(f"PERSIST: Dropping buffered writes of deleted product(s) {sorted(product_ids - existing)}.")
+    return ([row for row in prices if row["product_id"] in existing],
+            {product_id: fields for product_id, fields in product_updates.items() if product_id in existing})
+
+
+def _latest_segments(product_ids):
+    """Latest history row (id, price) per product, fetched in one query."""
+    latest_ids = (
+        select(func.max(PriceHistory.id).label("id"))
+        .where(PriceHistory.product_id.in_(product_ids))
+        .group_by(PriceHistory.product_id)
+        .scalar_subquery()
+    )
+    rows = db.session.execute(
+        select(PriceHistory.id, PriceHistory.product_id, PriceHistory.price)
+        .where(PriceHistory.id.in_(latest_ids))
+    ).all()
+    return {row.product_id: {"id": row.id, "price": row.price} for row in rows}
+
+
+def _split_unchanged_prices(rows):
+    """
+    For change-only storage: returns (rows to insert, last_seen updates for existing rows).
+    A scrape whose price equals the product's current segment only extends that segment.
+    """
+    current = _latest_segments({row["product_id"] for row in rows})
+    inserts, extends = [], {}
+    for row in sorted(rows, key=lambda r: r["timestamp"]):
+        segment = current.get(row["product_id"])
+        if segment is not None and round(segment["price"], 2) == round(row["price"], 2):
+            if "id" in segment:
+                extends[segment["id"]] = row["timestamp"]
+            else:
+                segment["row"]["last_seen"] = row["timestamp"] # Segment started earlier in this batch
+            continue
+        new_row = dict(row, last_seen=row["timestamp"])
+        inserts.append(new_row)
+        current[row["product_id"]] = {"price": row["price"], "row": new_row}
+    return inserts, [{"id": seg_id, "last_seen": ts} for seg_id, ts in extends.items()]
+
+
+def _prices_at_timestamps(timestamp_subquery):
+    rows = db.session.execute(
+        select(PriceHistory.product_id, PriceHistory.price)
+        .join(timestamp_subquery, and_(
+            PriceHistory.product_id == timestamp_subquery.c.product_id,
+            PriceHistory.timestamp == timestamp_subquery.c.ts
+        ))
+    ).all()
+    return {row.product_id: row.price for row in rows}
+
+
+def price_at(product_ids, cutoff):
+    """
+    Price in effect at 'cutoff' for each product (latest row starting at or before it).
+    Products first seen after the cutoff fall back to their earliest recorded price.
+    """
+    product_ids = set(product_ids)
+    before_cutoff = (
+        select(PriceHistory.product_id, func.max(PriceHistory.timestamp).label("ts"))
+        .where(PriceHistory.product_id.in_(product_ids), PriceHistory.timestamp <= cutoff)
+        .group_by(PriceHistory.product_id)
+        .subquery()
+    )
+    prices = _prices_at_timestamps(before_cutoff)
+    missing = product_ids - prices.keys()
+    if missing:
+        earliest = (
+            select(PriceHistory.product_id, func.min(PriceHistory.timestamp).label("ts"))
+            .where(PriceHistory.product_id.in_(missing))
+            .group_by(PriceHistory.product_id)
+            .subquery()
+        )
+        prices.update(_prices_at_timestamps(earliest))
+    return prices
+
+
+def _update_product_summaries(rows):
+    """Refreshes Product.current_price and friends for every product touched by this batch."""
+    latest, lows, highs = {}, {}, {}
+    for row in rows:
+        pid = row["product_id"]
+        if pid not in latest or row["timestamp"] >= latest[pid]["timestamp"]:
+            latest[pid] = row
+        lows[pid] = min(lows.get(pid, row["price"]), row["price"])
+        highs[pid] = max(highs.get(pid, row["price"]), row["price"])
+
+    existing = db.session.execute(
+        select(Product.id, Product.min_price, Product.max_price).where(Product.id.in_(latest.keys()))
+    ).all()
+    cutoff = max(row["timestamp"] for row in rows) - datetime.timedelta(hours=24)
+    day_ago = price_at(latest.keys(), cutoff)
+
+    updates = []
+    for product in existing:
+        row = latest[product.id]
+        min_candidates = [p for p in (product.min_price, lows[product.id]) if p is not None]
+        max_candidates = [p for p in (product.max_price, highs[product.id]) if p is not None]
+        old_price = day_ago.get(product.id)
+        updates.append({
+            "id": product.id,
+            "current_price": row["price"],
+            "last_scraped_at": row["timestamp"],
+            "min_price": min(min_candidates),
+            "max_price": max(max_candidates),
+            "price_change_24h": round(row["price"] - old_price, 2) if old_price is not None else 0.0,
+        })
+    if updates:
+        db.session.execute(update(Product), updates)
+
+
+def _write_price_rows(rows):
+    if PRICE_HISTORY_CHANGE_ONLY:
+        rows, extends = _split_unchanged_prices(rows)
+        if extends:
+            db.session.execute(update(PriceHistory), extends)
+    else:
+        rows = [dict(row, last_seen=row["timestamp"]) for row in rows]
+    if not rows:
+        return
+    if db.session.get_bind().dialect.name == "postgresql" and len(rows) >= POSTGRES_COPY_MIN_ROWS:
+        _copy_price_rows_postgres(rows)
+    else:
+        # executemany; SQLAlchemy batches this into multi-row INSERT statements where supported.
+        db.session.execute(insert(PriceHistory), rows)
+
+
+def _copy_value(column_name, value):
+    # COPY bypasses SQLAlchemy's type processing, so apply the compact encoding here when enabled.
+    if PRICE_STORAGE_COMPACT:
+        return PriceHistory.__table__.c[column_name].type.process_bind_param(value, None)
+    return value.isoformat() if isinstance(value, datetime.datetime) else value
+
+
+def _copy_price_rows_postgres(rows):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for row in rows:
+        writer.writerow([row["product_id"]] + [_copy_value(name, row[name]) for name in ("price", "timestamp", "last_seen")])
+    buf.seek(0)
+    # Use the session's own DBAPI connection so the COPY joins the flush transaction.
+    dbapi_connection = db.session.connection().connection.driver_connection
+    with dbapi_connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {PriceHistory.__tablename__} (product_id, price, timestamp, last_seen) FROM STDIN WITH (FORMAT csv)",
+            buf
+        )
+
+
+# Shared instance used by the scheduler jobs in this process.
+price_write_buffer = PriceWriteBuffer()
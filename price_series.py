@@ -0,0 +1,111 @@
+# price_series.py
+# Column-oriented price series for the price API. A series is a dict of parallel lists: 't' (naive UTC
+# datetimes) and 'p' (prices), plus 'o'/'h'/'l'/'n' (open/high/low/count) for rollup buckets. It goes
+# from the query through downsampling to the encoder without building a dict or an ISO string per point.
+# Response formats (?format=):
+#   - points  : [{"timestamp": iso, "price": p, ...}, ...], the original format and the default.
+#   - columns : {"t": [epoch seconds, ...], "p": [...], ...}
+#   - binary  : application/octet-stream; every column (order in X-Price-Columns) as little-endian
+#               float64, 't' in epoch seconds, one after the other. Readable with a Float64Array.
+#   - msgpack : the 'columns' object as MessagePack (only if msgpack is installed).
+# JSON is encoded with orjson when it is installed, else the stdlib encoder. Bodies are produced in chunks
+# so that large series can be streamed instead of being built as one string.
+import datetime
+import json
+import sys
+from array import array
+
+try:
+    import orjson
+except ImportError: # Optional dependency
+    orjson = None
+
+try:
+    import msgpack
+except ImportError: # Optional dependency
+    msgpack = None
+
+SERIES_FORMATS = ("points", "columns", "binary") + (("msgpack",) if msgpack is not None else ())
+
+# Column -> key in the 'points' format, in output order.
+_POINT_KEYS = {"p": "price", "o": "open", "h": "high", "l": "low", "n": "count"}
+_CHUNK_SIZE = 4096 # Points per encoded chunk
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def new_series(rollup=False):
+    return {column: [] for column in (("t", "p", "o", "h", "l", "n") if rollup else ("t", "p"))}
+
+
+def series_length(series):
+    return len(series["t"])
+
+
+def epoch_seconds(timestamps):
+    # Whole seconds as ints (rollup buckets, compact storage), sub-second timestamps as floats.
+    seconds = [(t - _EPOCH).total_seconds() for t in timestamps]
+    return [int(s) if s.is_integer() else s for s in seconds]
+
+
+def _dumps(value):
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":")).encode()
+
+
+def _json_list_chunks(values):
+    # "[...]" of the values, encoded _CHUNK_SIZE at a time.
+    yield b"["
+    for start in range(0, len(values), _CHUNK_SIZE):
+        if start:
+            yield b","
+        yield _dumps(values[start:start + _CHUNK_SIZE])[1:-1]
+    yield b"]"
+
+
+def _points_chunks(series):
+    keys = [(column, _POINT_KEYS[column]) for column in series if column != "t"]
+    timestamps = series["t"]
+    yield b"["
+    for start in range(0, len(timestamps), _CHUNK_SIZE):
+        end = min(start + _CHUNK_SIZE, len(timestamps))
+        points = [{"timestamp": timestamps[i].isoformat(), **{key: series[column][i] for column, key in keys}}
+                  for i in range(start, end)]
+        if start:
+            yield b","
+        yield _dumps(points)[1:-1]
+    yield b"]"
+
+
+def _columns_chunks(series):
+    yield b"{"
+    for position, (column, values) in enumerate(series.items()):
+        yield (b',"' if position else b'"') + column.encode() + b'":'
+        yield from _json_list_chunks(epoch_seconds(values) if column == "t" else values)
+    yield b"}"
+
+
+def _binary_chunks(series):
+    for column, values in series.items():
+        packed = array("d", epoch_seconds(values) if column == "t" else values)
+        if sys.byteorder == "big":
+            packed.byteswap()
+        yield packed.tobytes()
+
+
+def _msgpack_chunks(series):
+    columns = {column: epoch_seconds(values) if column == "t" else values for column, values in series.items()}
+    yield msgpack.packb(columns)
+
+
+def encode_series(series, series_format="points"):
+    """(iterator of body chunks, mimetype, extra headers) of the series in the given format."""
+    if series_format not in SERIES_FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(SERIES_FORMATS)}")
+    if series_format == "points":
+        return _points_chunks(series), "application/json", {}
+    if series_format == "columns":
+        return _columns_chunks(series), "application/json", {}
+    if series_format == "msgpack":
+        return _msgpack_chunks(series), "application/msgpack", {}
+    return _binary_chunks(series), "application/octet-stream", {"X-Price-Columns": ",".join(series)}
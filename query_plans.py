@@ -0,0 +1,88 @@
+# query_plans.py
+# EXPLAINs the hot queries of app.py / scheduler.py / persist.py against the configured database
+# and reports any that would fall back to a full table scan. Run with 'flask check-query-plans'
+# after schema changes; it exits non-zero when a plan regresses.
+import datetime
+import re
+
+from sqlalchemy import select, func, true, text
+
+from database import db, Product, PriceHistory, Alert, PriceRollupHourly, ComparisonResult, PRODUCT_PENDING, COMPARISON_PENDING
+from listing import product_listing_query, PRODUCT_SORTS, LISTING_PAGE_SIZE
+
+
+def hot_queries():
+    """(description, statement) pairs mirroring the queries the app runs on every request or scrape."""
+    since = datetime.datetime(2025, 1, 1)
+    until = since + datetime.timedelta(days=1)
+    sample_positions = {"newest": (since, 1), "name": ("m", 1)}
+    listing_pages = [
+        (f"product listing page, sort={sort}",
+         product_listing_query(sort, sample_positions.get(sort, (100.0, 1))).limit(LISTING_PAGE_SIZE + 1))
+        for sort in PRODUCT_SORTS
+    ]
+    return listing_pages + [
+        ("price history of one product in a time range",
+         select(PriceHistory).where(PriceHistory.product_id == 1, PriceHistory.timestamp >= since,
+                                    PriceHistory.timestamp <= until).order_by(PriceHistory.timestamp.asc())),
+        ("segment in effect at the start of a range",
+         select(PriceHistory).where(PriceHistory.product_id == 1, PriceHistory.timestamp < since)
+         .order_by(PriceHistory.timestamp.desc()).limit(1)),
+        ("latest history row per product (batched writer)",
+         select(func.max(PriceHistory.id)).where(PriceHistory.product_id.in_([1, 2, 3]))
+         .group_by(PriceHistory.product_id)),
+        ("active alerts of one product",
+         select(Alert).where(Alert.product_id == 1, Alert.is_active == true())),
+        ("products waiting for their first scrape (worker poll)",
+         select(Product.id).where(PRODUCT_PENDING).order_by(Product.id.asc()).limit(100)),
+        ("requested comparisons (worker poll)",
+         select(Product.id).where(COMPARISON_PENDING).order_by(Product.id.asc()).limit(20)),
+        ("stored comparison results of one product",
+         select(ComparisonResult).where(ComparisonResult.product_id == 1).order_by(ComparisonResult.platform)),
+        ("hourly rollups of one product in a time range",
+         select(PriceRollupHourly).where(PriceRollupHourly.product_id == 1,
+                                         PriceRollupHourly.bucket_start >= since)),
+    ]
+
+
+def _explain(connection, statement):
+    dialect = connection.dialect
+    compiled = statement.compile(dialect=dialect, compile_kwargs={"render_postcompile": True})
+    params = compiled.construct_params()
+    if compiled.positiontup:
+        params = tuple(params[name] for name in compiled.positiontup)
+    prefix = "EXPLAIN QUERY PLAN " if dialect.name == "sqlite" else "EXPLAIN "
+    rows = connection.exec_driver_sql(prefix + str(compiled), params).all()
+    # SQLite returns (id, parent, notused, detail); PostgreSQL one text column per plan line.
+    return [row[-1] for row in rows]
+
+
+def _full_scans(dialect_name, plan_lines):
+    if dialect_name == "sqlite":
+        return [line for line in plan_lines if re.match(r"^SCAN \w+$", line.strip())]
+    return [line for line in plan_lines if "Seq Scan" in line]
+
+
+def check_query_plans():
+    """
+    Prints the plan of every hot query and returns False if any of them needs a full scan.
+    On PostgreSQL sequential scans are disabled for the check, so a tiny table doesn't hide a missing index.
+    """
+    connection = db.session.connection()
+    dialect_name = connection.dialect.name
+    if dialect_name == "postgresql":
+        connection.execute(text("SET LOCAL enable_seqscan = off"))
+
+    ok = True
+    try:
+        for description, statement in hot_queries():
+            plan = _explain(connection, statement)
+            scans = _full_scans(dialect_name, plan)
+            status = "FULL SCAN" if scans else "ok"
+            print(f"QUERY_PLANS: [{status}] {description}")
+            for line in plan:
+                print(f"QUERY_PLANS:     {line}")
+            ok = ok and not scans
+    finally:
+        db.session.rollback()
+    return ok
@@ -0,0 +1,85 @@
+# replicas.py
+# Optional read replicas for the read-only pages and APIs.
+# DATABASE_REPLICA_URLS is a comma-separated list of database URLs (PostgreSQL streaming replicas,
+# or for local testing another SQLite file). Each one becomes a Flask-SQLAlchemy bind
+# ('replica_0', 'replica_1', ...). Views decorated with @replica_read run their queries on one of
+# them; everything else, including the scheduler worker, keeps using the primary. A client that
+# just wrote something (tracked a product, added an alert) reads from the primary for
+# READ_YOUR_WRITES_SECONDS so it doesn't miss its own change while the replica catches up.
+import functools
+import os
+import random
+import time
+from contextlib import contextmanager
+
+from flask import g, session
+
+from database import db
+
+READ_YOUR_WRITES_SECONDS = int(os.getenv("READ_YOUR_WRITES_SECONDS", "10"))
+
+_REPLICA_PREFIX = "replica_"
+_LAST_WRITE_KEY = "db_last_write_at"
+
+
+def normalize_database_url(url):
+    # Render (and Heroku) hand out postgres:// URLs, which SQLAlchemy no longer accepts.
+    if url.startswith("postgres://"):
+        return url.replace("postgres://", "postgresql://", 1)
+    return url
+
+
+def replica_urls():
+    return [normalize_database_url(url.strip())
+            for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+
+
+def configure_replicas(app):
+    """Registers the replica URLs as SQLAlchemy binds. Call before db.init_app(app)."""
+    urls = replica_urls()
+    if urls:
+        binds = app.config.setdefault("SQLALCHEMY_BINDS", {})
+        for index, url in enumerate(urls):
+            binds[f"{_REPLICA_PREFIX}{index}"] = url
+        print(f"REPLICAS: {len(urls)} read replica(s) configured.")
+    return len(urls)
+
+
+def replica_bind_keys():
+    return [key for key in db.engines if key and key.startswith(_REPLICA_PREFIX)]
+
+
+def mark_recent_write():
+    """Called after a user-visible write: this client's next reads go to the primary for a while."""
+    session[_LAST_WRITE_KEY] = time.time()
+
+
+def _wrote_recently():
+    last_write = session.get(_LAST_WRITE_KEY)
+    return last_write is not None and time.time() - last_write < READ_YOUR_WRITES_SECONDS
+
+
+@contextmanager
+def read_from_replica():
+    """
+    Runs the enclosed queries on a replica (if any are configured). Usable for analytics and other
+    read-only code outside views.
+    """
+    keys = replica_bind_keys()
+    previous = g.get("db_replica_bind")
+    g.db_replica_bind = random.choice(keys) if keys else None
+    try:
+        yield g.db_replica_bind
+    finally:
+        g.db_replica_bind = previous
+
+
+def replica_read(view):
+    """View decorator: serve this read-only route from a replica unless the client wrote recently."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if _wrote_recently():
+            return view(*args, **kwargs)
+        with read_from_replica():
+            return view(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,84 @@
+# response_cache.py
+# In-process cache (LRU + TTL) of rendered pages, product card fragments and price-series JSON in the
+# web service. Entries are keyed by the same version stamps as the HTTP validators (see http_cache.py):
+# values of the Product summary columns that the route reads anyway with one cheap query. When the
+# worker persists a new price, last_scraped_at/current_price move, the next request computes a new key,
+# and the old entry is never hit again; LRU eviction and the TTL reclaim it. No cross-process
+# notification is needed, so it works the same with several gunicorn workers.
+# The cache is bounded by the total size of the stored bodies (RESPONSE_CACHE_MAX_MB); hit and miss
+# counters per kind of entry are served at /api/metrics/cache.
+import os
+import threading
+from collections import Counter
+
+from cachetools import TTLCache
+
+RESPONSE_CACHE_MAX_MB = float(os.getenv("RESPONSE_CACHE_MAX_MB", "32")) # 0 disables the cache
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "600"))
+
+
+def _entry_size(value):
+    # Values are rendered text/bytes, or (body, headers) pairs for API responses.
+    return len(value[0]) if isinstance(value, tuple) else len(value)
+
+
+class ResponseCache:
+    def __init__(self, max_bytes, ttl_seconds):
+        self._entries = None
+        if max_bytes > 0 and ttl_seconds > 0:
+            self._entries = TTLCache(maxsize=max_bytes, ttl=ttl_seconds, getsizeof=_entry_size)
+        self._lock = threading.Lock()
+        self._hits = Counter()
+        self._misses = Counter()
+
+    @property
+    def enabled(self):
+        return self._entries is not None
+
+    def get(self, kind, key):
+        """The cached value for (kind, key), or None. Counts a hit or a miss."""
+        if self._entries is None:
+            return None
+        with self._lock:
+            value = self._entries.get((kind, key))
+            if value is None:
+                self._misses[kind] += 1
+            else:
+                self._hits[kind] += 1
+            return value
+
+    def put(self, kind, key, value):
+        if self._entries is None:
+            return
+        with self._lock:
+            try:
+                self._entries[(kind, key)] = value
+            except ValueError: # Larger than the whole cache
+                pass
+
+    def get_or_build(self, kind, key, build):
+        """The cached value for (kind, key), or the result of build(), which is then stored under it."""
+        value = self.get(kind, key)
+        if value is None:
+            # Built outside the lock so a slow render doesn't block other requests; two concurrent
+            # misses of the same key both build it and the second store wins.
+            value = build()
+            self.put(kind, key, value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            kinds = sorted(set(self._hits) | set(self._misses))
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries) if self._entries is not None else 0,
+                "size_bytes": self._entries.currsize if self._entries is not None else 0,
+                "max_bytes": self._entries.maxsize if self._entries is not None else 0,
+                "ttl_seconds": RESPONSE_CACHE_TTL_SECONDS,
+                "hits": sum(self._hits.values()),
+                "misses": sum(self._misses.values()),
+                "by_kind": {kind: {"hits": self._hits[kind], "misses": self._misses[kind]} for kind in kinds},
+            }
+
+
+response_cache = ResponseCache(int(RESPONSE_CACHE_MAX_MB * 1024 * 1024), RESPONSE_CACHE_TTL_SECONDS)
@@ -0,0 +1,159 @@
+# retention.py
+# Retention policy for price data, enforced by a periodic compaction job in the worker:
+#   - raw PriceHistory rows are kept for PRICE_RAW_RETENTION_DAYS (0 = forever, the default),
+#   - hourly rollups for PRICE_HOURLY_RETENTION_DAYS,
+#   - daily rollups for PRICE_DAILY_RETENTION_DAYS (0 = forever).
+# Old raw rows are folded into the rollups (if they aren't already) and deleted in small batches,
+# each in its own short transaction, so the job never holds long locks. When price_history is
+# partitioned (see partitions.py), expired months are dropped as whole partitions first.
+import datetime
+import os
+import time
+
+from sqlalchemy import select, delete, func, tuple_, text, bindparam
+
+from database import db, PriceHistory, PriceRollupHourly, PriceRollupDaily
+from rollups import hour_bucket, update_price_rollups, segment_rollup_points
+from partitions import partitioning_enabled, list_price_partitions, drop_price_partition
+
+PRICE_RAW_RETENTION_DAYS = int(os.getenv("PRICE_RAW_RETENTION_DAYS", "0"))
+PRICE_HOURLY_RETENTION_DAYS = int(os.getenv("PRICE_HOURLY_RETENTION_DAYS", "365"))
+PRICE_DAILY_RETENTION_DAYS = int(os.getenv("PRICE_DAILY_RETENTION_DAYS", "0"))
+PRICE_RETENTION_INTERVAL_HOURS = int(os.getenv("PRICE_RETENTION_INTERVAL_HOURS", "6"))
+PRICE_RETENTION_BATCH_SIZE = int(os.getenv("PRICE_RETENTION_BATCH_SIZE", "1000"))
+# Pause between batches so other writers get the table in between.
+PRICE_RETENTION_BATCH_PAUSE_SECONDS = float(os.getenv("PRICE_RETENTION_BATCH_PAUSE_SECONDS", "0.1"))
+
+
+def retention_cutoff(days, now=None):
+    """Oldest timestamp still retained for a retention period in days, or None if kept forever."""
+    if days <= 0:
+        return None
+    return (now or datetime.datetime.utcnow()) - datetime.timedelta(days=days)
+
+
+def _fold_rows_missing_from_rollups(rows):
+    """Folds raw rows whose hourly bucket doesn't exist yet (e.g. written before rollups existed)."""
+    keys = {(row.product_id, hour_bucket(row.timestamp)) for row in rows}
+    covered = set(db.session.execute(
+        select(PriceRollupHourly.product_id, PriceRollupHourly.bucket_start)
+        .where(tuple_(PriceRollupHourly.product_id, PriceRollupHourly.bucket_start).in_(list(keys)))
+    ).all())
+    missing = [row for row in rows if (row.product_id, hour_bucket(row.timestamp)) not in covered]
+    points = []
+    for row in missing:
+        points.extend(segment_rollup_points(row.product_id, row.price, row.timestamp, row.last_seen))
+    update_price_rollups(points)
+    return len(missing)
+
+
+def _purge_raw_history(cutoff):
+    # The newest row of each product is always kept: change-only storage extends it on the next scrape.
+    # Looked up once per run; rows written meanwhile are newer than the cutoff anyway.
+    latest_ids = set(db.session.execute(
+        select(func.max(PriceHistory.id)).group_by(PriceHistory.product_id)
+    ).scalars())
+    seen_until = func.coalesce(PriceHistory.last_seen, PriceHistory.timestamp)
+    deleted = folded = last_id = 0
+    while True:
+        batch = db.session.execute(
+            select(PriceHistory.id, PriceHistory.product_id, PriceHistory.price,
+                   PriceHistory.timestamp, PriceHistory.last_seen)
+            .where(seen_until < cutoff, PriceHistory.id > last_id)
+            .order_by(PriceHistory.id.asc())
+            .limit(PRICE_RETENTION_BATCH_SIZE)
+        ).all()
+        if not batch:
+            break
+        last_id = batch[-1].id
+        rows = [row for row in batch if row.id not in latest_ids]
+        if not rows:
+            continue
+        folded += _fold_rows_missing_from_rollups(rows)
+        db.session.execute(delete(PriceHistory).where(PriceHistory.id.in_([row.id for row in rows])))
+        db.session.commit()
+        deleted += len(rows)
+        time.sleep(PRICE_RETENTION_BATCH_PAUSE_SECONDS)
+    return deleted, folded
+
+
+def _drop_expired_partitions(cutoff):
+    """
+    On a partitioned price_history, drops monthly partitions that end before the cutoff.
+    A partition still holding a row that must be kept (seen after the cutoff, or the newest row
+    of its product) is left to the batched DELETE path instead.
+    """
+    dropped = folded = 0
+    for name, month_start, month_end in list_price_partitions():
+        if month_end > cutoff:
+            break
+        must_keep_query = text(
+            f"SELECT 1 FROM {name} p WHERE COALESCE(p.last_seen, p.timestamp) >= :cutoff "
+            f"OR NOT EXISTS (SELECT 1 FROM {PriceHistory.__tablename__} n "
+            f"WHERE n.product_id = p.product_id AND n.timestamp >= :month_end) LIMIT 1"
+        ).bindparams(bindparam("cutoff", type_=PriceHistory.timestamp.type),
+                     bindparam("month_end", type_=PriceHistory.timestamp.type))
+        must_keep = db.session.execute(must_keep_query, {"cutoff": cutoff, "month_end": month_end}).first()
+        if must_keep:
+            continue
+        last_id = 0
+        while True:
+            rows = db.session.execute(
+                select(PriceHistory.id, PriceHistory.product_id, PriceHistory.price,
+                       PriceHistory.timestamp, PriceHistory.last_seen)
+                .where(PriceHistory.timestamp >= month_start, PriceHistory.timestamp < month_end,
+                       PriceHistory.id > last_id)
+                .order_by(PriceHistory.id.asc())
+                .limit(PRICE_RETENTION_BATCH_SIZE)
+            ).all()
+            if not rows:
+                break
+            folded += _fold_rows_missing_from_rollups(rows)
+            db.session.commit()
+            last_id = rows[-1].id
+        drop_price_partition(name)
+        dropped += 1
+    return dropped, folded
+
+
+def _purge_rollups(model, cutoff):
+    deleted = 0
+    while True:
+        keys = [tuple(key) for key in db.session.execute(
+            select(model.product_id, model.bucket_start)
+            .where(model.bucket_start < cutoff)
+            .limit(PRICE_RETENTION_BATCH_SIZE)
+        ).all()]
+        if not keys:
+            break
+        db.session.execute(delete(model).where(tuple_(model.product_id, model.bucket_start).in_(keys)))
+        db.session.commit()
+        deleted += len(keys)
+        time.sleep(PRICE_RETENTION_BATCH_PAUSE_SECONDS)
+    return deleted
+
+
+def enforce_price_retention(now=None):
+    """
+    Applies the retention policy. Must be called inside an app context.
+    Returns a dict with the number of rows removed per table.
+    """
+    now = now or datetime.datetime.utcnow()
+    summary = {"raw_deleted": 0, "raw_folded": 0, "partitions_dropped": 0, "hourly_deleted": 0, "daily_deleted": 0}
+
+    raw_cutoff = retention_cutoff(PRICE_RAW_RETENTION_DAYS, now)
+    if raw_cutoff:
+        if partitioning_enabled():
+            summary["partitions_dropped"], summary["raw_folded"] = _drop_expired_partitions(raw_cutoff)
+        deleted, folded = _purge_raw_history(raw_cutoff)
+        summary["raw_deleted"] = deleted
+        summary["raw_folded"] += folded
+    hourly_cutoff = retention_cutoff(PRICE_HOURLY_RETENTION_DAYS, now)
+    if hourly_cutoff:
+        summary["hourly_deleted"] = _purge_rollups(PriceRollupHourly, hourly_cutoff)
+    daily_cutoff = retention_cutoff(PRICE_DAILY_RETENTION_DAYS, now)
+    if daily_cutoff:
+        summary["daily_deleted"] = _purge_rollups(PriceRollupDaily, daily_cutoff)
+
+    print(f"RETENTION: {summary}")
+    return summary
@@ -0,0 +1,113 @@
+# rollups.py
+# Hourly and daily OHLC rollups of price history, updated incrementally as prices arrive.
+# Long-range charts read these instead of the raw series, so a year-long chart costs a few
+# hundred rows instead of ~17k.
+import datetime
+
+from sqlalchemy import select, insert, update, tuple_
+
+from database import db, PriceRollupHourly, PriceRollupDaily
+from price_series import new_series
+
+
+def hour_bucket(ts):
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+def day_bucket(ts):
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+# (model, bucket function, bucket length) per resolution name
+ROLLUP_RESOLUTIONS = {
+    "hour": (PriceRollupHourly, hour_bucket, datetime.timedelta(hours=1)),
+    "day": (PriceRollupDaily, day_bucket, datetime.timedelta(days=1)),
+}
+
+
+def _fold(bucket, price, ts):
+    if ts < bucket["first_at"]:
+        bucket["open"], bucket["first_at"] = price, ts
+    if ts >= bucket["last_at"]:
+        bucket["close"], bucket["last_at"] = price, ts
+    bucket["high"] = max(bucket["high"], price)
+    bucket["low"] = min(bucket["low"], price)
+    bucket["count"] += 1
+
+
+def _update_rollup_table(model, bucket_fn, rows):
+    buckets = {}
+    for row in rows:
+        key = (row["product_id"], bucket_fn(row["timestamp"]))
+        price, ts = row["price"], row["timestamp"]
+        if key not in buckets:
+            buckets[key] = {"product_id": key[0], "bucket_start": key[1], "open": price, "high": price,
+                            "low": price, "close": price, "count": 0, "first_at": ts, "last_at": ts}
+        _fold(buckets[key], price, ts)
+
+    existing = db.session.execute(
+        select(model).where(tuple_(model.product_id, model.bucket_start).in_(list(buckets.keys())))
+    ).scalars().all()
+    updates = []
+    for current in existing:
+        new = buckets.pop((current.product_id, current.bucket_start))
+        merged = {"product_id": current.product_id, "bucket_start": current.bucket_start,
+                  "open": current.open, "first_at": current.first_at,
+                  "close": current.close, "last_at": current.last_at,
+                  "high": max(current.high, new["high"]), "low": min(current.low, new["low"]),
+                  "count": current.count + new["count"]}
+        if new["first_at"] < current.first_at:
+            merged["open"], merged["first_at"] = new["open"], new["first_at"]
+        if new["last_at"] >= current.last_at:
+            merged["close"], merged["last_at"] = new["close"], new["last_at"]
+        updates.append(merged)
+
+    if updates:
+        db.session.execute(update(model), updates)
+    if buckets:
+        db.session.execute(insert(model), list(buckets.values()))
+
+
+def segment_rollup_points(product_id, price, first_seen, last_seen=None):
+    """
+    Rollup input rows for one history row. A change-only row stands for every scrape from first_seen
+    to last_seen, so besides those two sightings it yields a point at the start of each hour in
+    between; otherwise the hours (and days) inside the run would get no rollup bucket at all.
+    """
+    points = [{"product_id": product_id, "price": price, "timestamp": first_seen}]
+    if last_seen and last_seen > first_seen:
+        step = ROLLUP_RESOLUTIONS["hour"][2]
+        bucket = hour_bucket(first_seen) + step
+        while bucket < last_seen:
+            points.append({"product_id": product_id, "price": price, "timestamp": bucket})
+            bucket += step
+        points.append({"product_id": product_id, "price": price, "timestamp": last_seen})
+    return points
+
+
+def update_price_rollups(rows):
+    """
+    Folds scraped prices (dicts with product_id, price, timestamp) into the hourly and daily
+    rollups. Runs inside the caller's transaction.
+    """
+    if not rows:
+        return
+    for model, bucket_fn, _ in ROLLUP_RESOLUTIONS.values():
+        _update_rollup_table(model, bucket_fn, rows)
+
+
+def rollup_series(product_id, resolution, start=None, end=None):
+    """Column series (see price_series.py) of one product at 'hour' or 'day' resolution, one point per bucket (close price)."""
+    model = ROLLUP_RESOLUTIONS[resolution][0]
+    # Plain column tuples, transposed into the series; no ORM objects per bucket.
+    query = select(model.bucket_start, model.close, model.open, model.high, model.low, model.count).where(
+        model.product_id == product_id)
+    if start is not None:
+        query = query.where(model.bucket_start >= ROLLUP_RESOLUTIONS[resolution][1](start))
+    if end is not None:
+        query = query.where(model.bucket_start <= end)
+    rows = db.session.execute(query.order_by(model.bucket_start.asc())).all()
+    series = new_series(rollup=True)
+    if rows:
+        series.update(zip(series, map(list, zip(*rows))))
+    return series
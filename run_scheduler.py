@@ -1,16 +1,111 @@
 # run_scheduler.py
 import os
-from app import app, scheduler # Import your Flask app instance and scheduler instance
-from database import db, Product # Import models if needed by scheduler setup
-from app import job_scrape_product_wrapper # Import the wrapper
+import threading
+os.environ.setdefault("PRICEPULSE_PROCESS_ROLE", "worker") # Selects the worker's pool settings; must precede the app import
+# Parse worker processes (scraper.get_parse_pool) import this script again as '__mp_main__'. They only
+# need scraper.py, so they skip the app, whose import opens the database and runs the migrations.
+if __name__ != "__mp_main__":
+    from app import app, scheduler # Import your Flask app instance and scheduler instance
+    from app import job_scrape_product_wrapper, job_initial_scrape_wrapper, job_run_comparison_wrapper, job_refresh_comparisons_wrapper, job_flush_price_writes_wrapper, job_enforce_price_retention_wrapper, job_maintain_price_partitions_wrapper, job_sqlite_maintenance_wrapper, job_log_pool_stats_wrapper # Import the wrappers
+from database import Product # Import models if needed by scheduler setup
+from migrations import prepare_database
+from partitions import partitioning_enabled
+from persist import price_write_buffer, PRICE_FLUSH_INTERVAL_SECONDS
+from retention import PRICE_RETENTION_INTERVAL_HOURS
+from scraper import shutdown_parse_pool
+from sqlite_tuning import sqlite_tuning_enabled, SQLITE_MAINTENANCE_INTERVAL_MINUTES
+from db_pool import DB_POOL_STATS_LOG_SECONDS
+from llm_providers import log_llm_stats, LLM_STATS_LOG_SECONDS
+from scheduler import pending_product_ids
+from comparison import pending_comparison_ids, COMPARISON_REFRESH_HOURS
+
+# How often the worker looks for newly submitted products (the web service only stores them as pending).
+PENDING_SCRAPE_POLL_SECONDS = int(os.getenv("PENDING_SCRAPE_POLL_SECONDS", "5"))
+PRODUCT_SCRAPE_INTERVAL_MINUTES = 30
+
+_initial_scrapes_lock = threading.Lock()
+_initial_scrapes_in_flight = set()
+_comparisons_lock = threading.Lock()
+_comparisons_in_flight = set()
+
+def add_product_scrape_job(scheduler_instance, product_id):
+    scheduler_instance.add_job(
+        job_scrape_product_wrapper,
+        'interval',
+        minutes=PRODUCT_SCRAPE_INTERVAL_MINUTES, # Or your desired interval
+        args=[product_id],
+        id=f'scrape_product_{product_id}',
+        replace_existing=True
+    )
+
+
+def run_initial_scrape(product_id):
+    try:
+        job_initial_scrape_wrapper(product_id)
+    finally:
+        with _initial_scrapes_lock:
+            _initial_scrapes_in_flight.discard(product_id)
+
+
+def dispatch_pending_scrapes(flask_app_instance, scheduler_instance):
+    """
+    Polls for products submitted since the last poll and queues their first scrape on the
+    'priority' executor, plus their periodic scrape job (until now only added at worker startup).
+    """
+    with flask_app_instance.app_context():
+        product_ids = pending_product_ids()
+    for product_id in product_ids:
+        with _initial_scrapes_lock:
+            if product_id in _initial_scrapes_in_flight:
+                continue
+            _initial_scrapes_in_flight.add(product_id)
+        print(f"RUN_SCHEDULER: Queuing initial scrape for new product {product_id}.")
+        scheduler_instance.add_job(
+            run_initial_scrape,
+            executor='priority',
+            args=[product_id],
+            id=f'initial_scrape_{product_id}',
+            replace_existing=True
+        )
+        if not scheduler_instance.get_job(f'scrape_product_{product_id}'):
+            add_product_scrape_job(scheduler_instance, product_id)
+
+
+def run_comparison_job(product_id):
+    try:
+        job_run_comparison_wrapper(product_id)
+    finally:
+        with _comparisons_lock:
+            _comparisons_in_flight.discard(product_id)
+
+
+def dispatch_pending_comparisons(flask_app_instance, scheduler_instance):
+    """
+    Polls for requested (or stale, see job_refresh_comparisons) comparisons and queues them on the
+    'comparisons' executor.
+    """
+    with flask_app_instance.app_context():
+        product_ids = pending_comparison_ids()
+    for product_id in product_ids:
+        with _comparisons_lock:
+            if product_id in _comparisons_in_flight:
+                continue
+            _comparisons_in_flight.add(product_id)
+        print(f"RUN_SCHEDULER: Queuing comparison for product {product_id}.")
+        scheduler_instance.add_job(
+            run_comparison_job,
+            executor='comparisons',
+            args=[product_id],
+            id=f'comparison_{product_id}',
+            replace_existing=True
+        )
 
-print("RUN_SCHEDULER: Starting scheduler process...")
 
 def start_scheduler_jobs(flask_app_instance, scheduler_instance):
     with flask_app_instance.app_context():
         # This logic is similar to initialize_application_startup in app.py,
         # but focused only on adding jobs and starting the scheduler.
-        # db.create_all() # Tables should be created by the web service on its first run or via migrations
+        # Tables and migrations are handled by prepare_database() (see migrations.py)
         
         products_to_track = Product.query.all()
         print(f"RUN_SCHEDULER: Found {len(products_to_track)} products in DB to schedule.")
@@ -18,17 +113,109 @@ def start_scheduler_jobs(flask_app_instance, scheduler_instance):
             job_id = f'scrape_product_{p.id}'
             if not scheduler_instance.get_job(job_id):
                 print(f"RUN_SCHEDULER: Adding job for product {p.id} ('{p.name}').")
-                scheduler_instance.add_job(
-                    job_scrape_product_wrapper,
-                    'interval',
-                    minutes=30, # Or your desired interval
-                    args=[p.id],
-                    id=job_id,
-                    replace_existing=True
-                )
+                add_product_scrape_job(scheduler_instance, p.id)
             else:
                 print(f"RUN_SCHEDULER: Job for product {p.id} ('{p.name}') already exists.")
 
+        # First scrapes of newly submitted products (also catches any left pending by a restart)
+        scheduler_instance.add_job(
+            dispatch_pending_scrapes,
+            'interval',
+            seconds=PENDING_SCRAPE_POLL_SECONDS,
+            args=[flask_app_instance, scheduler_instance],
+            id='dispatch_pending_scrapes',
+            executor='dispatch', # Not 'priority': two slow first scrapes would leave the poll no thread
+            replace_existing=True,
+            max_instances=1
+        )
+
+        # Multi-platform comparisons requested on the product page (see comparison.py)
+        scheduler_instance.add_job(
+            dispatch_pending_comparisons,
+            'interval',
+            seconds=PENDING_SCRAPE_POLL_SECONDS,
+            args=[flask_app_instance, scheduler_instance],
+            id='dispatch_pending_comparisons',
+            executor='dispatch', # Shares the poll thread; never waits behind scrapes on 'priority'
+            replace_existing=True,
+            max_instances=1
+        )
+
+        if COMPARISON_REFRESH_HOURS > 0:
+            # Re-run comparisons older than COMPARISON_REFRESH_HOURS, a batch at a time
+            scheduler_instance.add_job(
+                job_refresh_comparisons_wrapper,
+                'interval',
+                hours=1,
+                id='refresh_comparisons',
+                replace_existing=True,
+                max_instances=1
+            )
+
+        # Periodically write out batched prices/alert updates from the scrape jobs
+        scheduler_instance.add_job(
+            job_flush_price_writes_wrapper,
+            'interval',
+            seconds=PRICE_FLUSH_INTERVAL_SECONDS,
+            id='flush_price_writes',
+            replace_existing=True,
+            max_instances=1
+        )
+
+        # Retention: fold old raw history into rollups and delete it in small batches
+        scheduler_instance.add_job(
+            job_enforce_price_retention_wrapper,
+            'interval',
+            hours=PRICE_RETENTION_INTERVAL_HOURS,
+            id='enforce_price_retention',
+            replace_existing=True,
+            max_instances=1
+        )
+
+        if partitioning_enabled():
+            # Keep monthly price_history partitions created ahead of time
+            scheduler_instance.add_job(
+                job_maintain_price_partitions_wrapper,
+                'interval',
+                days=1,
+                id='maintain_price_partitions',
+                replace_existing=True,
+                max_instances=1
+            )
+
+        if sqlite_tuning_enabled():
+            # Checkpoint the WAL (keeps it from growing) and refresh planner statistics
+            scheduler_instance.add_job(
+                job_sqlite_maintenance_wrapper,
+                'interval',
+                minutes=SQLITE_MAINTENANCE_INTERVAL_MINUTES,
+                id='sqlite_maintenance',
+                replace_existing=True,
+                max_instances=1
+            )
+
+        if DB_POOL_STATS_LOG_SECONDS > 0:
+            # Connection pool usage of this worker (the web service exposes /api/metrics/pool)
+            scheduler_instance.add_job(
+                job_log_pool_stats_wrapper,
+                'interval',
+                seconds=DB_POOL_STATS_LOG_SECONDS,
+                id='log_pool_stats',
+                replace_existing=True,
+                max_instances=1
+            )
+
+        if LLM_STATS_LOG_SECONDS > 0:
+            # LLM call counts, latency and tokens of this worker (comparisons, see llm_providers.py)
+            scheduler_instance.add_job(
+                log_llm_stats,
+                'interval',
+                seconds=LLM_STATS_LOG_SECONDS,
+                id='log_llm_stats',
+                replace_existing=True,
+                max_instances=1
+            )
+
         if not scheduler_instance.running:
             try:
                 scheduler_instance.start()
@@ -39,6 +226,7 @@ def start_scheduler_jobs(flask_app_instance, scheduler_instance):
             print("RUN_SCHEDULER: Scheduler was already running (should not happen on fresh start).")
 
 if __name__ == '__main__':
+    print("RUN_SCHEDULER: Starting scheduler process...")
     # This allows the scheduler to run indefinitely when this script is executed.
     # The Flask app context is needed for database access within scheduled jobs.
     # We pass the app instance to functions that need the context.
@@ -46,7 +234,7 @@ if __name__ == '__main__':
     # Initialize DB with app for this script to use models correctly
     # This is important because we are not running the full app.py startup.
     with app.app_context():
-        db.init_app(app) # Ensure db is associated with app in this context too
+        prepare_database() # Same schema/migration step as the web service; no-op if already current
 
     start_scheduler_jobs(app, scheduler)
 
@@ -60,4 +248,7 @@ if __name__ == '__main__':
     except (KeyboardInterrupt, SystemExit):
         print("RUN_SCHEDULER: Scheduler process shutting down...")
         if scheduler.running:
-            scheduler.shutdown()
\ No newline at end of file
+            scheduler.shutdown()
+        with app.app_context():
+            price_write_buffer.flush() # Don't lose the last partial batch
+        shutdown_parse_pool()
\ No newline at end of file
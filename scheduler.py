@@ -1,9 +1,15 @@
 # scheduler.py
 from apscheduler.schedulers.background import BackgroundScheduler # Not used directly here, app.py manages instance
 from scraper import scrape_amazon_product_details # Assuming this is your Amazon scraper function
-from database import db, Product, PriceHistory, Alert # Make sure Alert is imported
+from database import db, Product, Alert, PRODUCT_PENDING, SCRAPE_PENDING, SCRAPE_FAILED # Make sure Alert is imported
 from mail_sender import send_price_alert_email # Import your email sending function
+from persist import price_write_buffer # Write-behind buffer; rows are committed in batches
+from retention import enforce_price_retention
+from partitions import ensure_partitions_ahead
+from sqlite_tuning import run_sqlite_maintenance
+from comparison import run_comparison, queue_stale_comparisons
 import datetime
+from sqlalchemy import true, select, update
 
 def check_and_send_alerts(app_context, product, current_price):
     """
@@ -14,7 +20,7 @@ def check_and_send_alerts(app_context, product, current_price):
     # No need for 'with app_context:' here if we assume it's already active when called
     # from job_scrape_product, which runs within its own app_context.
     
-    active_alerts = Alert.query.filter_by(product_id=product.id, is_active=True).all()
+    active_alerts = Alert.query.filter(Alert.product_id == product.id, Alert.is_active == true()).all()
     
     if not active_alerts:
         # print(f"SCHEDULER (Alerts): No active alerts for {product.name}.")
@@ -22,6 +28,8 @@ def check_and_send_alerts(app_context, product, current_price):
 
     print(f"SCHEDULER (Alerts): Found {len(active_alerts)} active alert(s) for {product.name}.")
     for alert in active_alerts:
+        if price_write_buffer.is_alert_pending_deactivation(alert.id):
+            continue # Already fired; its deactivation is waiting for the next flush
         print(f"SCHEDULER (Alerts): Checking Alert ID {alert.id} for {alert.email} - Target: ₹{alert.target_price:.2f}")
         if current_price <= alert.target_price:
             print(f"SCHEDULER (Alerts): PRICE DROP! Product: {product.name}, Current: ₹{current_price:.2f}, Target: ₹{alert.target_price:.2f}, Email: {alert.email}")
@@ -36,9 +44,10 @@ def check_and_send_alerts(app_context, product, current_price):
             )
             
             if email_sent_successfully:
-                alert.is_active = False # Deactivate alert to prevent re-sending for the same price drop
-                db.session.commit() # Save the change to the alert's status
-                print(f"SCHEDULER (Alerts): Alert ID {alert.id} for {alert.email} processed and deactivated.")
+                # Deactivate alert to prevent re-sending for the same price drop.
+                # The state change is batched with the other writes of this refresh cycle.
+                price_write_buffer.deactivate_alert(alert.id)
+                print(f"SCHEDULER (Alerts): Alert ID {alert.id} for {alert.email} processed and queued for deactivation.")
             else:
                 print(f"SCHEDULER (Alerts): Email failed to send for Alert ID {alert.id}. Alert remains active.")
         # else:
@@ -71,18 +80,122 @@ def job_scrape_product(app, product_id):
 
             # Update product name/image if they were 'N/A', blank, or 'Not found'
             # This ensures product details can be refined by later scrapes.
+            product_fixups = {}
             if not product.name or product.name.lower() in ["n/a", "name not found"]:
-                 product.name = scraped_details.get('name', product.name)
+                 product_fixups['name'] = scraped_details.get('name', product.name)
             if not product.image_url or product.image_url.lower() in ["n/a", "image not found"]:
-                 product.image_url = scraped_details.get('image_url', product.image_url)
+                 product_fixups['image_url'] = scraped_details.get('image_url', product.image_url)
+            if product.scrape_status:
+                 product_fixups['scrape_status'] = None # First price found (initial scrape failed or is still queued)
+            price_write_buffer.update_product(product.id, **product_fixups)
 
-            # Add new price to history
-            new_price_entry = PriceHistory(product_id=product.id, price=current_scraped_price, timestamp=datetime.datetime.utcnow())
-            db.session.add(new_price_entry)
-            db.session.commit()
-            print(f"SCHEDULER: Logged new price for '{product.name}': ₹{current_scraped_price:.2f} at {new_price_entry.timestamp}")
+            # Queue new price for the next batched write to history
+            scraped_at = datetime.datetime.utcnow()
+            batch_full = price_write_buffer.add_price(product.id, current_scraped_price, scraped_at)
+            print(f"SCHEDULER: Queued new price for '{product.name}': ₹{current_scraped_price:.2f} at {scraped_at}")
 
             # --- Check and send alerts ---
             check_and_send_alerts(app, product, current_scraped_price) # Pass the app instance
+
+            if batch_full:
+                price_write_buffer.flush()
         else:
-            print(f"SCHEDULER: Failed to scrape valid price for '{product.name}' (URL: {product.url}) in scheduled job.")
\ No newline at end of file
+            print(f"SCHEDULER: Failed to scrape valid price for '{product.name}' (URL: {product.url}) in scheduled job.")
+
+
+def pending_product_ids(limit=100):
+    """Newly submitted products still waiting for their first scrape, oldest first."""
+    return db.session.execute(
+        select(Product.id).where(PRODUCT_PENDING).order_by(Product.id.asc()).limit(limit)
+    ).scalars().all()
+
+
+def job_initial_scrape(app, product_id):
+    """
+    First scrape of a product submitted through the web service. Its name, image and first price
+    are written right away (not with the next periodic flush) because the product page is waiting for them.
+    """
+    with app.app_context():
+        product = Product.query.get(product_id)
+        if not product or product.scrape_status != SCRAPE_PENDING:
+            return # Deleted, or already scraped by its periodic job
+
+        print(f"SCHEDULER: Initial scrape for Product ID {product.id} - URL: {product.url}...")
+        scraped_details = scrape_amazon_product_details(product.url)
+        if scraped_details and scraped_details.get("price") is not None:
+            price_write_buffer.update_product(product.id, name=scraped_details.get('name', "N/A"),
+                                              image_url=scraped_details.get('image_url', "N/A"), scrape_status=None)
+            price_write_buffer.add_price(product.id, scraped_details["price"], datetime.datetime.utcnow())
+            print(f"SCHEDULER: Initial price for Product ID {product.id}: ₹{scraped_details['price']:.2f}")
+        else:
+            price_write_buffer.update_product(product.id, scrape_status=SCRAPE_FAILED)
+            print(f"SCHEDULER: Initial scrape found no price for Product ID {product.id}; the periodic job will retry.")
+        price_write_buffer.flush()
+
+        # If the flush didn't commit, the product would still be pending and the dispatcher would scrape
+        # it again every few seconds; leave it to the periodic job instead.
+        still_pending = db.session.execute(
+            update(Product).where(Product.id == product_id, PRODUCT_PENDING).values(scrape_status=SCRAPE_FAILED)
+        ).rowcount
+        db.session.commit()
+        if still_pending:
+            print(f"SCHEDULER: Initial scrape of Product ID {product_id} wasn't saved; marked it failed for the periodic job to retry.")
+
+
+def job_run_comparison(app, product_id):
+    """
+    Background multi-platform comparison of one product (see comparison.py).
+    """
+    with app.app_context():
+        try:
+            run_comparison(product_id)
+        except Exception as e:
+            db.session.rollback()
+            print(f"SCHEDULER: Comparison for Product ID {product_id} failed: {e}")
+            # Clear the request so the dispatcher doesn't retry it every few seconds
+            db.session.execute(update(Product).where(Product.id == product_id).values(comparison_status=None))
+            db.session.commit()
+
+
+def job_refresh_comparisons(app):
+    """
+    Periodic job that queues comparisons older than COMPARISON_REFRESH_HOURS for a new run.
+    """
+    with app.app_context():
+        queue_stale_comparisons()
+
+
+def job_flush_price_writes(app):
+    """
+    Periodic job that flushes the write-behind buffer, so partially filled batches
+    are still written within PRICE_FLUSH_INTERVAL_SECONDS.
+    """
+    with app.app_context():
+        price_write_buffer.flush()
+
+
+def job_enforce_price_retention(app):
+    """
+    Periodic compaction job: folds raw history older than the retention window into the
+    rollups and deletes it (and expired rollups) in small batches. See retention.py.
+    """
+    with app.app_context():
+        price_write_buffer.flush() # Make sure rollups include everything scraped so far
+        enforce_price_retention()
+
+
+def job_maintain_price_partitions(app):
+    """
+    Daily job that keeps monthly price_history partitions created ahead of time.
+    A no-op unless partitioning is enabled on PostgreSQL.
+    """
+    with app.app_context():
+        ensure_partitions_ahead()
+
+
+def job_sqlite_maintenance(app):
+    """
+    Periodic WAL checkpoint and ANALYZE for the SQLite fallback in concurrent mode.
+    """
+    with app.app_context():
+        run_sqlite_maintenance()
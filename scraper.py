@@ -4,7 +4,12 @@ from bs4 import BeautifulSoup
 import re
 from urllib.parse import quote_plus
 import json
+import os
 import random # Import the random module
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 # --- User-Agent List ---
 USER_AGENTS = [
@@ -31,6 +36,57 @@ def get_random_headers():
         'Referer': 'https://www.google.com/'
     }
 
+# --- Optional Process-Pool Parse Stage ---
+# BeautifulSoup parsing is CPU-bound pure Python, so parsing in scheduler threads keeps a worker
+# process on roughly one core. With SCRAPER_PARSE_PROCESSES > 0 the fetched page bytes are handed
+# to a process pool and only the small result dict comes back. Fetch concurrency stays governed by
+# the scheduler's thread pool (SCHEDULER_MAX_WORKERS), so the two can be scaled independently.
+SCRAPER_PARSE_PROCESSES = int(os.getenv("SCRAPER_PARSE_PROCESSES", "0"))
+
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
+
+def _parse_pool_context():
+    # Workers fork from a forkserver that has only this module (and bs4) loaded: cheap to start, and
+    # nothing is forked from the worker process with its scheduler and DB threads. Every worker still
+    # imports the main script again (as '__mp_main__'), which run_scheduler.py keeps free of the app.
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn") # Windows
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload(["scraper"])
+    return context
+
+def get_parse_pool():
+    """
+    Returns the shared parse process pool, creating it on first use.
+    Returns None when the process-pool mode is disabled (parsing then happens inline).
+    """
+    global _parse_pool
+    if SCRAPER_PARSE_PROCESSES <= 0:
+        return None
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            _parse_pool = ProcessPoolExecutor(
+                max_workers=SCRAPER_PARSE_PROCESSES,
+                mp_context=_parse_pool_context()
+            )
+            print(f"SCRAPER: Parse process pool started with {SCRAPER_PARSE_PROCESSES} worker process(es).")
+        return _parse_pool
+
+def shutdown_parse_pool():
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is not None:
+            _parse_pool.shutdown(wait=True)
+            _parse_pool = None
+            print("SCRAPER: Parse process pool shut down.")
+
+def _discard_broken_parse_pool(broken_pool):
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is broken_pool:
+            _parse_pool = None
+
 def clean_price(price_str):
     if price_str is None:
         return None
@@ -41,6 +97,88 @@ def clean_price(price_str):
         print(f"SCRAPER_CLEAN_PRICE: Could not convert '{cleaned}' (from original: '{price_str}') to float.")
         return None
 
+def parse_amazon_product_html(content, url):
+    """
+    Extracts name, price and image URL from a fetched Amazon product page.
+    Pure function of the page bytes so it can run in a parse worker process.
+    """
+    soup = BeautifulSoup(content, 'html.parser')
+
+    name_selectors = [
+        '#productTitle', 'span#productTitle', '#title', 'h1#title', 
+        'h1#title > span#productTitle'
+    ]
+    name = "Name not found"
+    for selector in name_selectors:
+        name_element = soup.select_one(selector)
+        if name_element:
+            name = name_element.get_text(strip=True)
+            if name and name != "Back to results": break
+    print(f"SCRAPER_DEBUG: Raw Name Found: '{name}'")
+
+    price = None
+    price_texts_seen = []
+    price_selector_strings = [
+        'span.a-price-whole', 'span.a-price .a-offscreen', '#corePrice_feature_div span.a-offscreen',
+        'div#corePrice_feature_div span.a-price-whole', '#priceblock_ourprice', '#priceblock_dealprice',
+        '.priceToPay span.a-price-whole', 'span[data-a-size="xl"] span.a-price-whole',
+        'div.a-section table#buyNew_noncbb tbody tr.a-spacing-small td.a-span12 span#price_inside_buybox',
+        'div#apex_desktop_newAccordionRow span.apexPriceToPay', 'span#sns-base-price', '#price_inside_buybox'
+    ]
+    
+    for selector_str in price_selector_strings:
+        price_el = soup.select_one(selector_str)
+        if price_el:
+            price_text = price_el.get_text(strip=True)
+            price_texts_seen.append(f"'{selector_str}': '{price_text}'")
+            price = clean_price(price_text)
+            if price is not None and price > 0: break
+    
+    if price is None or price == 0.0:
+        print("SCRAPER_DEBUG: Price not found via specific selectors. Trying currency symbol search.")
+        potential_price_elements = soup.find_all(string=re.compile(r'₹|\$'))
+        for text_node in potential_price_elements:
+            parent = text_node.parent; attempts = 0
+            while parent and attempts < 3:
+                price_text_candidate = parent.get_text(strip=True)
+                if len(price_text_candidate) < 50:
+                    price_texts_seen.append(f"(Currency Symbol Search - Parent <{parent.name}>): '{price_text_candidate}'")
+                    price = clean_price(price_text_candidate)
+                    if price is not None and price > 0: break
+                parent = parent.parent; attempts += 1
+            if price is not None and price > 0: break
+    
+    print(f"SCRAPER_DEBUG: All price texts evaluated: {price_texts_seen}")
+    print(f"SCRAPER_DEBUG: Final Price Found: {price if price is not None else 'N/A'}")
+    if price is None: price = 0.0
+
+    image_url = "Image not found"
+    img_selector_strings = [
+        '#landingImage', '#imgTagWrapperId img', '#imgBlkFront', '#ivLargeImage',
+        '#main-image-container img', 'div#altImages ul.a-unordered-list li.selected img'
+    ]
+    for selector_str in img_selector_strings:
+        img_tag = soup.select_one(selector_str)
+        if img_tag:
+            potential_src = img_tag.get('src') or img_tag.get('data-src') or img_tag.get('data-old-hires')
+            if potential_src and potential_src.startswith('http'):
+                image_url = potential_src; break
+    
+    if (image_url == "Image not found" or not image_url.startswith('http')):
+        dynamic_image_elements = soup.select('img[data-a-dynamic-image]')
+        if dynamic_image_elements:
+            first_image_data_str = dynamic_image_elements[0].get('data-a-dynamic-image')
+            if first_image_data_str:
+                try:
+                    image_json_data = json.loads(first_image_data_str)
+                    image_url = list(image_json_data.keys())[0]
+                except (json.JSONDecodeError, IndexError, TypeError) as e:
+                    print(f"SCRAPER_DEBUG: Error parsing dynamic image JSON: {e}")
+                    image_url = "Image not found"
+    print(f"SCRAPER_DEBUG: Image URL Found: '{image_url}'")
+
+    return {"name": name if name and name != "Name not found" else "N/A", "price": price, "image_url": image_url if image_url and image_url.startswith('http') and image_url != "Image not found" else "N/A", "url": url}
+
 def scrape_amazon_product_details(url):
     print(f"SCRAPER: Attempting to scrape Amazon URL: {url}")
     try:
@@ -54,82 +192,16 @@ def scrape_amazon_product_details(url):
             print(f"SCRAPER_ERROR_DETAIL: Response text from Amazon (first 1000 chars): {response.text[:1000]}")
         
         response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
 
-        name_selectors = [
-            '#productTitle', 'span#productTitle', '#title', 'h1#title', 
-            'h1#title > span#productTitle'
-        ]
-        name = "Name not found"
-        for selector in name_selectors:
-            name_element = soup.select_one(selector)
-            if name_element:
-                name = name_element.get_text(strip=True)
-                if name and name != "Back to results": break
-        print(f"SCRAPER_DEBUG: Raw Name Found: '{name}'")
-
-        price = None
-        price_texts_seen = []
-        price_selector_strings = [
-            'span.a-price-whole', 'span.a-price .a-offscreen', '#corePrice_feature_div span.a-offscreen',
-            'div#corePrice_feature_div span.a-price-whole', '#priceblock_ourprice', '#priceblock_dealprice',
-            '.priceToPay span.a-price-whole', 'span[data-a-size="xl"] span.a-price-whole',
-            'div.a-section table#buyNew_noncbb tbody tr.a-spacing-small td.a-span12 span#price_inside_buybox',
-            'div#apex_desktop_newAccordionRow span.apexPriceToPay', 'span#sns-base-price', '#price_inside_buybox'
-        ]
-        
-        for selector_str in price_selector_strings:
-            price_el = soup.select_one(selector_str)
-            if price_el:
-                price_text = price_el.get_text(strip=True)
-                price_texts_seen.append(f"'{selector_str}': '{price_text}'")
-                price = clean_price(price_text)
-                if price is not None and price > 0: break
-        
-        if price is None or price == 0.0:
-            print("SCRAPER_DEBUG: Price not found via specific selectors. Trying currency symbol search.")
-            potential_price_elements = soup.find_all(string=re.compile(r'₹|\$'))
-            for text_node in potential_price_elements:
-                parent = text_node.parent; attempts = 0
-                while parent and attempts < 3:
-                    price_text_candidate = parent.get_text(strip=True)
-                    if len(price_text_candidate) < 50:
-                        price_texts_seen.append(f"(Currency Symbol Search - Parent <{parent.name}>): '{price_text_candidate}'")
-                        price = clean_price(price_text_candidate)
-                        if price is not None and price > 0: break
-                    parent = parent.parent; attempts += 1
-                if price is not None and price > 0: break
-        
-        print(f"SCRAPER_DEBUG: All price texts evaluated: {price_texts_seen}")
-        print(f"SCRAPER_DEBUG: Final Price Found: {price if price is not None else 'N/A'}")
-        if price is None: price = 0.0
-
-        image_url = "Image not found"
-        img_selector_strings = [
-            '#landingImage', '#imgTagWrapperId img', '#imgBlkFront', '#ivLargeImage',
-            '#main-image-container img', 'div#altImages ul.a-unordered-list li.selected img'
-        ]
-        for selector_str in img_selector_strings:
-            img_tag = soup.select_one(selector_str)
-            if img_tag:
-                potential_src = img_tag.get('src') or img_tag.get('data-src') or img_tag.get('data-old-hires')
-                if potential_src and potential_src.startswith('http'):
-                    image_url = potential_src; break
-        
-        if (image_url == "Image not found" or not image_url.startswith('http')):
-            dynamic_image_elements = soup.select('img[data-a-dynamic-image]')
-            if dynamic_image_elements:
-                first_image_data_str = dynamic_image_elements[0].get('data-a-dynamic-image')
-                if first_image_data_str:
-                    try:
-                        image_json_data = json.loads(first_image_data_str)
-                        image_url = list(image_json_data.keys())[0]
-                    except (json.JSONDecodeError, IndexError, TypeError) as e:
-                        print(f"SCRAPER_DEBUG: Error parsing dynamic image JSON: {e}")
-                        image_url = "Image not found"
-        print(f"SCRAPER_DEBUG: Image URL Found: '{image_url}'")
-
-        return {"name": name if name and name != "Name not found" else "N/A", "price": price, "image_url": image_url if image_url and image_url.startswith('http') and image_url != "Image not found" else "N/A", "url": url}
+        pool = get_parse_pool()
+        if pool is None:
+            return parse_amazon_product_html(response.content, url)
+        try:
+            return pool.submit(parse_amazon_product_html, response.content, url).result()
+        except BrokenProcessPool as e:
+            print(f"SCRAPER: Parse process pool is broken ({e}). Recreating it and parsing {url} inline.")
+            _discard_broken_parse_pool(pool)
+            return parse_amazon_product_html(response.content, url)
 
     except requests.exceptions.HTTPError as e:
         print(f"SCRAPER_HTTP_ERROR for {url}: {e} (User-Agent: {response.request.headers.get('User-Agent') if 'response' in locals() and response.request else 'N/A'})")
@@ -0,0 +1,74 @@
+# sqlite_tuning.py
+# Concurrency-friendly settings for the local SQLite fallback (sqlite:///pricepulse.db).
+# The web service and the scheduler worker write to the same file; with the default rollback
+# journal every write blocks all readers and concurrent writers fail with "database is locked".
+# With SQLITE_CONCURRENT_MODE=true every new connection switches to WAL (readers never block the
+# writer and vice versa), waits up to SQLITE_BUSY_TIMEOUT_MS for locks and uses larger page cache
+# and memory-mapped I/O. The worker checkpoints the WAL and refreshes planner statistics periodically.
+import os
+
+from sqlalchemy import event
+
+from database import db
+
+SQLITE_CONCURRENT_MODE = os.getenv("SQLITE_CONCURRENT_MODE", "false").lower() in ("true", "1", "t")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+# NORMAL is durable across application crashes in WAL mode; only an OS crash can lose the last commits.
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL").upper()
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "20000"))
+SQLITE_MMAP_SIZE_MB = int(os.getenv("SQLITE_MMAP_SIZE_MB", "256"))
+SQLITE_MAINTENANCE_INTERVAL_MINUTES = int(os.getenv("SQLITE_MAINTENANCE_INTERVAL_MINUTES", "60"))
+# Rows sampled per index by ANALYZE, so the statistics refresh stays cheap on large tables.
+SQLITE_ANALYSIS_LIMIT = int(os.getenv("SQLITE_ANALYSIS_LIMIT", "1000"))
+
+_SYNCHRONOUS_LEVELS = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+
+def sqlite_tuning_enabled(engine=None):
+    engine = engine or db.engine
+    return SQLITE_CONCURRENT_MODE and engine.dialect.name == "sqlite"
+
+
+def _apply_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        synchronous = SQLITE_SYNCHRONOUS if SQLITE_SYNCHRONOUS in _SYNCHRONOUS_LEVELS else "NORMAL"
+        cursor.execute(f"PRAGMA synchronous={synchronous}")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}") # Negative = size in KiB
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE_MB * 1024 * 1024}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+    finally:
+        cursor.close()
+
+
+def install_sqlite_tuning(engine):
+    """
+    Registers the pragmas on an engine's 'connect' event, so they apply to every pooled connection.
+    Must run before the engine opens its first connection. No-op unless enabled and the engine is SQLite.
+    """
+    if not sqlite_tuning_enabled(engine):
+        return False
+    if not event.contains(engine, "connect", _apply_pragmas):
+        event.listen(engine, "connect", _apply_pragmas)
+        print(f"SQLITE: Concurrent mode on for {engine.url.database} (WAL, busy_timeout={SQLITE_BUSY_TIMEOUT_MS}ms, "
+              f"synchronous={SQLITE_SYNCHRONOUS}).")
+    return True
+
+
+def run_sqlite_maintenance():
+    """
+    Checkpoints the WAL back into the database file (and truncates it) and refreshes the query
+    planner statistics. Must be called inside an app context. Returns the checkpoint result.
+    """
+    if not sqlite_tuning_enabled():
+        return None
+    with db.engine.connect() as connection:
+        # (busy, WAL frames, frames checkpointed); busy=1 means a reader kept part of the WAL alive.
+        busy, log_frames, checkpointed = connection.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)").one()
+        connection.exec_driver_sql(f"PRAGMA analysis_limit={SQLITE_ANALYSIS_LIMIT}")
+        connection.exec_driver_sql("ANALYZE")
+        connection.commit()
+    print(f"SQLITE: Maintenance done (checkpoint busy={busy}, {checkpointed}/{log_frames} WAL frames; ANALYZE refreshed).")
+    return {"busy": busy, "log_frames": log_frames, "checkpointed": checkpointed}
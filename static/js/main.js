@@ -1,85 +1,205 @@
 // In static/js/main.js
 document.addEventListener('DOMContentLoaded', function() {
 
+    // A product submitted moments ago is scraped in the background, and so is a requested comparison:
+    // poll the status and reload the page once the pending work has finished (the chart below then finds data).
+    const scrapePending = typeof productPending !== 'undefined' && productPending;
+    const comparisonRunning = typeof comparisonPending !== 'undefined' && comparisonPending;
+    if (scrapePending || comparisonRunning) {
+        const statusPollMs = 3000;
+        const pollStatus = function() {
+            fetch(`/api/product/${productId}/status`, {cache: 'no-store'})
+                .then(response => response.ok ? response.json() : null)
+                .then(status => {
+                    if (status && !(scrapePending && status.status === 'pending')
+                               && !(comparisonRunning && status.comparison_status === 'pending')) {
+                        window.location.reload();
+                    } else {
+                        setTimeout(pollStatus, statusPollMs);
+                    }
+                })
+                .catch(() => setTimeout(pollStatus, statusPollMs * 2));
+        };
+        setTimeout(pollStatus, statusPollMs);
+    }
+
     // Check if productId was defined by the template (in product_detail.html) and is not null
     if (typeof productId !== 'undefined' && productId !== null) {
         const chartCanvas = document.getElementById('priceHistoryChart');
 
         if (chartCanvas) {
-            // Proceed with fetching data for the chart and drawing it
-            fetch(`/api/product/${productId}/prices`)
-                .then(response => {
-                    if (!response.ok) {
-                        // If response is not ok (e.g., 404, 500), throw an error to be caught by .catch()
-                        throw new Error(`HTTP error! status: ${response.status}, URL: ${response.url}`);
+            // Ask for no more points than the chart can show (about one per 2 pixels);
+            // the server downsamples longer series so the payload doesn't grow with product age.
+            const maxPoints = Math.max(50, Math.floor((chartCanvas.clientWidth || 600) / 2));
+            const pricesUrl = `/api/product/${productId}/prices`;
+            // The series is cached in localStorage; repeat visits and polling only fetch points
+            // newer than the cached cursor (the API's 'since' mode).
+            const cacheKey = `pricepulse:prices:${productId}`;
+            const pollIntervalMs = 60000;
+            let series = null; // {limit, cursor, points: [{timestamp, price}]}
+            let chart = null;
+
+            function loadCache() {
+                try {
+                    const cached = JSON.parse(localStorage.getItem(cacheKey));
+                    // A series downsampled for a different chart width is refetched
+                    if (cached && cached.limit === maxPoints && Array.isArray(cached.points) && cached.cursor) {
+                        return cached;
                     }
-                    return response.json(); // Attempt to parse JSON
-                })
-                .then(data => {
-                    if (data && Array.isArray(data) && data.length > 0) {
-                        const labels = data.map(p => new Date(p.timestamp).toLocaleString());
-                        const prices = data.map(p => p.price);
-
-                        new Chart(chartCanvas, {
-                            type: 'line', // Or 'bar'
-                            data: {
-                                labels: labels,
-                                datasets: [{
-                                    label: 'Price (₹)',
-                                    data: prices,
-                                    borderColor: 'rgb(75, 192, 192)',
-                                    tension: 0.1, // Makes the line a bit curved
-                                    fill: false
-                                }]
-                            },
-                            options: {
-                                responsive: true,
-                                maintainAspectRatio: false, // Allows chart to fill container height/width better
-                                scales: {
-                                    y: {
-                                        beginAtZero: false, // Price charts usually don't start at 0
-                                        ticks: {
-                                            // Format Y-axis ticks as currency
-                                            callback: function(value, index, values) {
-                                                return '₹' + value.toFixed(2); // Ensure two decimal places
-                                            }
-                                        }
-                                    },
-                                    x: {
-                                        // Optional: configure x-axis if needed, e.g., for time series
-                                    }
-                                },
-                                plugins: {
-                                    legend: {
-                                        display: true // Show legend
-                                    },
-                                    tooltip: {
-                                        enabled: true // Show tooltips on hover
+                } catch (e) {
+                    // Unavailable storage or a corrupt entry: just fetch the full series
+                }
+                return null;
+            }
+
+            function saveCache() {
+                try {
+                    localStorage.setItem(cacheKey, JSON.stringify(series));
+                } catch (e) {
+                    // Storage full or disabled; the page keeps working without the cache
+                }
+            }
+
+            function showMessage(text, color) {
+                const ctx = chartCanvas.getContext('2d');
+                ctx.clearRect(0, 0, chartCanvas.width, chartCanvas.height); // Clear canvas
+                ctx.font = "16px Arial";
+                ctx.fillStyle = color;
+                ctx.textAlign = 'center';
+                ctx.fillText(text, chartCanvas.width / 2, chartCanvas.height / 2);
+            }
+
+            function renderChart() {
+                if (!series || series.points.length === 0) {
+                    console.log("No price data (or empty data array) received to draw the chart for product ID:", productId);
+                    showMessage('No price data available for this product yet.', "#888");
+                    return;
+                }
+                const labels = series.points.map(p => new Date(p.timestamp).toLocaleString());
+                const prices = series.points.map(p => p.price);
+
+                if (chart) {
+                    // Update in place when new points arrive
+                    chart.data.labels = labels;
+                    chart.data.datasets[0].data = prices;
+                    chart.update();
+                    return;
+                }
+                chart = new Chart(chartCanvas, {
+                    type: 'line', // Or 'bar'
+                    data: {
+                        labels: labels,
+                        datasets: [{
+                            label: 'Price (₹)',
+                            data: prices,
+                            borderColor: 'rgb(75, 192, 192)',
+                            tension: 0.1, // Makes the line a bit curved
+                            fill: false
+                        }]
+                    },
+                    options: {
+                        responsive: true,
+                        maintainAspectRatio: false, // Allows chart to fill container height/width better
+                        scales: {
+                            y: {
+                                beginAtZero: false, // Price charts usually don't start at 0
+                                ticks: {
+                                    // Format Y-axis ticks as currency
+                                    callback: function(value, index, values) {
+                                        return '₹' + value.toFixed(2); // Ensure two decimal places
                                     }
                                 }
+                            },
+                            x: {
+                                // Optional: configure x-axis if needed, e.g., for time series
                             }
-                        });
-                    } else {
-                        console.log("No price data (or empty data array) received to draw the chart for product ID:", productId);
-                        const ctx = chartCanvas.getContext('2d');
-                        ctx.clearRect(0, 0, chartCanvas.width, chartCanvas.height); // Clear canvas
-                        ctx.font = "16px Arial";
-                        ctx.fillStyle = "#888";
-                        ctx.textAlign = 'center';
-                        ctx.fillText('No price data available for this product yet.', chartCanvas.width / 2, chartCanvas.height / 2);
+                        },
+                        plugins: {
+                            legend: {
+                                display: true // Show legend
+                            },
+                            tooltip: {
+                                enabled: true // Show tooltips on hover
+                            }
+                        }
                     }
-                })
-                .catch(error => {
-                    console.error('Error fetching or processing price data for chart:', error);
-                    if (chartCanvas) { // Check again in case error happened before canvas was confirmed
-                        const ctx = chartCanvas.getContext('2d');
-                        ctx.clearRect(0, 0, chartCanvas.width, chartCanvas.height); // Clear canvas
-                        ctx.font = "16px Arial";
-                        ctx.fillStyle = "red";
-                        ctx.textAlign = 'center';
-                        ctx.fillText('Could not load price data for the chart.', chartCanvas.width / 2, chartCanvas.height / 2);
+                });
+            }
+
+            // The API's columnar format, {"t": [epoch seconds], "p": [prices]}, is much smaller than a list
+            // of point objects; it is turned back into points (timestamp in ms) for the chart and cache.
+            function toPoints(data) {
+                const times = (data && data.t) || [];
+                const prices = (data && data.p) || [];
+                return times.map((seconds, i) => ({timestamp: seconds * 1000, price: prices[i]}));
+            }
+
+            function fetchPrices(query) {
+                return fetch(`${pricesUrl}?format=columns&${query}`).then(response => {
+                    if (!response.ok) {
+                        // If response is not ok (e.g., 404, 410, 500), throw an error to be caught by .catch()
+                        const error = new Error(`HTTP error! status: ${response.status}, URL: ${response.url}`);
+                        error.status = response.status;
+                        throw error;
+                    }
+                    return response.json().then(data => ({points: toPoints(data), cursor: response.headers.get('X-Price-Cursor')}));
+                });
+            }
+
+            function fetchFullSeries() {
+                return fetchPrices(`limit=${maxPoints}`).then(result => {
+                    series = {
+                        limit: maxPoints,
+                        cursor: result.cursor,
+                        points: result.points
+                    };
+                    if (series.cursor) {
+                        saveCache();
+                    }
+                    renderChart();
+                });
+            }
+
+            function fetchDelta() {
+                return fetchPrices(`since=${encodeURIComponent(series.cursor)}`).then(result => {
+                    if (result.points.length > 0) {
+                        series.points = series.points.concat(result.points);
+                        renderChart();
                     }
+                    series.cursor = result.cursor || series.cursor;
+                    // Once the deltas have doubled the series, let the server downsample it again
+                    if (series.points.length > 2 * maxPoints) {
+                        return fetchFullSeries();
+                    }
+                    saveCache();
+                }).catch(error => {
+                    if (error.status === 410) {
+                        return fetchFullSeries(); // Cursor older than the server keeps raw history for
+                    }
+                    throw error;
                 });
+            }
+
+            function refresh() {
+                return (series && series.cursor ? fetchDelta() : fetchFullSeries())
+                    .catch(error => {
+                        console.error('Error fetching or processing price data for chart:', error);
+                        if (!chart) {
+                            showMessage('Could not load price data for the chart.', "red");
+                        }
+                    });
+            }
+
+            series = loadCache();
+            if (series) {
+                renderChart(); // Draw the cached series right away, then catch up
+            }
+            refresh();
+            setInterval(function() {
+                if (document.visibilityState === 'visible') {
+                    refresh();
+                }
+            }, pollIntervalMs);
         } else {
             // This case should not happen if product_detail.html includes the canvas
             // console.log("Chart canvas ('priceHistoryChart') not found on this page, though productId was available.");
@@ -93,4 +213,4 @@ document.addEventListener('DOMContentLoaded', function() {
     // for example, event listeners for other buttons or dynamic behaviors
     // not specific to the product chart.
 
-});
\ No newline at end of file
+});
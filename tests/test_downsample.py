@@ -0,0 +1,31 @@
+# tests/test_downsample.py
+# The NumPy and pure-Python LTTB paths of downsample.py must pick the same points.
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import downsample
+from downsample import _lttb_bucket_bounds, _lttb_indices_python, _lttb_indices_numpy
+
+
+def test_lttb_buckets_cover_every_middle_point():
+    for n in range(4, 120):
+        for threshold in range(3, n):
+            bounds = _lttb_bucket_bounds(n, threshold)
+            assert bounds[0][0] == 1 and bounds[-1][1] == n - 1
+            assert all(start < end for start, end in bounds)
+            assert all(bounds[i][1] == bounds[i + 1][0] for i in range(len(bounds) - 1))
+
+
+@pytest.mark.skipif(downsample.np is None, reason="NumPy is not installed")
+def test_lttb_numpy_matches_python():
+    rng = random.Random(0)
+    for n in (4, 10, 59, 101, 500):
+        xs = [float(i * 60 + rng.randint(0, 30)) for i in range(n)]
+        ys = [round(rng.uniform(100, 200), 2) for _ in range(n)]
+        for threshold in range(3, n):
+            assert _lttb_indices_numpy(xs, ys, threshold) == _lttb_indices_python(xs, ys, threshold), (n, threshold)
@@ -0,0 +1,32 @@
+# tests/test_query_plans.py
+# Runs the hot-query plan check (query_plans.py) against a fresh, fully migrated SQLite database.
+import os
+import sys
+
+import pytest
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import db
+from migrations import prepare_database
+from query_plans import check_query_plans
+
+
+@pytest.fixture
+def app_context(tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'query_plans.db'}"
+    db.init_app(app)
+    with app.app_context():
+        prepare_database()
+        yield
+        db.session.remove()
+        db.engine.dispose()
+
+
+def test_hot_queries_use_indexes(app_context, capsys):
+    ok = check_query_plans()
+    output = capsys.readouterr().out
+    assert "[FULL SCAN]" not in output, output
+    assert ok
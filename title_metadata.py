@@ -0,0 +1,174 @@
+# title_metadata.py
+# Local, rule-based alternative to llm_helper for the common case: most Amazon titles follow
+# "<Brand> <Model> (<specs>) - <Colour>", e.g. "Apple iPhone 15 (128 GB) - Pink". The title is split into
+# brand (from a dictionary of known brands), model and specifications (regexes for storage, RAM, screen
+# size, processor, capacity, pack size and colour), and search queries are built from them. The result has
+# the same structure as extract_metadata_and_generate_queries(), plus a confidence between 0 and 1:
+# comparison.py only asks the LLM when the confidence is below METADATA_HEURISTIC_MIN_CONFIDENCE. Titles the
+# parser can't read unambiguously (no real model name, conflicting specifications) stay below 0.7.
+import re
+
+# Lower-cased brand -> display name. Multi-word brands are matched before single words.
+KNOWN_BRANDS = {brand.lower(): brand for brand in (
+    "Apple", "Samsung", "OnePlus", "Xiaomi", "Redmi", "Mi", "Realme", "Oppo", "Vivo", "iQOO", "Motorola",
+    "Nokia", "Google", "Nothing", "Poco", "Tecno", "Infinix", "Lava", "Honor", "Huawei",
+    "Sony", "LG", "Panasonic", "Philips", "Toshiba", "TCL", "Hisense", "Acer", "Asus", "Dell", "HP",
+    "Lenovo", "MSI", "Microsoft", "Logitech", "Canon", "Nikon", "Fujifilm", "GoPro", "Amazon",
+    "boAt", "JBL", "Bose", "Sennheiser", "Marshall", "Noise", "Boult", "pTron", "Mivi", "Zebronics",
+    "Portronics", "Ambrane", "Fire-Boltt", "Fastrack", "Titan", "Casio", "Fossil", "Timex", "Garmin",
+    "Bajaj", "Prestige", "Pigeon", "Havells", "Crompton", "Usha", "Orient", "Morphy Richards", "Kent",
+    "Eureka Forbes", "Bosch", "Whirlpool", "Godrej", "Voltas", "Haier", "IFB", "Milton", "Cello",
+    "Borosil", "Nike", "Adidas", "Puma", "Reebok", "Skechers", "Bata", "Campus", "Sparx", "Red Tape",
+    "Woodland", "Levi's", "Allen Solly", "Van Heusen", "Peter England", "U.S. Polo Assn.", "Jockey",
+    "Wildcraft", "Skybags", "American Tourister", "Safari", "VIP", "Lavie", "Nivea", "Himalaya",
+    "Mamaearth", "Lakme", "Maybelline", "L'Oreal", "Dettol", "Colgate", "Tata", "Saffola", "Fortune",
+)}
+_MAX_BRAND_WORDS = max(len(brand.split()) for brand in KNOWN_BRANDS)
+
+COLOURS = (
+    "black", "white", "silver", "grey", "gray", "gold", "rose gold", "blue", "navy blue", "sky blue",
+    "red", "green", "yellow", "pink", "purple", "violet", "orange", "brown", "beige", "cream", "maroon",
+    "teal", "graphite", "midnight", "starlight", "titanium", "lavender", "mint", "olive", "peach", "multicolor",
+    "multicolour", "space black", "space grey", "space gray",
+)
+_COLOUR_PATTERN = re.compile(r"\b(" + "|".join(sorted((re.escape(c) for c in COLOURS), key=len, reverse=True)) + r")\b",
+                             re.IGNORECASE)
+
+# A number that isn't the tail of a longer one (the "83" in "1.83").
+_NUM = r"(?<![\d.])"
+
+# (specification name, pattern); the first group is the value. Storage is picked by _storage().
+SPEC_PATTERNS = (
+    ("RAM", re.compile(_NUM + r"(\d{1,2}\s?GB)\s?RAM\b", re.IGNORECASE)),
+    ("Screen Size", re.compile(_NUM + r"(\d{1,3}(?:\.\d{1,2})?(?:\s?|-)(?:inch(?:es)?|\"|cm))(?=\W|$)", re.IGNORECASE)),
+    ("Processor", re.compile(r"\b((?:M\d|A\d{2}(?: Bionic)?|Snapdragon \d+(?: Gen \d)?|Dimensity \d+|Helio \w+|"
+                             r"Core i\d|Ryzen \d)(?: (?:Pro|Max|Ultra|Plus))?)(?:\s?chip)?\b", re.IGNORECASE)),
+    ("Capacity", re.compile(_NUM + r"(\d+(?:\.\d+)?\s?(?:mAh|W|Watts?|L|Litres?|ml|kg|gm|grams?|Ton))\b", re.IGNORECASE)),
+    ("Pack", re.compile(r"\b(Pack of \d+|Set of \d+)\b", re.IGNORECASE)),
+)
+# Storage sizes, group 2 is set when the title labels it ("256GB Storage") rather than leaving it bare
+# ("12GB" next to "256GB" is often the RAM).
+_STORAGE_PATTERN = re.compile(_NUM + r"(\d{2,4}\s?GB|\d\s?TB)\b(?!\s?RAM)(?:\s?(ROM|Storage|SSD|HDD))?", re.IGNORECASE)
+_NUMBER_ONLY = re.compile(r"^[\d.,-]+$")
+# Confidence of a parse that found something but can't be trusted without the LLM.
+_UNCERTAIN_CONFIDENCE = 0.5
+
+# Anything after one of these ends the model part of the title.
+_MODEL_END = re.compile(r"\s(?:-|\||–|with|for)\s|[(,\[|]", re.IGNORECASE)
+_WORD = re.compile(r"[\w.'+&-]+")
+_MAX_MODEL_WORDS = 5
+
+
+def _find_brand(words):
+    # Returns (display name, number of words, known brand?)
+    for length in range(min(_MAX_BRAND_WORDS, len(words)), 0, -1):
+        brand = KNOWN_BRANDS.get(" ".join(words[:length]).lower())
+        if brand:
+            return brand, length, True
+    if words and words[0][:1].isupper():
+        return words[0], 1, False
+    return None, 0, False
+
+
+def _spec_value(raw):
+    # "12GB" -> "12 GB", "16-inch" -> "16 inch", '1.83"' -> "1.83 inch"
+    return re.sub(r"(\d)[\s-]?([A-Za-z\"])", r"\1 \2", raw).replace('"', "inch")
+
+
+def _gigabytes(value):
+    number = float(re.match(r"[\d.]+", value).group())
+    return number * 1024 if value.upper().endswith("TB") else number
+
+
+def _storage(title):
+    # (storage match, smaller bare match or None, conflict?): a labelled size wins and a smaller bare
+    # one next to it ("12GB, 256GB Storage") is the RAM; otherwise the largest bare size is taken, and
+    # several different bare sizes are a conflict.
+    matches = list(_STORAGE_PATTERN.finditer(title))
+    if not matches:
+        return None, None, False
+    size = lambda match: _gigabytes(_spec_value(match.group(1)))
+    labelled = [match for match in matches if match.group(2)]
+    if labelled:
+        smaller = [match for match in matches if not match.group(2) and size(match) < size(labelled[0])]
+        return labelled[0], (smaller[0] if smaller else None), False
+    return max(matches, key=size), None, len({size(match) for match in matches}) > 1
+
+
+def _specifications(title):
+    # (specs, spans of the title they were read from, conflict?)
+    specs, spans, seen = [], [], set()
+    storage, bare_ram, conflict = _storage(title)
+    matches = [(spec_name, pattern.search(title)) for spec_name, pattern in SPEC_PATTERNS]
+    if not matches[0][1]:
+        matches[0] = ("RAM", bare_ram)
+    matches.insert(1, ("Storage", storage))
+    for spec_name, match in matches:
+        if match and match.group(1).lower() not in seen:
+            seen.add(match.group(1).lower())
+            value = match.group(1) if spec_name == "Processor" else _spec_value(match.group(1))
+            specs.append((spec_name, value))
+            spans.append(match.span())
+    ram = next((value for name, value in specs if name == "RAM"), None)
+    storage_value = next((value for name, value in specs if name == "Storage"), None)
+    if ram and storage_value and _gigabytes(ram) >= _gigabytes(storage_value):
+        conflict = True
+    colour = _COLOUR_PATTERN.search(title)
+    if colour:
+        specs.append(("Colour", colour.group(1).title()))
+        spans.append(colour.span())
+    return specs, spans, conflict
+
+
+def extract_title_metadata(product_name):
+    """(llm_helper-style {"metadata", "search_queries"} dict, confidence 0..1) for an Amazon product title."""
+    title = " ".join((product_name or "").split())
+    specs, spans, conflict = _specifications(title)
+    # The model is read from the title without the specifications, so "1.83\"" or "80 cm" isn't taken for one.
+    without_specs = title
+    for start, end in sorted(spans, reverse=True):
+        without_specs = without_specs[:start] + " " + without_specs[end:]
+    words = _WORD.findall(_MODEL_END.split(without_specs, maxsplit=1)[0])
+    brand, brand_words, known_brand = _find_brand(words)
+    model = " ".join(words[brand_words:][:_MAX_MODEL_WORDS])
+
+    confidence = 0.4 if known_brand else (0.15 if brand else 0.0)
+    if model and not all(_NUMBER_ONLY.match(word) for word in model.split()): # Bare numbers aren't a model name
+        confidence += 0.3
+        if any(char.isdigit() for char in model): # Model numbers/generations identify a product best
+            confidence += 0.1
+    if specs:
+        confidence += 0.2
+    confidence = round(min(confidence, 1.0), 2)
+    if conflict:
+        confidence = min(confidence, _UNCERTAIN_CONFIDENCE)
+
+    base_query = " ".join(part for part in (brand, model) if part)
+    spec_query = " ".join(value for name, value in specs if name in ("Storage", "RAM", "Screen Size", "Processor", "Capacity")
+                          and value.lower() not in base_query.lower())
+    colour = next((value for name, value in specs if name == "Colour"), "")
+    llm_data = {
+        "metadata": {
+            "brand": brand or "",
+            "model": model,
+            "specifications": [f"{name}: {value}" for name, value in specs],
+        },
+        "search_queries": {
+            "Flipkart": " ".join(part for part in (base_query, spec_query, colour) if part),
+            "Meesho": " ".join(part for part in (base_query, spec_query) if part),
+        } if base_query else {},
+    }
+    return llm_data, confidence
+
+
+if __name__ == '__main__':
+    for test_title in ("Apple iPhone 15 (128 GB) - Pink",
+                       "Samsung Galaxy S23 5G (Phantom Black, 8GB RAM, 256GB Storage)",
+                       "boAt Airdopes 141 Bluetooth TWS Earbuds with 42H Playtime, Bold Black",
+                       "Prestige Iris 750 Watt Mixer Grinder with 3 Stainless Steel Jars",
+                       "Cotton Kurta for Women, Pack of 2",
+                       "Samsung Galaxy S23 Ultra 5G (Green, 12GB, 256GB Storage)",
+                       "Fire-Boltt Ninja Call Pro Plus 1.83\"",
+                       "Mi 80 cm (32 inches) HD Ready Smart Android LED TV",
+                       "Apple 2023 MacBook Pro (16-inch, M3 Max chip) - Space Black"):
+        print(test_title, "->", extract_title_metadata(test_title))